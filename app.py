@@ -1,12 +1,12 @@
 from logs import logging_setup
 
+import asyncio
 import logging
 from aiogram import executor
 
 from config.bot_config import setup_bot, dp
 from db.dbworker import create_db
-from db.google_sheets import google_sheets
-from src.bot.handlers import on_startup
+from src.bot.handlers import on_startup, on_shutdown
 
 
 logger = logging.getLogger(__name__)
@@ -16,25 +16,24 @@ if __name__ == "__main__":
     Основной модуль для запуска Telegram-бота.
 
     Выполняет следующие задачи:
-    1. Синхронизация с Google Sheets.
-    2. Создание базы данных.
-    3. Создание пользовательских хэшей.
-    4. Настройка и запуск бота.
+    1. Создание базы данных.
+    2. Создание пользовательских хэшей.
+    3. Настройка и запуск бота; синхронизация с Google Sheets выполняется
+       в фоне после запуска (см. `db.sheets_sync`).
 
     Исключения обрабатываются с логированием ошибок.
     """
     try:
-        google_sheets()
-        logger.info("Google Sheets синхронизация запущена")
-
-        create_db()
+        asyncio.get_event_loop().run_until_complete(create_db())
         logger.info("База данных создана")
 
         setup_bot()
         logger.info("Бот настроен и готов к работе")
 
         logger.info("Бот запущен и ожидает сообщения")
-        executor.start_polling(dp, on_startup=on_startup)
+        executor.start_polling(
+            dp, on_startup=on_startup, on_shutdown=on_shutdown
+        )
 
     except ConnectionError as error:
         logger.error(
@@ -0,0 +1,144 @@
+"""
+Нагрузочный бенчмарк слоя доступа к PostgreSQL.
+
+Имитирует одновременную работу N пользователей, каждый из которых отправляет
+несколько сообщений подряд. Для каждого сообщения выполняется та же
+последовательность обращений к базе, что и в обработчике текстовых сообщений,
+и измеряется задержка. Запуск против локальной базы из `.env`:
+
+    python -m benchmarks.db_load --users 200 --messages 5
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+from db.database_connection import (
+    DB_POOL_MAX_SIZE,
+    close_db_pool,
+    db_connection,
+)
+from db.dbworker import (
+    create_db,
+    create_user,
+    get_user_history,
+    get_user_limit,
+    update_user_limit,
+)
+
+BENCHMARK_USER_ID_OFFSET: int = 9_000_000_000
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+    Возвращает перцентиль выборки методом ближайшего ранга.
+
+    Args:
+        values (List[float]): Значения.
+        percent (float): Перцентиль от 0 до 100.
+
+    Returns:
+        float: Значение перцентиля.
+    """
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def simulate_message(user_id: int) -> float:
+    """
+    Выполняет обращения к базе, которые делает обработчик одного текстового сообщения.
+
+    Args:
+        user_id (int): Идентификатор тестового пользователя.
+
+    Returns:
+        float: Задержка обработки в миллисекундах.
+    """
+    started = time.perf_counter()
+
+    await get_user_history(user_id)
+    limit = await get_user_limit(user_id)
+    await get_user_history(user_id)
+    for _ in range(3):
+        limit = await get_user_limit(user_id)
+        await update_user_limit(user_id, limit - 100)
+
+    async with db_connection() as connection:
+        await connection.execute(
+            "INSERT INTO user_history (user_id, question, response) VALUES ($1, $2, $3)",
+            user_id,
+            "benchmark question",
+            "benchmark response",
+        )
+
+    return (time.perf_counter() - started) * 1000
+
+
+async def simulate_user(user_id: int, messages: int) -> List[float]:
+    """
+    Отправляет несколько сообщений от имени одного пользователя подряд.
+
+    Args:
+        user_id (int): Идентификатор тестового пользователя.
+        messages (int): Количество сообщений.
+
+    Returns:
+        List[float]: Задержки каждого сообщения в миллисекундах.
+    """
+    return [await simulate_message(user_id) for _ in range(messages)]
+
+
+async def cleanup(user_ids: List[int]) -> None:
+    """
+    Удаляет тестовых пользователей и их данные.
+
+    Args:
+        user_ids (List[int]): Идентификаторы тестовых пользователей.
+    """
+    async with db_connection() as connection, connection.transaction():
+        for table in ("user_history", "user_limit", "reminder", "users"):
+            await connection.execute(
+                f"DELETE FROM {table} WHERE user_id = ANY($1::bigint[])",
+                user_ids,
+            )
+
+
+async def main(users: int, messages: int) -> None:
+    await create_db()
+
+    user_ids = [BENCHMARK_USER_ID_OFFSET + i for i in range(users)]
+    await asyncio.gather(
+        *[create_user(user_id, f"bench_{user_id}") for user_id in user_ids]
+    )
+
+    try:
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *[simulate_user(user_id, messages) for user_id in user_ids]
+        )
+        elapsed = time.perf_counter() - started
+    finally:
+        await cleanup(user_ids)
+        await close_db_pool()
+
+    latencies = [latency for user_result in results for latency in user_result]
+    print(f"Пользователей: {users}, сообщений на пользователя: {messages}")
+    print(f"Размер пула: {DB_POOL_MAX_SIZE}")
+    print(f"Всего сообщений: {len(latencies)} за {elapsed:.2f} с")
+    print(f"p50: {percentile(latencies, 50):.1f} мс")
+    print(f"p99: {percentile(latencies, 99):.1f} мс")
+    print(f"Среднее: {statistics.mean(latencies):.1f} мс")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Нагрузочный бенчмарк доступа к PostgreSQL"
+    )
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=5)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.users, args.messages))
@@ -0,0 +1,178 @@
+"""
+Бенчмарк типов FAISS индекса базы знаний: recall@k относительно flat,
+задержка запроса и объём памяти на синтетических векторах.
+
+Векторы генерируются вокруг случайных центров и нормируются, как эмбеддинги
+OpenAI, запросы берутся из того же распределения, но не входят в базу.
+Индексы создаются тем же кодом, что и в `create_vectorstore.py`
+(`index_types.create_index`), а параметры поиска задаются так же, как при
+загрузке в боте:
+
+    python -m benchmarks.index_types --count 200000
+    python -m benchmarks.index_types --types flat ivfpq --nlist 4096 --nprobe 32
+"""
+
+import argparse
+import statistics
+import time
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+from src.generated_answer.index_types import (
+    DEFAULT_HNSW_M,
+    DEFAULT_NLIST,
+    DEFAULT_PQ_M,
+    INDEX_TYPES,
+    create_index,
+    set_search_params,
+)
+
+
+def synthetic_vectors(
+    count: int, dimension: int, clusters: int, seed: int
+) -> np.ndarray:
+    """
+    Генерирует нормированные векторы, сгруппированные вокруг случайных центров.
+
+    Args:
+        count (int): Количество векторов.
+        dimension (int): Размерность.
+        clusters (int): Количество центров.
+        seed (int): Зерно генератора.
+
+    Returns:
+        np.ndarray: Векторы float32 формы (count, dimension).
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension), dtype=np.float32)
+    assignment = rng.integers(0, clusters, size=count)
+    vectors = centers[assignment] + 0.6 * rng.standard_normal(
+        (count, dimension), dtype=np.float32
+    )
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """
+    Доля точных k ближайших соседей, найденных индексом.
+
+    Args:
+        found (np.ndarray): Найденные номера формы (queries, k).
+        truth (np.ndarray): Точные номера из flat индекса формы (queries, k).
+
+    Returns:
+        float: recall@k от 0 до 1.
+    """
+    hits = sum(
+        len(set(row_found) & set(row_truth))
+        for row_found, row_truth in zip(found.tolist(), truth.tolist())
+    )
+    return hits / truth.size
+
+
+def measure(
+    index_type: str,
+    base: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    args: argparse.Namespace,
+) -> Dict[str, object]:
+    """
+    Строит индекс и замеряет время сборки, размер, задержку и результаты поиска.
+
+    Args:
+        index_type (str): Тип индекса.
+        base (np.ndarray): Векторы базы.
+        queries (np.ndarray): Векторы запросов.
+        k (int): Число соседей.
+        args (argparse.Namespace): Параметры индексов и поиска.
+
+    Returns:
+        Dict[str, object]: Результаты замера.
+    """
+    started = time.perf_counter()
+    index = create_index(index_type, base, args.nlist, args.pq_m, args.hnsw_m)
+    index.add(base)
+    build_seconds = time.perf_counter() - started
+    set_search_params(index, args.nprobe, args.ef_search)
+
+    latencies: List[float] = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found[i] = ids[0]
+
+    latencies.sort()
+    return {
+        "type": index_type,
+        "build_seconds": build_seconds,
+        "bytes": faiss.serialize_index(index).nbytes,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "found": found,
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    faiss.omp_set_num_threads(args.threads)
+    vectors = synthetic_vectors(
+        args.count + args.queries, args.dimension, args.clusters, args.seed
+    )
+    base, queries = vectors[: args.count], vectors[args.count:]
+
+    types = ["flat"] + [name for name in args.types if name != "flat"]
+    results = [measure(name, base, queries, args.k, args) for name in types]
+    truth = results[0]["found"]
+
+    print(
+        f"Векторов: {args.count}, размерность: {args.dimension}, "
+        f"запросов: {args.queries}, k: {args.k}, потоков: {args.threads}"
+    )
+    print(
+        f"nlist: {args.nlist}, pq_m: {args.pq_m}, hnsw_m: {args.hnsw_m}, "
+        f"nprobe: {args.nprobe}, efSearch: {args.ef_search}"
+    )
+    print(
+        f"{'тип':<8}{'recall@k':>10}{'p50, мс':>10}{'p95, мс':>10}"
+        f"{'память, МБ':>12}{'байт/вектор':>13}{'сборка, с':>11}"
+    )
+    for result in results:
+        print(
+            f"{result['type']:<8}"
+            f"{recall_at_k(result['found'], truth):>10.3f}"
+            f"{result['p50_ms']:>10.2f}"
+            f"{result['p95_ms']:>10.2f}"
+            f"{result['bytes'] / 2 ** 20:>12.1f}"
+            f"{result['bytes'] / args.count:>13.0f}"
+            f"{result['build_seconds']:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="recall@k, задержка и память типов FAISS индекса"
+    )
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument(
+        "--types", nargs="+", choices=INDEX_TYPES, default=INDEX_TYPES
+    )
+    parser.add_argument("--nlist", type=int, default=DEFAULT_NLIST)
+    parser.add_argument("--pq-m", type=int, default=DEFAULT_PQ_M)
+    parser.add_argument("--hnsw-m", type=int, default=DEFAULT_HNSW_M)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument(
+        "--threads", type=int, default=1, help="Потоки OpenMP FAISS"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+
+    main(parser.parse_args())
@@ -0,0 +1,120 @@
+"""
+Проверка атомарности резервирования и списания лимита токенов.
+
+Запускает N одновременных запросов одного пользователя, у которого
+остатка хватает не на все: каждый запрос резервирует токены через
+`TokenLedger.reserve`, расходует их, пока остаток не исчерпан, и фиксирует
+расход. Проверяется, что лимит не ушёл в минус и что ни одно списание не
+потеряно: итоговый остаток равен начальному за вычетом всего расхода, а
+если параллельные запросы вместе вышли за остаток (расход сверх резерва),
+лимит равен нулю. Запуск против локальной базы из `.env`:
+
+    python -m benchmarks.ledger_concurrency --requests 50 --tokens 1000 --balance 20000
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List
+
+from db.database_connection import close_db_pool, db_connection
+from db.dbworker import (
+    create_db,
+    create_user,
+    get_user_limit,
+    update_user_limit,
+)
+from src.services.token_ledger import TokenLedger
+
+BENCHMARK_USER_ID: int = 9_100_000_000
+
+
+async def simulate_request(user_id: int, tokens: int, reserve: int) -> float:
+    """
+    Имитирует обработку одного запроса: резерв, три этапа расходуют токены, затем расход фиксируется.
+
+    Как и этапы бота, каждый этап выполняется, только если остаток не
+    исчерпан, и тратит не больше него.
+
+    Args:
+        user_id (int): Идентификатор тестового пользователя.
+        tokens (int): Расход токенов запроса без ограничения лимитом.
+        reserve (int): Размер резерва.
+
+    Returns:
+        float: Фактический расход запроса.
+    """
+    ledger = TokenLedger(user_id, 0)
+    await ledger.reserve(reserve)
+    stage_tokens = tokens // 3
+    for stage, amount in (
+        ("context_completion", stage_tokens),
+        ("is_crypto_related", stage_tokens),
+        ("run_agent", tokens - 2 * stage_tokens),
+    ):
+        if ledger.exhausted:
+            break
+        ledger.charge(min(amount, ledger.available), stage)
+    await ledger.commit()
+    return ledger.spent
+
+
+async def cleanup(user_id: int) -> None:
+    """
+    Удаляет тестового пользователя и его данные.
+
+    Args:
+        user_id (int): Идентификатор тестового пользователя.
+    """
+    async with db_connection() as connection, connection.transaction():
+        for table in ("user_history", "user_limit", "reminder", "users"):
+            await connection.execute(
+                f"DELETE FROM {table} WHERE user_id = $1", user_id
+            )
+
+
+async def main(requests: int, tokens: int, reserve: int, balance: int) -> None:
+    await create_db()
+    await cleanup(BENCHMARK_USER_ID)
+    await create_user(BENCHMARK_USER_ID, "bench_ledger")
+
+    try:
+        await update_user_limit(BENCHMARK_USER_ID, balance)
+        started = time.perf_counter()
+        spent: List[float] = await asyncio.gather(
+            *[
+                simulate_request(BENCHMARK_USER_ID, tokens, reserve)
+                for _ in range(requests)
+            ]
+        )
+        elapsed = time.perf_counter() - started
+        final_balance = await get_user_limit(BENCHMARK_USER_ID)
+    finally:
+        await cleanup(BENCHMARK_USER_ID)
+        await close_db_pool()
+
+    total_spent = sum(spent)
+    served = sum(1 for amount in spent if amount)
+    print(
+        f"Одновременных запросов: {requests}, расход на запрос: {tokens}, резерв: {reserve}"
+    )
+    print(f"Начальный лимит: {balance}, обслужено запросов: {served}")
+    expected = max(balance - total_spent, 0)
+    print(f"Итоговый лимит: {final_balance}, ожидаемый: {expected}")
+    print(f"Время: {elapsed * 1000:.1f} мс")
+    assert final_balance >= 0, "Лимит ушёл в минус"
+    assert final_balance == expected, "Потеряны списания лимита"
+    print("Все списания учтены, лимит не ушёл в минус.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Проверка атомарности резервирования и списания лимита токенов"
+    )
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--tokens", type=int, default=1000)
+    parser.add_argument("--reserve", type=int, default=1500)
+    parser.add_argument("--balance", type=int, default=20000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests, args.tokens, args.reserve, args.balance))
@@ -0,0 +1,84 @@
+"""
+Бенчмарк отзывчивости цикла событий во время генераций.
+
+Фоновая корутина каждые `--tick` мс засыпает и замеряет, на сколько позже
+запланированного она проснулась (loop lag). Одновременно запускается
+`--concurrency` генераций через общий клиент `src.services.llm_client`.
+Пока модель отвечает, задержка цикла должна оставаться ниже `--max-lag`
+мс; иначе скрипт завершается с кодом 1.
+
+С флагом `--blocking` генерации выполняются синхронным `invoke` прямо в
+корутинах, как было до перехода на асинхронный клиент, — для сравнения.
+
+    python -m benchmarks.loop_lag
+    python -m benchmarks.loop_lag --blocking --concurrency 5
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from typing import List
+
+from src.services.llm_client import ainvoke, chat_model, close_llm_client
+
+PROMPT: str = "Explain in three sentences what a blockchain oracle is."
+
+
+async def measure_lag(tick: float, lags: List[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(tick)
+        lags.append((time.perf_counter() - started - tick) * 1000)
+
+
+async def generate(model: str, blocking: bool) -> float:
+    llm = chat_model(model, max_tokens=200)
+    started = time.perf_counter()
+    if blocking:
+        llm.invoke(PROMPT)
+    else:
+        await ainvoke(llm, PROMPT)
+    return time.perf_counter() - started
+
+
+async def main(args: argparse.Namespace) -> int:
+    lags: List[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(measure_lag(args.tick / 1000, lags, stop))
+
+    started = time.perf_counter()
+    durations = await asyncio.gather(
+        *[generate(args.model, args.blocking) for _ in range(args.concurrency)]
+    )
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    await close_llm_client()
+
+    lags.sort()
+    max_lag = lags[-1] if lags else 0.0
+    print(f"Режим: {'синхронный invoke' if args.blocking else 'ainvoke'}")
+    print(f"Генераций: {args.concurrency}, модель: {args.model}")
+    print(f"Общее время: {elapsed:.1f} с")
+    print(f"Время генерации (медиана): {statistics.median(durations):.1f} с")
+    print(f"Замеров задержки цикла: {len(lags)}")
+    if lags:
+        print(f"Задержка цикла p50: {statistics.median(lags):.1f} мс")
+        print(f"Задержка цикла p99: {lags[int(len(lags) * 0.99) - 1]:.1f} мс")
+    print(f"Задержка цикла max: {max_lag:.1f} мс (порог {args.max_lag} мс)")
+    return 0 if max_lag < args.max_lag else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Задержка цикла событий во время параллельных генераций"
+    )
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--tick", type=float, default=10, help="Период замера, мс")
+    parser.add_argument("--max-lag", type=float, default=50, help="Порог, мс")
+    parser.add_argument("--blocking", action="store_true")
+
+    sys.exit(asyncio.run(main(parser.parse_args())))
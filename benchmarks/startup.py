@@ -0,0 +1,91 @@
+"""
+Бенчмарк запуска: время импорта модулей генерации ответа и потребление памяти.
+
+Каждый замер выполняется в отдельном процессе, чтобы импорт начинался с
+чистого состояния. Для сравнения «до/после» запустите скрипт на двух
+ревизиях репозитория:
+
+    python -m benchmarks.startup --runs 3
+    FAISS_MMAP=true python -m benchmarks.startup --runs 3
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+DEFAULT_MODULES: List[str] = [
+    "src.generated_answer.rag.rag_response",
+    "src.generated_answer.agent.faiss_search",
+    "src.generated_answer.agent.agent_response",
+]
+
+MEASURE_SCRIPT = """
+import importlib
+import json
+import sys
+import time
+
+import psutil
+
+process = psutil.Process()
+rss_before = process.memory_info().rss
+started = time.perf_counter()
+for module in sys.argv[1:]:
+    importlib.import_module(module)
+elapsed = time.perf_counter() - started
+rss_after = process.memory_info().rss
+print(json.dumps({
+    "import_seconds": elapsed,
+    "rss_before_mb": rss_before / 2 ** 20,
+    "rss_after_mb": rss_after / 2 ** 20,
+}))
+"""
+
+
+def measure(modules: List[str]) -> Dict[str, float]:
+    """
+    Импортирует модули в новом процессе и возвращает время импорта и RSS.
+
+    Args:
+        modules (List[str]): Импортируемые модули.
+
+    Returns:
+        Dict[str, float]: Время импорта в секундах и RSS до и после импорта в МБ.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE_SCRIPT, *modules],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(runs: int, modules: List[str]) -> None:
+    results = [measure(modules) for _ in range(runs)]
+
+    import_times = [result["import_seconds"] for result in results]
+    rss_after = [result["rss_after_mb"] for result in results]
+    rss_delta = [
+        result["rss_after_mb"] - result["rss_before_mb"] for result in results
+    ]
+
+    print(f"Модули: {', '.join(modules)}")
+    print(f"Запусков: {runs}")
+    print(f"Время импорта (медиана): {statistics.median(import_times):.2f} с")
+    print(f"RSS после импорта (медиана): {statistics.median(rss_after):.1f} МБ")
+    print(f"Прирост RSS при импорте (медиана): {statistics.median(rss_delta):.1f} МБ")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Время импорта и потребление памяти при запуске"
+    )
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    args = parser.parse_args()
+
+    main(args.runs, args.modules)
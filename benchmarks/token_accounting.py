@@ -0,0 +1,133 @@
+"""
+Бенчмарк стоимости подсчёта токенов на одно сообщение пользователя.
+
+Сравнивает прежний подсчёт (создание кодировки tiktoken при каждом вызове,
+отдельное кодирование каждого сообщения истории, кодирование `str(msg)`
+вместе с base64 изображения) с текущим `src.services.count_token`
+(кешированные кодировки, `encode_batch`, оценка изображения по плиткам).
+
+    python -m benchmarks.token_accounting
+    python -m benchmarks.token_accounting --history 20 --image-kb 500
+"""
+
+import argparse
+import base64
+import os
+import statistics
+import time
+from typing import Callable, Dict, List
+
+import tiktoken
+
+from src.services.count_token import (
+    count_image_tokens,
+    count_input_tokens,
+    count_output_tokens,
+)
+
+PARAGRAPH: str = (
+    "Staking lets validators lock ETH to secure the network; rewards depend on "
+    "uptime, the total amount staked and MEV. Liquid staking tokens such as "
+    "stETH keep the position tradable while it earns rewards. "
+)
+
+
+def legacy_input_tokens(history: List[dict], user_input: str, prompt: str, model: str) -> int:
+    messages = [{"role": "system", "content": prompt}]
+    for entry in history:
+        messages.append({"role": "user", "content": entry["question"]})
+        messages.append({"role": "assistant", "content": entry["response"]})
+    messages.append({"role": "user", "content": user_input})
+
+    encoding = tiktoken.encoding_for_model(model)
+    return sum(
+        len(encoding.encode(msg["role"])) + len(encoding.encode(msg["content"]))
+        for msg in messages
+    )
+
+
+def legacy_image_tokens(messages: List[dict]) -> int:
+    encoding = tiktoken.encoding_for_model("gpt-4o")
+    return sum(len(encoding.encode(str(msg))) for msg in messages)
+
+
+def measure(function: Callable[[], int], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main(args: argparse.Namespace) -> None:
+    history = [
+        {"question": PARAGRAPH * 2, "response": PARAGRAPH * args.response_paragraphs}
+        for _ in range(args.history)
+    ]
+    question = PARAGRAPH
+    prompt = PARAGRAPH * 10
+    answer = PARAGRAPH * args.response_paragraphs
+    image = base64.b64encode(os.urandom(args.image_kb * 1024)).decode()
+    image_messages = [
+        {"role": "system", "content": [{"type": "text", "text": prompt}]},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": question},
+                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image}"}},
+            ],
+        },
+    ]
+
+    # Прогрев: первая загрузка кодировки читает файлы BPE с диска.
+    count_input_tokens(history, question, prompt, model=args.model)
+
+    def legacy_message() -> int:
+        return (
+            legacy_input_tokens(history, question, prompt, args.model)
+            + len(tiktoken.encoding_for_model(args.model).encode(answer))
+        )
+
+    def current_message() -> int:
+        return count_input_tokens(history, question, prompt, model=args.model) + (
+            count_output_tokens(answer, model=args.model)
+        )
+
+    def current_image() -> int:
+        return count_input_tokens(
+            user_input=question, prompt=prompt, model="gpt-4o"
+        ) + count_image_tokens(1280, 960)
+
+    results: Dict[str, float] = {
+        "Текст, прежний подсчёт": measure(legacy_message, args.repeat),
+        "Текст, count_token": measure(current_message, args.repeat),
+        "Фото, прежний подсчёт (str + base64)": measure(
+            lambda: legacy_image_tokens(image_messages), max(args.repeat // 10, 3)
+        ),
+        "Фото, count_token (плитки)": measure(current_image, args.repeat),
+    }
+
+    print(
+        f"История: {args.history} пар, модель: {args.model}, "
+        f"изображение: {args.image_kb} КБ, повторов: {args.repeat}"
+    )
+    for name, elapsed in results.items():
+        print(f"{name:<40} {elapsed:8.3f} мс/сообщение")
+    print(
+        f"Токены фото: прежняя оценка {legacy_image_tokens(image_messages)}, "
+        f"по плиткам {current_image()}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Стоимость подсчёта токенов на одно сообщение"
+    )
+    parser.add_argument("--history", type=int, default=5)
+    parser.add_argument("--response-paragraphs", type=int, default=8)
+    parser.add_argument("--image-kb", type=int, default=200)
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--repeat", type=int, default=200)
+
+    main(parser.parse_args())
@@ -42,7 +42,7 @@ class GroupAutoRegisterFilter(BoundFilter):
 
             if chat.type in (types.ChatType.GROUP, types.ChatType.SUPERGROUP):
 
-                create_user(user_id, username)
+                await create_user(user_id, username)
 
                 return True
 
@@ -1,16 +1,91 @@
+"""
+Сборка FAISS индекса базы знаний «Фасолька».
+
+Markdown базы знаний разбивается на фрагменты по заголовкам, эмбеддинги
+запрашиваются параллельными пакетами с повторами при ограничении частоты
+запросов, а готовый индекс публикуется атомарно в версионную директорию:
+
+    faiss_index_RU/
+        CURRENT                     имя текущей версии
+        versions/<версия>/          index.faiss, index.pkl, bm25.json, VERSION
+        embeddings_checkpoint.jsonl эмбеддинги по хешу содержимого фрагмента
+
+Повторная сборка берёт эмбеддинги неизменённых фрагментов из файла
+контрольной точки, поэтому прерванная сборка продолжается с места остановки,
+а после правки базы знаний запрашиваются только изменённые фрагменты.
+
+Каждый фрагмент хранится в индексе под идентификатором, построенным по пути
+заголовков (`Header 1..4`). Команда `update` сравнивает базу знаний с текущей
+версией индекса по этим идентификаторам, удаляет векторы удалённых и
+изменённых разделов, добавляет новые и публикует результат как новую версию;
+запущенный бот подхватывает её без перезапуска (см. `knowledge_base.py`).
+
+Тип индекса задаётся `--index-type` (flat, ivfpq, hnsw, sq8, см.
+`index_types.py`); сервисы бота загружают индекс любого из этих типов.
+Индексы IVF и HNSW не поддерживают удаление векторов через LangChain, поэтому
+`update` для них пересобирает индекс из эмбеддингов контрольной точки.
+
+Примеры:
+
+    python create_vectorstore.py build
+    python create_vectorstore.py update --dry-run
+    python create_vectorstore.py update
+    python create_vectorstore.py build --index-type ivfpq --nlist 4096
+    python create_vectorstore.py build --embeddings fake --output /tmp/faiss_test
+    python create_vectorstore.py inspect
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
 import os
+import random
+import shutil
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+import openai
+from dotenv import load_dotenv
 from langchain.text_splitter import MarkdownHeaderTextSplitter
 from langchain.vectorstores import FAISS
-from langchain.embeddings import OpenAIEmbeddings
-from dotenv import load_dotenv
-
-load_dotenv()
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_openai import OpenAIEmbeddings
 
+from src.generated_answer.bm25_index import BM25Index
+from src.generated_answer.index_layout import (
+    CURRENT_POINTER,
+    VERSION_FILE,
+    VERSIONS_DIR,
+    resolve_index_path,
+)
+from src.generated_answer.index_types import (
+    DEFAULT_HNSW_M,
+    DEFAULT_NLIST,
+    DEFAULT_PQ_M,
+    INDEX_TYPES,
+    create_index,
+    describe_index,
+    index_type_of,
+    supports_incremental_delete,
+)
 
-def read_markdown(file_path):
-    with open(file_path, "r", encoding="utf-8") as file:
-        return file.read()
+load_dotenv()
+logger = logging.getLogger("create_vectorstore")
 
+DEFAULT_SOURCE: str = "БЗ _Фасолька_ (для загрузки в модель).txt"
+DEFAULT_OUTPUT: str = "faiss_index_RU"
+EMBEDDING_MODEL: str = "text-embedding-ada-002"
+FAKE_EMBEDDING_SIZE: int = 1536
+CHECKPOINT_FILE: str = "embeddings_checkpoint.jsonl"
+MAX_RETRIES: int = 8
+RETRY_BASE_DELAY: float = 1.0
+RETRY_MAX_DELAY: float = 60.0
 
 define_headers = [
     ("#", "Header 1"),
@@ -19,51 +94,613 @@ define_headers = [
     ("####", "Header 4"),
 ]
 
-splitter = MarkdownHeaderTextSplitter(define_headers)
 
-md_file_path = "БЗ _Фасолька_ (для загрузки в модель).txt"
-text = read_markdown(md_file_path)
-chunks = splitter.split_text(text)
+def read_markdown(file_path: str) -> str:
+    with open(file_path, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+def split_knowledge_base(file_path: str) -> List[Document]:
+    """
+    Разбивает markdown базы знаний на фрагменты по заголовкам `Header 1..4`.
+
+    Args:
+        file_path (str): Путь к файлу базы знаний.
+
+    Returns:
+        List[Document]: Фрагменты с заголовками в метаданных.
+    """
+    splitter = MarkdownHeaderTextSplitter(define_headers)
+    return splitter.split_text(read_markdown(file_path))
+
+
+def section_path(document: Document) -> str:
+    """
+    Путь заголовков фрагмента, например `Фасолька / Тарифы / Оплата`.
 
-openai_api_key = os.getenv("GPT_SECRET_KEY_FASOLKAAI", "")
-if not openai_api_key:
-    raise ValueError(
-        "Не найден OPENAI_API_KEY. Укажите его в .env или системе."
+    Args:
+        document (Document): Фрагмент с заголовками в метаданных.
+
+    Returns:
+        str: Заголовки `Header 1..4` через ` / `.
+    """
+    return " / ".join(
+        document.metadata[name]
+        for _, name in define_headers
+        if document.metadata.get(name)
     )
 
 
-embeddings = OpenAIEmbeddings(
-    openai_api_key=openai_api_key, model="text-embedding-ada-002"
-)
+def section_ids(documents: List[Document]) -> List[str]:
+    """
+    Строит стабильные идентификаторы фрагментов по пути заголовков.
 
-faiss_db = FAISS.from_documents(chunks, embeddings)
-faiss_db.save_local("faiss_index_RU")
+    Идентификатор не зависит от текста раздела, поэтому правка раздела
+    заменяет его вектор, а не добавляет новый. Разделы с одинаковым путём
+    заголовков различаются порядковым номером.
 
-print("Индекс успешно сохранён в faiss_index_US")
+    Args:
+        documents (List[Document]): Фрагменты в порядке базы знаний.
 
+    Returns:
+        List[str]: Идентификаторы в порядке фрагментов.
+    """
+    seen: Dict[str, int] = {}
+    ids = []
+    for document in documents:
+        path = section_path(document)
+        occurrence = seen.get(path, 0)
+        seen[path] = occurrence + 1
+        digest = hashlib.sha256(path.encode("utf-8")).hexdigest()[:16]
+        ids.append(f"section:{digest}:{occurrence}")
+    return ids
+
+
+def diff_sections(
+    vectorstore: FAISS, documents: List[Document], ids: List[str]
+) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Сравнивает разделы базы знаний с содержимым индекса.
+
+    Индексы, собранные до появления идентификаторов по заголовкам, не
+    содержат ни одного совпадающего идентификатора: все их векторы попадают
+    в удалённые, а разделы — в новые.
+
+    Args:
+        vectorstore (FAISS): Текущий индекс.
+        documents (List[Document]): Фрагменты базы знаний.
+        ids (List[str]): Идентификаторы фрагментов из `section_ids`.
+
+    Returns:
+        Tuple[List[str], List[str], List[str]]: Идентификаторы новых,
+            изменённых и удалённых разделов.
+    """
+    existing: Dict[str, Document] = dict(vectorstore.docstore._dict)
+    added, changed = [], []
+    for document, doc_id in zip(documents, ids):
+        current = existing.pop(doc_id, None)
+        if current is None:
+            added.append(doc_id)
+        elif (
+            current.page_content != document.page_content
+            or current.metadata != document.metadata
+        ):
+            changed.append(doc_id)
+    return added, changed, list(existing)
 
-from langchain.vectorstores import FAISS
-from langchain.embeddings import OpenAIEmbeddings
 
-openai_api_key = os.getenv("OPENAI_API_KEY", "")
-if not openai_api_key:
-    raise ValueError(
-        "Не найден OPENAI_API_KEY. Укажите его в .env или системе."
+def get_embeddings(backend: str) -> Embeddings:
+    """
+    Создаёт модель эмбеддингов.
+
+    Args:
+        backend (str): `openai` или `fake` — детерминированные локальные
+            эмбеддинги для проверки сборки без обращения к API.
+
+    Returns:
+        Embeddings: Модель эмбеддингов.
+
+    Raises:
+        ValueError: Не задан ключ OpenAI.
+    """
+    if backend == "fake":
+        return DeterministicFakeEmbedding(size=FAKE_EMBEDDING_SIZE)
+
+    openai_api_key = os.getenv("GPT_SECRET_KEY_FASOLKAAI", "")
+    if not openai_api_key:
+        raise ValueError(
+            "Не найден GPT_SECRET_KEY_FASOLKAAI. Укажите его в .env или системе."
+        )
+    return OpenAIEmbeddings(
+        openai_api_key=openai_api_key, model=EMBEDDING_MODEL, max_retries=0
     )
 
-embeddings_check = OpenAIEmbeddings(
-    openai_api_key=openai_api_key, model="text-embedding-ada-002"
-)
 
-db_check = FAISS.load_local(
-    "faiss_index_US", embeddings_check, allow_dangerous_deserialization=True
-)
+def chunk_hash(document: Document, backend: str) -> str:
+    """
+    Хеш содержимого фрагмента вместе с заголовками и моделью эмбеддингов.
+
+    Args:
+        document (Document): Фрагмент.
+        backend (str): Модель эмбеддингов, входит в хеш.
+
+    Returns:
+        str: Hex-строка SHA-256.
+    """
+    payload = json.dumps(
+        {
+            "model": EMBEDDING_MODEL if backend == "openai" else backend,
+            "text": document.page_content,
+            "metadata": document.metadata,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_checkpoint(path: str) -> Dict[str, List[float]]:
+    """
+    Читает эмбеддинги, сохранённые предыдущими сборками.
+
+    Повреждённая последняя строка (прерванная запись) пропускается.
+
+    Args:
+        path (str): Путь к файлу контрольной точки.
+
+    Returns:
+        Dict[str, List[float]]: Эмбеддинги по хешу фрагмента.
+    """
+    checkpoint: Dict[str, List[float]] = {}
+    if not os.path.exists(path):
+        return checkpoint
+
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+                checkpoint[entry["hash"]] = entry["embedding"]
+            except (ValueError, KeyError):
+                logger.warning("Пропущена повреждённая строка контрольной точки.")
+    return checkpoint
+
+
+def append_checkpoint(path: str, entries: List[Tuple[str, List[float]]]) -> None:
+    """
+    Дописывает эмбеддинги пакета в файл контрольной точки.
 
-documents = db_check.docstore._dict
-print(f"Количество документов в базе: {len(documents)}")
+    Args:
+        path (str): Путь к файлу контрольной точки.
+        entries (List[Tuple[str, List[float]]]): Пары (хеш, эмбеддинг).
+    """
+    with open(path, "a", encoding="utf-8") as file:
+        for chunk_id, embedding in entries:
+            file.write(json.dumps({"hash": chunk_id, "embedding": embedding}) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """
+    Задержка перед повтором: `Retry-After` из ответа API или экспоненциальная с джиттером.
+
+    Args:
+        error (Exception): Ошибка запроса.
+        attempt (int): Номер попытки, начиная с 1.
+
+    Returns:
+        float: Задержка в секундах.
+    """
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+async def embed_batch(
+    embeddings: Embeddings,
+    texts: List[str],
+    semaphore: asyncio.Semaphore,
+) -> List[List[float]]:
+    """
+    Запрашивает эмбеддинги одного пакета с повторами при ограничении частоты запросов.
+
+    Args:
+        embeddings (Embeddings): Модель эмбеддингов.
+        texts (List[str]): Тексты пакета.
+        semaphore (asyncio.Semaphore): Ограничение числа одновременных запросов.
+
+    Returns:
+        List[List[float]]: Эмбеддинги в порядке текстов.
+
+    Raises:
+        openai.OpenAIError: Ошибка API после исчерпания повторов.
+    """
+    for attempt in range(1, MAX_RETRIES + 1):
+        async with semaphore:
+            try:
+                return await embeddings.aembed_documents(texts)
+            except (
+                openai.RateLimitError,
+                openai.APIConnectionError,
+                openai.APITimeoutError,
+                openai.InternalServerError,
+            ) as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = retry_delay(e, attempt)
+                logger.warning(
+                    f"Ошибка запроса эмбеддингов ({type(e).__name__}), повтор {attempt} через {delay:.1f} с."
+                )
+        await asyncio.sleep(delay)
+
+
+async def embed_chunks(
+    documents: List[Document],
+    embeddings: Embeddings,
+    backend: str,
+    checkpoint_path: str,
+    batch_size: int,
+    concurrency: int,
+) -> List[List[float]]:
+    """
+    Возвращает эмбеддинги всех фрагментов, запрашивая только отсутствующие в контрольной точке.
+
+    Пакеты запрашиваются параллельно; каждый готовый пакет сразу дописывается
+    в контрольную точку, поэтому прерванная сборка при повторном запуске
+    продолжится с недостающих фрагментов.
+
+    Args:
+        documents (List[Document]): Фрагменты.
+        embeddings (Embeddings): Модель эмбеддингов.
+        backend (str): Имя модели эмбеддингов для хешей.
+        checkpoint_path (str): Путь к файлу контрольной точки.
+        batch_size (int): Размер пакета.
+        concurrency (int): Количество одновременных запросов.
+
+    Returns:
+        List[List[float]]: Эмбеддинги в порядке фрагментов.
+    """
+    hashes = [chunk_hash(document, backend) for document in documents]
+    checkpoint = load_checkpoint(checkpoint_path)
+
+    pending: Dict[str, str] = {}
+    for document, chunk_id in zip(documents, hashes):
+        if chunk_id not in checkpoint:
+            pending.setdefault(chunk_id, document.page_content)
+
+    logger.info(
+        f"Фрагментов: {len(documents)}, из контрольной точки: {len(documents) - len(pending)}, "
+        f"к запросу: {len(pending)}."
+    )
 
-for doc_id, document in documents.items():
-    print(f"ID документа: {doc_id}")
-    print(f"Содержимое: {document.page_content}")
-    print(f"Метаданные: {document.metadata}")
-    print("--------")
+    pending_items = list(pending.items())
+    batches = [
+        pending_items[i:i + batch_size]
+        for i in range(0, len(pending_items), batch_size)
+    ]
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+
+    async def run_batch(batch: List[Tuple[str, str]]) -> None:
+        nonlocal done
+        vectors = await embed_batch(
+            embeddings, [text for _, text in batch], semaphore
+        )
+        entries = [(chunk_id, vector) for (chunk_id, _), vector in zip(batch, vectors)]
+        append_checkpoint(checkpoint_path, entries)
+        checkpoint.update(entries)
+        done += len(batch)
+        logger.info(f"Эмбеддинги: {done}/{len(pending_items)}")
+
+    await asyncio.gather(*[run_batch(batch) for batch in batches])
+    return [checkpoint[chunk_id] for chunk_id in hashes]
+
+
+def build_vectorstore(
+    documents: List[Document],
+    vectors: List[List[float]],
+    embeddings: Embeddings,
+    args: argparse.Namespace,
+) -> FAISS:
+    """
+    Собирает FAISS индекс из готовых эмбеддингов.
+
+    Индекс типа `args.index_type` обучается на эмбеддингах базы знаний.
+    Фрагменты сохраняются под идентификаторами из `section_ids`, по которым
+    команда `update` находит их при следующих изменениях базы знаний.
+
+    Args:
+        documents (List[Document]): Фрагменты.
+        vectors (List[List[float]]): Эмбеддинги фрагментов.
+        embeddings (Embeddings): Модель эмбеддингов для запросов.
+        args (argparse.Namespace): Параметры индекса: `index_type`, `nlist`,
+            `pq_m`, `hnsw_m`.
+
+    Returns:
+        FAISS: Векторное хранилище.
+    """
+    index = create_index(
+        args.index_type,
+        np.asarray(vectors, dtype=np.float32),
+        args.nlist,
+        args.pq_m,
+        args.hnsw_m,
+    )
+    vectorstore = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+    )
+    vectorstore.add_embeddings(
+        text_embeddings=[
+            (document.page_content, vector)
+            for document, vector in zip(documents, vectors)
+        ],
+        metadatas=[document.metadata for document in documents],
+        ids=section_ids(documents),
+    )
+    return vectorstore
+
+
+def publish_vectorstore(vectorstore: FAISS, root: str, keep: int) -> str:
+    """
+    Атомарно публикует индекс в новую версию и переключает на неё указатель `CURRENT`.
+
+    Индекс сохраняется во временную директорию вместе с BM25 индексом по
+    тем же фрагментам, переименовывается в `versions/<версия>`, после чего
+    `CURRENT` заменяется через `os.replace`. Читатель всегда видит либо
+    старую, либо новую версию целиком.
+
+    Args:
+        vectorstore (FAISS): Векторное хранилище.
+        root (str): Корневая директория индекса.
+        keep (int): Сколько последних версий хранить.
+
+    Returns:
+        str: Имя опубликованной версии.
+    """
+    versions_dir = os.path.join(root, VERSIONS_DIR)
+    os.makedirs(versions_dir, exist_ok=True)
+
+    version = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    tmp_dir = os.path.join(versions_dir, f".tmp-{version}")
+    vectorstore.save_local(tmp_dir)
+    documents = vectorstore.docstore._dict
+    BM25Index.from_texts(
+        list(documents), [document.page_content for document in documents.values()]
+    ).save(tmp_dir)
+    with open(os.path.join(tmp_dir, VERSION_FILE), "w", encoding="utf-8") as file:
+        file.write(version)
+    os.replace(tmp_dir, os.path.join(versions_dir, version))
+
+    pointer_tmp = os.path.join(root, f"{CURRENT_POINTER}.tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as file:
+        file.write(version)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(pointer_tmp, os.path.join(root, CURRENT_POINTER))
+
+    previous = sorted(
+        name for name in os.listdir(versions_dir) if not name.startswith(".")
+    )
+    for name in previous[:-keep]:
+        shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+    return version
+
+
+def build(args: argparse.Namespace) -> None:
+    started = time.perf_counter()
+    documents = split_knowledge_base(args.source)
+    embeddings = get_embeddings(args.embeddings)
+
+    os.makedirs(args.output, exist_ok=True)
+    checkpoint_path = os.path.join(args.output, CHECKPOINT_FILE)
+    vectors = asyncio.run(
+        embed_chunks(
+            documents,
+            embeddings,
+            args.embeddings,
+            checkpoint_path,
+            args.batch_size,
+            args.concurrency,
+        )
+    )
+
+    vectorstore = build_vectorstore(documents, vectors, embeddings, args)
+    version = publish_vectorstore(vectorstore, args.output, args.keep)
+    print(
+        f"Индекс {args.index_type} из {len(documents)} фрагментов опубликован в {args.output} "
+        f"как версия {version} за {time.perf_counter() - started:.1f} с"
+    )
+
+
+def update(args: argparse.Namespace) -> None:
+    started = time.perf_counter()
+    documents = split_knowledge_base(args.source)
+    ids = section_ids(documents)
+    embeddings = get_embeddings(args.embeddings)
+
+    path = resolve_index_path(args.output)
+    vectorstore = FAISS.load_local(
+        path, embeddings, allow_dangerous_deserialization=True
+    )
+    current_type = index_type_of(vectorstore.index)
+    args.index_type = args.index_type or current_type
+
+    added, changed, removed = diff_sections(vectorstore, documents, ids)
+    print(
+        f"Разделов: {len(documents)}, новых: {len(added)}, "
+        f"изменённых: {len(changed)}, удалённых: {len(removed)}, "
+        f"тип индекса: {current_type} -> {args.index_type}"
+    )
+    if args.verbose:
+        by_id = dict(zip(ids, documents))
+        for label, section_list in (("+", added), ("~", changed)):
+            for doc_id in section_list:
+                print(f"{label} {section_path(by_id[doc_id])}")
+        for doc_id in removed:
+            print(f"- {section_path(vectorstore.docstore._dict[doc_id])}")
+    if args.dry_run or not (
+        added or changed or removed or args.index_type != current_type
+    ):
+        return
+
+    os.makedirs(args.output, exist_ok=True)
+
+    def embed(chunks: List[Document]) -> List[List[float]]:
+        return asyncio.run(
+            embed_chunks(
+                chunks,
+                embeddings,
+                args.embeddings,
+                os.path.join(args.output, CHECKPOINT_FILE),
+                args.batch_size,
+                args.concurrency,
+            )
+        )
+
+    if args.index_type != current_type or not supports_incremental_delete(
+        vectorstore.index
+    ):
+        logger.info(
+            f"Индекс {args.index_type} пересобирается из эмбеддингов контрольной точки."
+        )
+        vectorstore = build_vectorstore(
+            documents, embed(documents), embeddings, args
+        )
+    else:
+        if changed or removed:
+            vectorstore.delete(changed + removed)
+
+        upsert = set(added) | set(changed)
+        new_sections = [
+            (doc_id, document)
+            for document, doc_id in zip(documents, ids)
+            if doc_id in upsert
+        ]
+        new_documents = [document for _, document in new_sections]
+        if new_documents:
+            vectors = embed(new_documents)
+            vectorstore.add_embeddings(
+                text_embeddings=[
+                    (document.page_content, vector)
+                    for document, vector in zip(new_documents, vectors)
+                ],
+                metadatas=[document.metadata for document in new_documents],
+                ids=[doc_id for doc_id, _ in new_sections],
+            )
+
+    version = publish_vectorstore(vectorstore, args.output, args.keep)
+    print(
+        f"Индекс обновлён до версии {version} за {time.perf_counter() - started:.1f} с"
+    )
+
+
+def inspect(args: argparse.Namespace) -> None:
+    path = resolve_index_path(args.output)
+    db_check = FAISS.load_local(
+        path, get_embeddings("fake"), allow_dangerous_deserialization=True
+    )
+
+    documents = db_check.docstore._dict
+    print(f"Индекс: {path}")
+    print(f"Количество документов в базе: {len(documents)}")
+    for name, value in describe_index(db_check.index).items():
+        print(f"{name}: {value}")
+
+    if args.verbose:
+        for doc_id, document in documents.items():
+            print(f"ID документа: {doc_id}")
+            print(f"Содержимое: {document.page_content}")
+            print(f"Метаданные: {document.metadata}")
+            print("--------")
+
+
+def add_index_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--nlist", type=int, default=DEFAULT_NLIST, help="Число кластеров IVF"
+    )
+    parser.add_argument(
+        "--pq-m", type=int, default=DEFAULT_PQ_M, help="Число подвекторов PQ"
+    )
+    parser.add_argument(
+        "--hnsw-m", type=int, default=DEFAULT_HNSW_M, help="Число связей HNSW"
+    )
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Сборка FAISS индекса базы знаний"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser(
+        "build", help="Собрать и опубликовать новую версию индекса"
+    )
+    build_parser.add_argument("--source", default=DEFAULT_SOURCE)
+    build_parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    build_parser.add_argument(
+        "--embeddings", choices=["openai", "fake"], default="openai"
+    )
+    build_parser.add_argument("--batch-size", type=int, default=100)
+    build_parser.add_argument("--concurrency", type=int, default=4)
+    build_parser.add_argument(
+        "--keep", type=int, default=3, help="Сколько версий индекса хранить"
+    )
+    build_parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    add_index_arguments(build_parser)
+    build_parser.set_defaults(handler=build)
+
+    update_parser = subparsers.add_parser(
+        "update",
+        help="Обновить текущую версию индекса только по изменённым разделам",
+    )
+    update_parser.add_argument("--source", default=DEFAULT_SOURCE)
+    update_parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    update_parser.add_argument(
+        "--embeddings", choices=["openai", "fake"], default="openai"
+    )
+    update_parser.add_argument("--batch-size", type=int, default=100)
+    update_parser.add_argument("--concurrency", type=int, default=4)
+    update_parser.add_argument(
+        "--keep", type=int, default=3, help="Сколько версий индекса хранить"
+    )
+    update_parser.add_argument(
+        "--dry-run", action="store_true", help="Только показать изменения"
+    )
+    update_parser.add_argument(
+        "--verbose", action="store_true", help="Показать изменённые разделы"
+    )
+    update_parser.add_argument(
+        "--index-type",
+        choices=INDEX_TYPES,
+        default=None,
+        help="Сменить тип индекса; по умолчанию сохраняется текущий",
+    )
+    add_index_arguments(update_parser)
+    update_parser.set_defaults(handler=update)
+
+    inspect_parser = subparsers.add_parser(
+        "inspect", help="Показать содержимое текущей версии индекса"
+    )
+    inspect_parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    inspect_parser.add_argument("--verbose", action="store_true")
+    inspect_parser.set_defaults(handler=inspect)
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    arguments = parse_arguments()
+    arguments.handler(arguments)
@@ -3,14 +3,18 @@ import logging
 import os
 from datetime import datetime, timedelta
 from aiogram import Bot
-from psycopg2 import OperationalError as DatabaseError
+from asyncpg import PostgresError as DatabaseError
 
-from db.database_connection import get_db_connection
+from db.database_connection import db_connection
+from db.sheets_outbox import run_sheets_outbox_worker
+from db.sheets_sync import sync_google_sheets
 from src.bot.bot_messages import MESSAGES
+from src.generated_answer.knowledge_base import watch_knowledge_base
 from src.keyboards.check_subscriptions_keyboard import (
     check_subscriptions_keyboard,
 )
 from src.keyboards.reminder_keyboard import get_reminder_keyboard
+from src.services.metrics import log_metrics_periodically
 
 
 logger = logging.getLogger(__name__)
@@ -20,6 +24,11 @@ async def send_reminder_work(bot: Bot) -> None:
     """
     Отправляет напоминания пользователям об активности.
 
+    Соединение из пула берётся только на время запросов: рассылка сообщений
+    идёт без удержания соединения. Флаг отправки записывается сразу после
+    каждого отправленного напоминания, поэтому при остановке или сбое
+    посреди рассылки уже уведомлённые пользователи не получат его повторно.
+
     Args:
         bot (Bot): Экземпляр бота.
 
@@ -31,92 +40,93 @@ async def send_reminder_work(bot: Bot) -> None:
     try:
         logger.info("Начало отправки напоминаний для пользователей.")
 
-        with get_db_connection() as connection:
-            cursor = connection.cursor()
-
-            for hours, column_name in [
-                (24, "reminder_24_sent"),
-                (72, "reminder_72_sent"),
-                (168, "reminder_168_sent"),
-            ]:
-                time_threshold = datetime.now() - timedelta(hours=hours)
-
-                query = f"""
-                    SELECT 
-                        users.id, 
-                        users.user_id, 
-                        reminder.{column_name},
-                        COALESCE(
-                            (
-                                SELECT MAX(user_history.created_at) 
-                                FROM user_history 
-                                WHERE user_history.user_id = users.user_id
-                            ), 
-                            users.created_at
-                        ) AS last_interaction
-                    FROM 
-                        users
-                    LEFT JOIN 
-                        reminder 
-                    ON 
-                        users.user_id = reminder.user_id
-                    WHERE 
-                        COALESCE(
-                            (
-                                SELECT MAX(user_history.created_at) 
-                                FROM user_history 
-                                WHERE user_history.user_id = users.user_id
-                            ), 
-                            users.created_at
-                        ) < %s
-                        AND 
-                        (reminder.{column_name} = 0 OR reminder.{column_name} IS NULL)
-                    GROUP BY 
-                        users.id, 
-                        users.user_id, 
-                        reminder.{column_name}, 
-                        last_interaction;
-                """
-
-                cursor.execute(query, (time_threshold,))
-                rows = cursor.fetchall()
+        for hours, column_name in [
+            (24, "reminder_24_sent"),
+            (72, "reminder_72_sent"),
+            (168, "reminder_168_sent"),
+        ]:
+            time_threshold = datetime.now() - timedelta(hours=hours)
+
+            query = f"""
+                SELECT
+                    users.id,
+                    users.user_id,
+                    reminder.{column_name},
+                    COALESCE(
+                        (
+                            SELECT MAX(user_history.created_at)
+                            FROM user_history
+                            WHERE user_history.user_id = users.user_id
+                        ),
+                        users.created_at
+                    ) AS last_interaction
+                FROM
+                    users
+                LEFT JOIN
+                    reminder
+                ON
+                    users.user_id = reminder.user_id
+                WHERE
+                    COALESCE(
+                        (
+                            SELECT MAX(user_history.created_at)
+                            FROM user_history
+                            WHERE user_history.user_id = users.user_id
+                        ),
+                        users.created_at
+                    ) < $1
+                    AND
+                    (reminder.{column_name} = 0 OR reminder.{column_name} IS NULL)
+                GROUP BY
+                    users.id,
+                    users.user_id,
+                    reminder.{column_name},
+                    last_interaction;
+            """
 
-                logger.info(
-                    f"Найдено {len(rows)} пользователей для отправки напоминаний на {hours} часов."
-                )
+            async with db_connection() as connection:
+                rows = await connection.fetch(query, time_threshold)
 
-                for table_id, user_id, _, last_interaction in rows:
-                    message_key = f"send_reminder_{hours}h"
-                    message_text = MESSAGES[message_key]["en"]
-
-                    try:
-                        if hours == 72:
-                            reminder_keyboard = get_reminder_keyboard("en")
-                            await bot.send_message(
-                                user_id,
-                                message_text,
-                                reply_markup=reminder_keyboard,
-                            )
-                        else:
-                            await bot.send_message(user_id, message_text)
-
-                        logger.info(
-                            f"Напоминание отправлено пользователю {user_id}: {message_text}"
-                        )
-                    except Exception as e:
-                        logger.error(
-                            f"Ошибка при отправке сообщения пользователю {user_id}: {e}"
+            logger.info(
+                f"Найдено {len(rows)} пользователей для отправки напоминаний на {hours} часов."
+            )
+
+            notified = 0
+            for table_id, user_id, _, last_interaction in rows:
+                message_key = f"send_reminder_{hours}h"
+                message_text = MESSAGES[message_key]["en"]
+
+                try:
+                    if hours == 72:
+                        reminder_keyboard = get_reminder_keyboard("en")
+                        await bot.send_message(
+                            user_id,
+                            message_text,
+                            reply_markup=reminder_keyboard,
                         )
-                        continue
+                    else:
+                        await bot.send_message(user_id, message_text)
 
-                    cursor.execute(
-                        f"UPDATE reminder SET {column_name} = 1 WHERE user_id = %s",
-                        (user_id,),
-                    )
-                    connection.commit()
                     logger.info(
-                        f"Флаг {column_name} обновлен для пользователя {user_id}."
+                        f"Напоминание отправлено пользователю {user_id}: {message_text}"
                     )
+                except Exception as e:
+                    logger.error(
+                        f"Ошибка при отправке сообщения пользователю {user_id}: {e}"
+                    )
+                    continue
+
+                async with db_connection() as connection:
+                    await connection.execute(
+                        f"UPDATE reminder SET {column_name} = 1 WHERE user_id = $1",
+                        user_id,
+                    )
+                notified += 1
+
+            if notified:
+                logger.info(
+                    f"Флаг {column_name} обновлен для {notified} пользователей."
+                )
 
     except DatabaseError as e:
         logger.error(f"Ошибка при взаимодействии с базой данных: {e}")
@@ -148,74 +158,65 @@ async def send_subscription_reminder(bot: Bot) -> None:
         time_24_hours_ago = datetime.now() - timedelta(hours=24)
         time_168_hours_ago = datetime.now() - timedelta(hours=168)
 
-        with get_db_connection() as connection:
-            cursor = connection.cursor()
-
-            query = """
-                SELECT u.user_id,
-                       t.reminder_24_sent_subscription,
-                       t.reminder_168_sent_subscription,
-                       (SELECT MAX(created_at) 
-                        FROM user_history 
-                        WHERE user_history.user_id = u.user_id) AS last_interaction
-                FROM users u
-                JOIN reminder t ON u.user_id = t.user_id
-                WHERE (t.reminder_24_sent_subscription = 0 OR t.reminder_168_sent_subscription = 0);
-            """
-            cursor.execute(query)
-            rows = cursor.fetchall()
+        query = """
+            SELECT u.user_id,
+                   t.reminder_24_sent_subscription,
+                   t.reminder_168_sent_subscription,
+                   (SELECT MAX(created_at)
+                    FROM user_history
+                    WHERE user_history.user_id = u.user_id) AS last_interaction
+            FROM users u
+            JOIN reminder t ON u.user_id = t.user_id
+            WHERE (t.reminder_24_sent_subscription = 0 OR t.reminder_168_sent_subscription = 0);
+        """
+        async with db_connection() as connection:
+            rows = await connection.fetch(query)
+
+        logger.info(
+            f"Найдено {len(rows)} пользователей для отправки напоминаний о подписке."
+        )
+
+        for (
+            user_id,
+            reminder_24_sent,
+            reminder_168_sent,
+            last_interaction,
+        ) in rows:
+            if last_interaction is None:
+                logger.info(
+                    f"Пропуск пользователя {user_id}, так как нет взаимодействий."
+                )
+                continue
 
-            logger.info(
-                f"Найдено {len(rows)} пользователей для отправки напоминаний о подписке."
-            )
+            if last_interaction > datetime.now() - timedelta(minutes=30):
+                continue
 
-            for (
-                user_id,
-                reminder_24_sent,
-                reminder_168_sent,
-                last_interaction,
-            ) in rows:
-                if last_interaction is None:
-                    logger.info(
-                        f"Пропуск пользователя {user_id}, так как нет взаимодействий."
-                    )
-                    continue
-
-                if last_interaction > datetime.now() - timedelta(minutes=30):
-                    continue
-
-                if (
-                    not reminder_24_sent
-                    and last_interaction < time_24_hours_ago
-                ):
-                    await bot.send_message(
+            if not reminder_24_sent and last_interaction < time_24_hours_ago:
+                await bot.send_message(
+                    user_id,
+                    MESSAGES["send_subscription_reminder_24"]["en"]
+                    + os.getenv("CHANNEL_LINK"),
+                    reply_markup=check_subscriptions_keyboard("en"),
+                )
+                async with db_connection() as connection:
+                    await connection.execute(
+                        "UPDATE reminder SET reminder_24_sent_subscription = 1 WHERE user_id = $1",
                         user_id,
-                        MESSAGES["send_subscription_reminder_24"]["en"]
-                        + os.getenv("CHANNEL_LINK"),
-                        reply_markup=check_subscriptions_keyboard("en"),
                     )
-                    cursor.execute(
-                        "UPDATE reminder SET reminder_24_sent_subscription = 1 WHERE user_id = %s",
-                        (user_id,),
-                    )
-                    connection.commit()
-                    continue
-
-                if (
-                    not reminder_168_sent
-                    and last_interaction < time_168_hours_ago
-                ):
-                    await bot.send_message(
+                continue
+
+            if not reminder_168_sent and last_interaction < time_168_hours_ago:
+                await bot.send_message(
+                    user_id,
+                    MESSAGES["send_subscription_reminder_168"]["en"]
+                    + os.getenv("CHANNEL_LINK"),
+                    reply_markup=check_subscriptions_keyboard("en"),
+                )
+                async with db_connection() as connection:
+                    await connection.execute(
+                        "UPDATE reminder SET reminder_168_sent_subscription = 1 WHERE user_id = $1",
                         user_id,
-                        MESSAGES["send_subscription_reminder_168"]["en"]
-                        + os.getenv("CHANNEL_LINK"),
-                        reply_markup=check_subscriptions_keyboard("en"),
                     )
-                    cursor.execute(
-                        "UPDATE reminder SET reminder_168_sent_subscription = 1 WHERE user_id = %s",
-                        (user_id,),
-                    )
-                    connection.commit()
 
     except DatabaseError as e:
         logger.error(f"Ошибка базы данных: {e}")
@@ -234,6 +235,10 @@ async def start_background_tasks(bot: Bot) -> None:
 
     - send_reminder_work() каждые 29 минут.
     - send_subscription_reminder() каждые 12 часов.
+    - sync_google_sheets() — однократная синхронизация листа `history` после запуска,
+      затем run_sheets_outbox_worker() — выгрузка очереди строк в Google Sheets.
+    - log_metrics_periodically() — запись метрик в лог.
+    - watch_knowledge_base() — подхват новых версий FAISS индекса без перезапуска.
     """
 
     async def periodic_task(func, interval):
@@ -255,8 +260,16 @@ async def start_background_tasks(bot: Bot) -> None:
 
             await asyncio.sleep(interval)
 
+    async def google_sheets_task():
+        """Запускает выгрузку очереди после синхронизации, чтобы они не писали в лист одновременно."""
+        await sync_google_sheets()
+        await run_sheets_outbox_worker()
+
     asyncio.create_task(periodic_task(send_reminder_work, 29 * 60))
     asyncio.create_task(
         periodic_task(send_subscription_reminder, 12 * 60 * 60)
     )
+    asyncio.create_task(google_sheets_task())
+    asyncio.create_task(log_metrics_periodically())
+    asyncio.create_task(watch_knowledge_base())
     logger.info("Фоновые задачи запущены.")
@@ -1,7 +1,10 @@
+import asyncio
 import logging
-from typing import Dict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
 import os
 
+import asyncpg
 import psycopg2
 from dotenv import load_dotenv
 
@@ -17,11 +20,23 @@ DB_CONFIG: Dict[str, str] = {
     "port": os.getenv("DB_PORT", ""),
 }
 
+DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_ACQUIRE_TIMEOUT: float = float(os.getenv("DB_ACQUIRE_TIMEOUT", "5"))
+DB_COMMAND_TIMEOUT: float = float(os.getenv("DB_COMMAND_TIMEOUT", "10"))
+DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+
+_pool: Optional[asyncpg.Pool] = None
+_pool_lock = asyncio.Lock()
+
 
 def get_db_connection() -> psycopg2.extensions.connection:
     """
     Устанавливает соединение с базой данных PostgreSQL.
 
+    Используется только синхронными утилитами (миграции, выгрузки), обработчики
+    бота работают через пул `get_db_pool()`.
+
     Returns:
         psycopg2.extensions.connection: Соединение с базой данных.
 
@@ -42,3 +57,75 @@ def get_db_connection() -> psycopg2.extensions.connection:
             f"Неизвестная ошибка при подключении к PostgreSQL: {error}"
         )
         raise
+
+
+async def get_db_pool() -> asyncpg.Pool:
+    """
+    Возвращает общий пул асинхронных соединений с PostgreSQL, создавая его при первом вызове.
+
+    Размер пула ограничен `DB_POOL_MAX_SIZE`, каждая команда ограничена
+    `DB_COMMAND_TIMEOUT` секундами, а подготовленные выражения кешируются
+    на соединении (`DB_STATEMENT_CACHE_SIZE`).
+
+    Returns:
+        asyncpg.Pool: Пул соединений.
+
+    Raises:
+        asyncpg.PostgresError: Ошибка базы данных при создании пула.
+        OSError: Сервер базы данных недоступен.
+    """
+    global _pool
+
+    if _pool is not None:
+        return _pool
+
+    async with _pool_lock:
+        if _pool is None:
+            try:
+                _pool = await asyncpg.create_pool(
+                    database=DB_CONFIG["dbname"],
+                    user=DB_CONFIG["user"],
+                    password=DB_CONFIG["password"],
+                    host=DB_CONFIG["host"],
+                    port=DB_CONFIG["port"] or None,
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    command_timeout=DB_COMMAND_TIMEOUT,
+                    statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                    timeout=DB_ACQUIRE_TIMEOUT,
+                )
+                logger.info(
+                    f"Пул соединений PostgreSQL создан (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})."
+                )
+            except (asyncpg.PostgresError, OSError) as error:
+                logger.error(f"Ошибка создания пула PostgreSQL: {error}")
+                raise
+    return _pool
+
+
+@asynccontextmanager
+async def db_connection() -> AsyncIterator[asyncpg.Connection]:
+    """
+    Выдаёт соединение из общего пула с ограничением времени ожидания `DB_ACQUIRE_TIMEOUT`.
+
+    Yields:
+        asyncpg.Connection: Соединение из пула, возвращается в пул по выходу из блока.
+
+    Raises:
+        asyncio.TimeoutError: Свободное соединение не получено вовремя.
+    """
+    pool = await get_db_pool()
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as connection:
+        yield connection
+
+
+async def close_db_pool() -> None:
+    """
+    Закрывает общий пул соединений, если он был создан.
+    """
+    global _pool
+
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+        logger.info("Пул соединений PostgreSQL закрыт.")
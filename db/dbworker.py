@@ -1,43 +1,49 @@
 import json
 import logging
-import os
 import re
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
-import psycopg2
+import asyncpg
 from dotenv import load_dotenv
-import redis
 
-from db.google_sheets import (
-    append_row_to_google_sheet,
-    update_google_sheet_row,
+from db.database_connection import db_connection
+from db.sheets_outbox import (
+    create_sheets_tables,
+    enqueue_sheet_row,
+    queue_rating_update,
+)
+from db.sheets_sync import create_sheets_sync_table
+from db.user_cache import (
+    cache_history,
+    cache_limit,
+    get_cached_history,
+    get_cached_limit,
+    get_history_version,
+    invalidate_limit,
+    is_user_registered,
+    push_history_entry,
+    update_profile,
 )
-from db.database_connection import get_db_connection
 
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
 INITIAL_LIMIT: int = 6666667
-r = redis.Redis(
-    host=os.getenv("REDIS_HOST"), port=os.getenv("REDIS_PORT"), db=1
-)
 
 
-def create_db() -> None:
+async def create_db() -> None:
     """
     Создает необходимые таблицы в базе данных PostgreSQL.
 
     Raises:
-        psycopg2.ProgrammingError: Ошибка SQL синтаксиса.
-        psycopg2.DatabaseError: Ошибка базы данных.
+        asyncpg.PostgresSyntaxError: Ошибка SQL синтаксиса.
+        asyncpg.PostgresError: Ошибка базы данных.
     """
     try:
-        with get_db_connection() as connection:
-            cursor = connection.cursor()
-
-            cursor.execute(
+        async with db_connection() as connection, connection.transaction():
+            await connection.execute(
                 """
                  CREATE TABLE IF NOT EXISTS users (
                      id SERIAL PRIMARY KEY,
@@ -49,7 +55,7 @@ def create_db() -> None:
              """
             )
 
-            cursor.execute(
+            await connection.execute(
                 """
                 CREATE TABLE IF NOT EXISTS user_history (
                     id SERIAL PRIMARY KEY,
@@ -63,7 +69,7 @@ def create_db() -> None:
             """
             )
 
-            cursor.execute(
+            await connection.execute(
                 f"""
                 CREATE TABLE IF NOT EXISTS user_limit (
                     id SERIAL PRIMARY KEY,
@@ -75,7 +81,7 @@ def create_db() -> None:
             """
             )
 
-            cursor.execute(
+            await connection.execute(
                 """
                 CREATE TABLE IF NOT EXISTS reminder (
                     id SERIAL PRIMARY KEY,
@@ -90,12 +96,21 @@ def create_db() -> None:
             """
             )
 
-            connection.commit()
+            await connection.execute(
+                """
+                CREATE INDEX IF NOT EXISTS user_history_user_id_idx
+                ON user_history (user_id, id DESC)
+            """
+            )
+
+            await create_sheets_tables(connection)
+            await create_sheets_sync_table(connection)
+
             logger.info("Таблицы успешно созданы в базе данных.")
-    except psycopg2.ProgrammingError as error:
+    except asyncpg.PostgresSyntaxError as error:
         logger.error(f"Ошибка SQL синтаксиса при создании таблиц: {error}")
         raise
-    except psycopg2.DatabaseError as error:
+    except asyncpg.PostgresError as error:
         logger.error(f"Ошибка базы данных при создании таблиц: {error}")
         raise
     except Exception as error:
@@ -103,49 +118,53 @@ def create_db() -> None:
         raise
 
 
-def create_user(user_id: int, username: str) -> None:
+async def create_user(user_id: int, username: str) -> None:
     """
     Добавляет нового пользователя в базу данных или обновляет информацию, если пользователь уже существует.
 
+    Уже зарегистрированные пользователи определяются по профилю в Redis без запроса к базе.
+
     Args:
         user_id (int): Уникальный идентификатор пользователя.
         username (str): Имя пользователя.
 
     Raises:
-        psycopg2.IntegrityError: Ошибка целостности данных.
-        psycopg2.DatabaseError: Ошибка базы данных.
+        asyncpg.IntegrityConstraintViolationError: Ошибка целостности данных.
+        asyncpg.PostgresError: Ошибка базы данных.
     """
-    try:
-        with get_db_connection() as connection:
-            cursor = connection.cursor()
+    if await is_user_registered(user_id):
+        return
 
-            cursor.execute(
-                "SELECT * FROM users WHERE user_id = %s", (user_id,)
+    try:
+        async with db_connection() as connection, connection.transaction():
+            inserted = await connection.fetchval(
+                """
+                INSERT INTO users (user_id, username) VALUES ($1, $2)
+                ON CONFLICT (user_id) DO NOTHING
+                RETURNING id
+                """,
+                user_id,
+                username,
             )
-            user = cursor.fetchone()
 
-            if user is None:
-                cursor.execute(
-                    "INSERT INTO users (user_id, username) VALUES (%s, %s)",
-                    (user_id, username),
-                )
-                cursor.execute(
-                    "INSERT INTO reminder (user_id) VALUES (%s)", (user_id,)
+            if inserted is not None:
+                await connection.execute(
+                    "INSERT INTO reminder (user_id) VALUES ($1)", user_id
                 )
-                cursor.execute(
-                    "INSERT INTO user_limit (user_id) VALUES (%s)", (user_id,)
+                await connection.execute(
+                    "INSERT INTO user_limit (user_id) VALUES ($1)", user_id
                 )
-                connection.commit()
                 logger.info(f"Пользователь {user_id} добавлен в базу данных.")
             else:
                 logger.info(
                     f"Пользователь {user_id} уже существует в базе данных."
                 )
-    except psycopg2.IntegrityError as error:
+        await update_profile(user_id, registered="1")
+    except asyncpg.IntegrityConstraintViolationError as error:
         logger.error(
             f"Ошибка целостности данных при добавлении пользователя {user_id}: {error}"
         )
-    except psycopg2.DatabaseError as error:
+    except asyncpg.PostgresError as error:
         logger.error(
             f"Ошибка базы данных при добавлении пользователя {user_id}: {error}"
         )
@@ -155,12 +174,15 @@ def create_user(user_id: int, username: str) -> None:
         )
 
 
-def add_history_entry(
+async def add_history_entry(
     user_id: int, question: str, response: str
 ) -> Optional[int]:
     """
     Добавляет новую запись в историю пользователя.
 
+    Строка для листа `history` ставится в очередь выгрузки в той же транзакции
+    и отправляется в Google Sheets фоновой задачей.
+
     Args:
         user_id (int): Уникальный идентификатор пользователя.
         question (str): Вопрос пользователя.
@@ -170,31 +192,31 @@ def add_history_entry(
         Optional[int]: Идентификатор записи в истории или None при ошибке.
 
     Raises:
-        psycopg2.DatabaseError: Ошибка базы данных.
+        asyncpg.PostgresError: Ошибка базы данных.
     """
     try:
-        with get_db_connection() as connection:
-            question = re.sub(r"[\x00-\x1F\x7F-\x9F]+", "", question)
-            response = re.sub(r"[\x00-\x1F\x7F-\x9F]+", "", response)
-
-            cursor = connection.cursor()
-            cursor.execute(
-                """INSERT INTO user_history (user_id, question, response) 
-                VALUES (%s, %s, %s)
+        question = re.sub(r"[\x00-\x1F\x7F-\x9F]+", "", question)
+        response = re.sub(r"[\x00-\x1F\x7F-\x9F]+", "", response)
+
+        async with db_connection() as connection, connection.transaction():
+            history_id = await connection.fetchval(
+                """INSERT INTO user_history (user_id, question, response)
+                VALUES ($1, $2, $3)
                 RETURNING id;""",
-                (user_id, question, response),
+                user_id,
+                question,
+                response,
             )
-            connection.commit()
-            history_id = cursor.fetchone()[0]
-            logger.info(
-                f"Запись в историю для пользователя {user_id} успешно добавлена."
+            await enqueue_sheet_row(
+                connection, [history_id, question, response], "history"
             )
+        logger.info(
+            f"Запись в историю для пользователя {user_id} успешно добавлена."
+        )
+        await push_history_entry(user_id, question, response)
 
-            row_data = [history_id, question, response]
-            append_row_to_google_sheet(row_data, "history")
-
-            return history_id
-    except psycopg2.DatabaseError as error:
+        return history_id
+    except asyncpg.PostgresError as error:
         logger.error(
             f"Ошибка базы данных при добавлении записи в историю для пользователя {user_id}: {error}"
         )
@@ -206,7 +228,7 @@ def add_history_entry(
         return None
 
 
-def get_user_status_you_tube(user_id: int) -> Optional[int]:
+async def get_user_status_you_tube(user_id: int) -> Optional[int]:
     """
     Получает статус обработке YouTube ссылки.
 
@@ -217,24 +239,21 @@ def get_user_status_you_tube(user_id: int) -> Optional[int]:
         Optional[int]: Статус 0, если видео не отправлено и 1, если видео в обработке.
 
     Raises:
-        psycopg2.DataError: Ошибка данных.
-        psycopg2.DatabaseError: Ошибка базы данных.
+        asyncpg.DataError: Ошибка данных.
+        asyncpg.PostgresError: Ошибка базы данных.
     """
     try:
-        with get_db_connection() as connection:
-            cursor = connection.cursor()
-            cursor.execute(
-                "SELECT status_you_tube FROM users WHERE user_id = %s;",
-                (user_id,),
+        async with db_connection() as connection:
+            return await connection.fetchval(
+                "SELECT status_you_tube FROM users WHERE user_id = $1;",
+                user_id,
             )
-            status = cursor.fetchone()[0]
-            return status
-    except psycopg2.DataError as error:
+    except asyncpg.DataError as error:
         logger.error(
             f"Ошибка данных при получении статуса обработки видео пользователя {user_id}: {error}"
         )
         return None
-    except psycopg2.DatabaseError as error:
+    except asyncpg.PostgresError as error:
         logger.error(
             f"Ошибка базы данных при получении статуса обработки видео пользователя {user_id}: {error}"
         )
@@ -246,9 +265,12 @@ def get_user_status_you_tube(user_id: int) -> Optional[int]:
         return None
 
 
-def get_user_limit(user_id: int) -> Optional[float]:
+async def get_user_limit(user_id: int) -> Optional[float]:
     """
-    Получает текущий лимит пользователя из базы данных.
+    Получает текущий лимит пользователя.
+
+    Лимит читается из Redis; при промахе кеша или после суточного сброса
+    значение берётся из базы данных и записывается в кеш.
 
     Args:
         user_id (int): Уникальный идентификатор пользователя.
@@ -257,42 +279,47 @@ def get_user_limit(user_id: int) -> Optional[float]:
         Optional[float]: Лимит пользователя или None, если лимит не найден.
 
     Raises:
-        psycopg2.DataError: Ошибка данных.
-        psycopg2.DatabaseError: Ошибка базы данных.
+        asyncpg.DataError: Ошибка данных.
+        asyncpg.PostgresError: Ошибка базы данных.
     """
+    cached = await get_cached_limit(user_id)
+    if cached is not None:
+        return cached[0]
+
     try:
-        with get_db_connection() as connection:
-            cursor = connection.cursor()
-            cursor.execute(
-                "SELECT user_limit, created_at FROM user_limit WHERE user_id = %s",
-                (user_id,),
+        async with db_connection() as connection:
+            row = await connection.fetchrow(
+                "SELECT user_limit, created_at FROM user_limit WHERE user_id = $1",
+                user_id,
             )
-            row = cursor.fetchone()
             if row:
                 user_limit, last_update_time = row
                 if datetime.now() - last_update_time > timedelta(days=1):
-                    cursor.execute(
+                    last_update_time = await connection.fetchval(
                         """
                         UPDATE user_limit
-                        SET user_limit = %s, created_at = CURRENT_TIMESTAMP
-                        WHERE user_id = %s
+                        SET user_limit = $1, created_at = CURRENT_TIMESTAMP
+                        WHERE user_id = $2
+                        RETURNING created_at
                         """,
-                        (INITIAL_LIMIT, user_id),
+                        INITIAL_LIMIT,
+                        user_id,
                     )
-                    connection.commit()
                     logger.info(
                         f"Лимит пользователя {user_id} сброшен до {INITIAL_LIMIT}"
                     )
-                    return INITIAL_LIMIT
-                return user_limit
-            logger.warning(f"Лимит для пользователя {user_id} не найден.")
-            return None
-    except psycopg2.DataError as error:
+                    user_limit = INITIAL_LIMIT
+            else:
+                logger.warning(f"Лимит для пользователя {user_id} не найден.")
+                return None
+        await cache_limit(user_id, user_limit, last_update_time)
+        return user_limit
+    except asyncpg.DataError as error:
         logger.error(
             f"Ошибка данных при получении лимита пользователя {user_id}: {error}"
         )
         return None
-    except psycopg2.DatabaseError as error:
+    except asyncpg.PostgresError as error:
         logger.error(
             f"Ошибка базы данных при получении лимита пользователя {user_id}: {error}"
         )
@@ -304,10 +331,13 @@ def get_user_limit(user_id: int) -> Optional[float]:
         return None
 
 
-def get_user_history(user_id: int) -> List[Dict[str, str]]:
+async def get_user_history(user_id: int) -> List[Dict[str, str]]:
     """
     Получает последние 5 записей из истории пользователя.
 
+    Окно истории читается из Redis; при промахе кеша записи берутся из базы
+    данных и сохраняются в кеш.
+
     Args:
         user_id (int): Уникальный идентификатор пользователя.
 
@@ -315,29 +345,34 @@ def get_user_history(user_id: int) -> List[Dict[str, str]]:
         List[Dict[str, str]]: Список записей истории пользователя.
 
     Raises:
-        psycopg2.DatabaseError: Ошибка базы данных.
+        asyncpg.PostgresError: Ошибка базы данных.
     """
+    cached = await get_cached_history(user_id)
+    if cached is not None:
+        return cached
+
+    version = await get_history_version(user_id)
     try:
-        with get_db_connection() as connection:
-            cursor = connection.cursor()
-            cursor.execute(
+        async with db_connection() as connection:
+            rows = await connection.fetch(
                 """
-                SELECT question, response 
+                SELECT question, response
                 FROM user_history
-                WHERE user_id = %s 
+                WHERE user_id = $1
                 ORDER BY id DESC
                 LIMIT 5;
                 """,
-                (user_id,),
+                user_id,
             )
-            history = cursor.fetchall()[::-1]
-            logger.info(
-                f"История для пользователя {user_id} успешно получена из базы данных."
-            )
-            return [
-                {"question": row[0], "response": row[1]} for row in history
-            ]
-    except psycopg2.DatabaseError as error:
+        history = [
+            {"question": row[0], "response": row[1]} for row in rows[::-1]
+        ]
+        logger.info(
+            f"История для пользователя {user_id} успешно получена из базы данных."
+        )
+        await cache_history(user_id, history, version)
+        return history
+    except asyncpg.PostgresError as error:
         logger.error(
             f"Ошибка базы данных при получении истории пользователя {user_id}: {error}"
         )
@@ -349,7 +384,7 @@ def get_user_history(user_id: int) -> List[Dict[str, str]]:
         return []
 
 
-def update_user_limit(user_id: int, limit: int) -> None:
+async def update_user_limit(user_id: int, limit: int) -> None:
     """
     Обновляет лимит пользователя в таблице `user_limit` для указанного `user_id`.
 
@@ -358,45 +393,189 @@ def update_user_limit(user_id: int, limit: int) -> None:
         limit (int): Новый лимит пользователя.
 
     Raises:
-        psycopg2.OperationalError: Ошибка соединения с базой данных PostgreSQL.
-        psycopg2.DatabaseError: Общая ошибка базы данных PostgreSQL.
+        asyncpg.InterfaceError: Ошибка соединения с базой данных PostgreSQL.
+        asyncpg.PostgresError: Общая ошибка базы данных PostgreSQL.
     """
     try:
-        with get_db_connection() as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    "SELECT id FROM users WHERE user_id = %s", (user_id,)
-                )
-                user_exists = cursor.fetchone()
-                if user_exists:
-                    cursor.execute(
-                        "UPDATE user_limit SET user_limit = %s WHERE user_id = %s",
-                        (limit, user_id),
-                    )
-                    connection.commit()
-                    logger.info(
-                        f"Лимит {limit} пользователя {user_id} успешно обновлён в базе данных."
-                    )
-                else:
-                    logger.warning(
-                        f"Пользователь с user_id {user_id} не найден в таблице users."
-                    )
+        async with db_connection() as connection:
+            updated = await connection.fetchrow(
+                """
+                UPDATE user_limit SET user_limit = $1
+                WHERE user_id = $2
+                RETURNING user_limit, created_at
+                """,
+                limit,
+                user_id,
+            )
+        if updated is not None:
+            logger.info(
+                f"Лимит {limit} пользователя {user_id} успешно обновлён в базе данных."
+            )
+            await cache_limit(user_id, updated[0], updated[1])
+        else:
+            logger.warning(
+                f"Пользователь с user_id {user_id} не найден в таблице users."
+            )
 
-    except psycopg2.OperationalError as e:
+    except asyncpg.InterfaceError as e:
         logger.error(
             f"Ошибка соединения с базой данных PostgreSQL при обновлении лимита пользователя {user_id}: {str(e)}"
         )
-    except psycopg2.DatabaseError as e:
+        await invalidate_limit(user_id)
+    except asyncpg.PostgresError as e:
         logger.error(
             f"Ошибка базы данных PostgreSQL при обновлении лимита пользователя {user_id}: {str(e)}"
         )
+        await invalidate_limit(user_id)
     except Exception as e:
         logger.error(
             f"Неизвестная ошибка при обновлении лимита пользователя {user_id}: {str(e)}"
         )
+        await invalidate_limit(user_id)
 
 
-def update_status_you_tube(user_id: int, status: int) -> None:
+async def refund_user_limit(user_id: int, tokens: float) -> Optional[float]:
+    """
+    Атомарно возвращает неиспользованные токены резерва в лимит пользователя.
+
+    Возврат прибавляется к текущему значению без суточного сброса и не
+    поднимает лимит выше `INITIAL_LIMIT`: если резерв сделан до сброса, а
+    возвращается после него, пользователь не получает больше суточного лимита.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+        tokens (float): Количество возвращаемых токенов.
+
+    Returns:
+        Optional[float]: Остаток лимита после возврата или None, если лимит не найден или произошла ошибка.
+
+    Raises:
+        asyncpg.InterfaceError: Ошибка соединения с базой данных PostgreSQL.
+        asyncpg.PostgresError: Общая ошибка базы данных PostgreSQL.
+    """
+    try:
+        async with db_connection() as connection:
+            new_limit = await connection.fetchval(
+                """
+                UPDATE user_limit
+                SET user_limit = LEAST(user_limit + $2, $3)
+                WHERE user_id = $1
+                RETURNING user_limit
+                """,
+                user_id,
+                tokens,
+                INITIAL_LIMIT,
+            )
+        await invalidate_limit(user_id)
+        if new_limit is None:
+            logger.warning(f"Лимит для пользователя {user_id} не найден.")
+            return None
+
+        logger.info(
+            f"В лимит пользователя {user_id} возвращено {tokens} токенов, остаток {new_limit}."
+        )
+        return new_limit
+    except asyncpg.InterfaceError as e:
+        logger.error(
+            f"Ошибка соединения с базой данных PostgreSQL при возврате лимита пользователя {user_id}: {str(e)}"
+        )
+        return None
+    except asyncpg.PostgresError as e:
+        logger.error(
+            f"Ошибка базы данных PostgreSQL при возврате лимита пользователя {user_id}: {str(e)}"
+        )
+        return None
+    except Exception as e:
+        logger.error(
+            f"Неизвестная ошибка при возврате лимита пользователя {user_id}: {str(e)}"
+        )
+        return None
+
+
+async def reserve_user_limit(
+    user_id: int, tokens: float
+) -> Optional[Tuple[float, float]]:
+    """
+    Атомарно резервирует до `tokens` токенов лимита пользователя.
+
+    Резервируется `tokens` или весь остаток, если он меньше; лимит при этом
+    не опускается ниже нуля. Строка лимита блокируется на время запроса,
+    поэтому параллельные резервы одного пользователя выполняются по очереди
+    и вместе не превышают остаток. Если с момента последнего сброса прошло
+    больше суток, лимит в том же запросе сбрасывается до `INITIAL_LIMIT`.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+        tokens (float): Желаемый размер резерва.
+
+    Returns:
+        Optional[Tuple[float, float]]: Зарезервированное количество токенов
+        (0, если лимит исчерпан или не найден) и остаток лимита после
+        резерва; None при ошибке.
+
+    Raises:
+        asyncpg.InterfaceError: Ошибка соединения с базой данных PostgreSQL.
+        asyncpg.PostgresError: Общая ошибка базы данных PostgreSQL.
+    """
+    try:
+        async with db_connection() as connection:
+            updated = await connection.fetchrow(
+                """
+                WITH locked AS (
+                    SELECT
+                        user_id,
+                        CASE
+                            WHEN created_at < LOCALTIMESTAMP - INTERVAL '1 day' THEN $2
+                            ELSE user_limit
+                        END AS balance,
+                        CASE
+                            WHEN created_at < LOCALTIMESTAMP - INTERVAL '1 day' THEN CURRENT_TIMESTAMP
+                            ELSE created_at
+                        END AS reset_at
+                    FROM user_limit
+                    WHERE user_id = $1
+                    FOR UPDATE
+                )
+                UPDATE user_limit
+                SET user_limit = locked.balance - LEAST(locked.balance, $3),
+                    created_at = locked.reset_at
+                FROM locked
+                WHERE user_limit.user_id = locked.user_id
+                    AND locked.balance > 0
+                RETURNING LEAST(locked.balance, $3), user_limit.user_limit, user_limit.created_at
+                """,
+                user_id,
+                INITIAL_LIMIT,
+                tokens,
+            )
+        if updated is None:
+            logger.info(f"Лимит пользователя {user_id} исчерпан или не найден, резерв не выполнен.")
+            return 0.0, 0.0
+
+        reserved, new_limit, reset_at = updated
+        await cache_limit(user_id, new_limit, reset_at, debit=True)
+        logger.info(
+            f"Для пользователя {user_id} зарезервировано {reserved} токенов, остаток {new_limit}."
+        )
+        return reserved, new_limit
+    except asyncpg.InterfaceError as e:
+        logger.error(
+            f"Ошибка соединения с базой данных PostgreSQL при резервировании лимита пользователя {user_id}: {str(e)}"
+        )
+        return None
+    except asyncpg.PostgresError as e:
+        logger.error(
+            f"Ошибка базы данных PostgreSQL при резервировании лимита пользователя {user_id}: {str(e)}"
+        )
+        return None
+    except Exception as e:
+        logger.error(
+            f"Неизвестная ошибка при резервировании лимита пользователя {user_id}: {str(e)}"
+        )
+        return None
+
+
+async def update_status_you_tube(user_id: int, status: int) -> None:
     """
     Обновляет статус обработки видео пользователя в таблице `users` для указанного `user_id`.
 
@@ -405,23 +584,22 @@ def update_status_you_tube(user_id: int, status: int) -> None:
         status (int): Статус обработки видео.
 
     Raises:
-        psycopg2.OperationalError: Ошибка соединения с базой данных PostgreSQL.
-        psycopg2.DatabaseError: Общая ошибка базы данных PostgreSQL.
+        asyncpg.InterfaceError: Ошибка соединения с базой данных PostgreSQL.
+        asyncpg.PostgresError: Общая ошибка базы данных PostgreSQL.
     """
     try:
-        with get_db_connection() as connection:
-            cursor = connection.cursor()
-            cursor.execute(
-                "UPDATE users SET status_you_tube = %s WHERE user_id = %s;",
-                (status, user_id),
+        async with db_connection() as connection:
+            await connection.execute(
+                "UPDATE users SET status_you_tube = $1 WHERE user_id = $2;",
+                status,
+                user_id,
             )
-            connection.commit()
 
-    except psycopg2.OperationalError as e:
+    except asyncpg.InterfaceError as e:
         logger.error(
             f"Ошибка соединения с базой данных PostgreSQL при обновлении статуса обработки видео пользователя {user_id}: {str(e)}"
         )
-    except psycopg2.DatabaseError as e:
+    except asyncpg.PostgresError as e:
         logger.error(
             f"Ошибка базы данных PostgreSQL при обновлении статуса обработки видео пользователя {user_id}: {str(e)}"
         )
@@ -431,7 +609,7 @@ def update_status_you_tube(user_id: int, status: int) -> None:
         )
 
 
-def update_user_language(user_id: int, language: str) -> None:
+async def update_user_language(user_id: int, language: str) -> None:
     """
     Обновляет язык пользователя в базе данных и JSON-файле.
 
@@ -440,35 +618,34 @@ def update_user_language(user_id: int, language: str) -> None:
         language (str): Новый язык пользователя.
 
     Raises:
-        psycopg2.DatabaseError: Ошибка базы данных.
+        asyncpg.PostgresError: Ошибка базы данных.
     """
     try:
-        with get_db_connection() as connection:
-            cursor = connection.cursor()
-            cursor.execute(
-                "SELECT id FROM users WHERE user_id = %s", (user_id,)
+        async with db_connection() as connection:
+            updated = await connection.fetchval(
+                """
+                UPDATE users SET language = $1
+                WHERE user_id = $2
+                RETURNING id
+                """,
+                language,
+                user_id,
             )
-            user_record = cursor.fetchone()
 
-            if user_record:
-                cursor.execute(
-                    "UPDATE users SET language = %s WHERE user_id = %s",
-                    (language, user_id),
-                )
-                connection.commit()
-                logger.info(
-                    f"Язык пользователя {user_id} успешно обновлён в базе данных."
-                )
+        if updated is not None:
+            logger.info(
+                f"Язык пользователя {user_id} успешно обновлён в базе данных."
+            )
 
-                r.hset(f"user:{user_id}", "language", language)
-                logger.info(
-                    f"Язык пользователя {user_id} успешно обновлён в Redis."
-                )
-            else:
-                logger.warning(
-                    f"Пользователь с user_id {user_id} не найден в базе данных."
-                )
-    except psycopg2.DatabaseError as error:
+            await update_profile(user_id, language=language)
+            logger.info(
+                f"Язык пользователя {user_id} успешно обновлён в Redis."
+            )
+        else:
+            logger.warning(
+                f"Пользователь с user_id {user_id} не найден в базе данных."
+            )
+    except asyncpg.PostgresError as error:
         logger.error(
             f"Ошибка базы данных при обновлении языка пользователя {user_id}: {error}"
         )
@@ -478,38 +655,35 @@ def update_user_language(user_id: int, language: str) -> None:
         )
 
 
-def update_dialog_score(rating: str, response_id: int) -> None:
+async def update_dialog_score(rating: str, response_id: int) -> None:
     """
     Обновляет оценку диалога для указанной записи в истории.
 
+    Оценка ставится в очередь и записывается в Google Sheets фоновой задачей.
+
     Args:
         rating (str): Оценка ("👍" или "👎" или "😐").
         response_id (int): Идентификатор записи в истории.
 
     Raises:
-        psycopg2.DatabaseError: Ошибка базы данных.
+        asyncpg.PostgresError: Ошибка базы данных.
     """
     try:
-        with get_db_connection() as connection:
-            cursor = connection.cursor()
-            cursor.execute(
-                "SELECT * FROM user_history WHERE id = %s", (response_id,)
-            )
-
-            cursor.execute(
+        async with db_connection() as connection:
+            await connection.execute(
                 """
                 UPDATE user_history
-                SET dialog_score = %s
-                WHERE id = %s
+                SET dialog_score = $1, score_updated_at = CURRENT_TIMESTAMP
+                WHERE id = $2
                 """,
-                (rating, response_id),
+                rating,
+                response_id,
             )
-            connection.commit()
-            logger.info(f"Оценка для записи {response_id} успешно обновлена.")
+        logger.info(f"Оценка для записи {response_id} успешно обновлена.")
 
-            update_google_sheet_row(response_id, rating)
+        queue_rating_update(response_id, rating)
 
-    except psycopg2.DatabaseError as error:
+    except asyncpg.PostgresError as error:
         logger.error(
             f"Ошибка базы данных при обновлении оценки диалога для записи {response_id}: {error}"
         )
@@ -1,7 +1,10 @@
 import logging
 import os
+import re
+from datetime import datetime
 import psycopg2
-from typing import List, Optional
+from psycopg2.extras import execute_values
+from typing import Dict, List, Optional
 
 from dotenv import load_dotenv
 from google.oauth2.service_account import Credentials
@@ -124,7 +127,7 @@ def get_data_user_from_psycopg2(table_name: str) -> List[List[Optional[str]]]:
 
 def append_data_to_sheet(
     service: object, data: List[List[Optional[str]]], sheet_name: str
-) -> None:
+) -> Optional[dict]:
     """
     Добавляет данные в Google Sheets.
 
@@ -133,6 +136,9 @@ def append_data_to_sheet(
         data (List[List[Optional[str]]]): Данные для добавления.
         sheet_name (str): Имя листа или диапазон.
 
+    Returns:
+        Optional[dict]: Ответ API или None в случае ошибки.
+
     Raises:
         googleapiclient.errors.HttpError: Ошибка HTTP при взаимодействии с Google Sheets API.
         Exception: Общая ошибка при добавлении данных в Google Sheets.
@@ -154,12 +160,14 @@ def append_data_to_sheet(
         logger.info(
             f"{result.get('updates').get('updatedCells')} ячеек добавлено в {sheet_name}."
         )
+        return result
     except HttpError as e:
         logger.error(
             f"Ошибка HTTP при добавлении данных в Google Sheets: {str(e)}"
         )
     except Exception as e:
         logger.error(f"Ошибка при добавлении данных в Google Sheets: {str(e)}")
+    return None
 
 
 def append_row_to_google_sheet(
@@ -204,6 +212,44 @@ def append_row_to_google_sheet(
         logger.error(f"Ошибка при добавлении строки в Google Sheets: {str(e)}")
 
 
+def append_rows_to_google_sheet(
+    service: object, rows: List[List[Optional[str]]], sheet_name: str
+) -> dict:
+    """
+    Добавляет пакет строк в Google Sheets одним запросом `values.append`.
+
+    В отличие от `append_row_to_google_sheet` ошибки не подавляются, чтобы
+    вызывающая сторона могла повторить отправку.
+
+    Args:
+        service (object): Объект сервиса Google Sheets API.
+        rows (List[List[Optional[str]]]): Строки для добавления.
+        sheet_name (str): Имя листа или диапазон.
+
+    Returns:
+        dict: Ответ API, включая `updates.updatedRange`.
+
+    Raises:
+        googleapiclient.errors.HttpError: Ошибка HTTP при взаимодействии с Google Sheets API.
+    """
+    result = (
+        service.spreadsheets()
+        .values()
+        .append(
+            spreadsheetId=SPREADSHEET_ID,
+            range=sheet_name,
+            valueInputOption="RAW",
+            insertDataOption="INSERT_ROWS",
+            body={"values": rows},
+        )
+        .execute()
+    )
+    logger.info(
+        f"{result.get('updates', {}).get('updatedCells')} ячеек добавлено в лист {sheet_name}."
+    )
+    return result
+
+
 def get_google_sheet_data(
     sheet_name: str, service: object = get_google_sheets_service()
 ) -> List[List[str]]:
@@ -238,62 +284,108 @@ def get_google_sheet_data(
         return []
 
 
-def update_google_sheet_row(
-    response_id: int,
-    new_value: str,
-    sheet_name: str = "history",
-    column_index: int = 3,
-    service: object = get_google_sheets_service(),
-) -> None:
+def batch_update_google_sheet(
+    service: object, data: List[Dict[str, object]]
+) -> dict:
     """
-    Обновляет значение в указанной строке Google Sheets по response_id.
+    Обновляет несколько диапазонов Google Sheets одним запросом `values.batchUpdate`.
 
     Args:
-        response_id (int): Идентификатор записи для поиска.
-        new_value (str): Новое значение для обновления.
-        sheet_name (str): Имя листа или диапазон.
-        column_index (int): Индекс столбца (начинается с 0).
         service (object): Объект сервиса Google Sheets API.
+        data (List[Dict[str, object]]): Диапазоны и значения в формате `ValueRange`.
+
+    Returns:
+        dict: Ответ API.
 
     Raises:
-        HttpError: Ошибка HTTP при обновлении строки.
-        Exception: Общая ошибка при обновлении строки Google Sheets.
+        googleapiclient.errors.HttpError: Ошибка HTTP при взаимодействии с Google Sheets API.
     """
-    try:
-        sheet_data = get_google_sheet_data(
-            sheet_name="history", service=get_google_sheets_service()
+    result = (
+        service.spreadsheets()
+        .values()
+        .batchUpdate(
+            spreadsheetId=SPREADSHEET_ID,
+            body={"valueInputOption": "RAW", "data": data},
         )
-        updated = False
+        .execute()
+    )
+    logger.info(
+        f"{result.get('totalUpdatedCells')} ячеек обновлено в Google Sheets."
+    )
+    return result
+
 
-        for i, row in enumerate(sheet_data):
-            if len(row) > 0 and str(row[0]) == str(response_id):
-                if len(row) <= column_index:
-                    row.extend([""] * (column_index - len(row) + 1))
-                row[column_index] = new_value
+def first_row_of_range(updated_range: str) -> Optional[int]:
+    """
+    Возвращает номер первой строки диапазона из ответа API, например `history!A120:C135` → 120.
 
-                service.spreadsheets().values().update(
-                    spreadsheetId=SPREADSHEET_ID,
-                    range=f"{sheet_name}!A{i+1}",
-                    valueInputOption="RAW",
-                    body={"values": [row]},
-                ).execute()
+    Args:
+        updated_range (str): Диапазон в A1-нотации.
 
-                logger.info(
-                    f"Строка с response_id {response_id} успешно обновлена."
-                )
-                updated = True
-                break
+    Returns:
+        Optional[int]: Номер строки или None, если диапазон не распознан.
+    """
+    match = re.search(r"![A-Z]+(\d+)", updated_range or "")
+    return int(match.group(1)) if match else None
 
-        if not updated:
-            logger.warning(
-                f"Строка с response_id {response_id} не найдена в Google Sheets."
-            )
-    except HttpError as e:
-        logger.error(
-            f"Ошибка HTTP при обновлении строки в Google Sheets: {str(e)}"
+
+def record_full_sync(
+    sheet_name: str,
+    response_ids: List[int],
+    first_row: int,
+    synced_at: datetime,
+) -> None:
+    """
+    Фиксирует результат полной выгрузки листа одной транзакцией.
+
+    Перестраивает индекс `response_id → номер строки`, удаляет из очереди
+    выгрузки уже выгруженные строки и сохраняет отметку синхронизации для
+    последующих инкрементальных запусков.
+
+    Args:
+        sheet_name (str): Имя листа.
+        response_ids (List[int]): Идентификаторы записей в порядке строк листа.
+        first_row (int): Номер строки листа, с которой начинаются записи.
+        synced_at (datetime): Момент начала выгрузки.
+
+    Raises:
+        psycopg2.DatabaseError: Ошибка при записи в базу данных.
+    """
+    last_id = max(response_ids)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "DELETE FROM google_sheet_index WHERE sheet_name = %s;",
+            (sheet_name,),
         )
-    except Exception as e:
-        logger.error(f"Ошибка при обновлении строки в Google Sheets: {str(e)}")
+        execute_values(
+            cursor,
+            "INSERT INTO google_sheet_index (sheet_name, response_id, row_number) VALUES %s",
+            [
+                (sheet_name, response_id, first_row + offset)
+                for offset, response_id in enumerate(response_ids)
+            ],
+        )
+        cursor.execute(
+            """
+            DELETE FROM sheets_outbox
+            WHERE sheet_name = %s AND (row_data->>0)::bigint <= %s;
+            """,
+            (sheet_name, last_id),
+        )
+        cursor.execute(
+            """
+            INSERT INTO google_sheet_sync (sheet_name, last_synced_id, last_score_sync_at)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (sheet_name) DO UPDATE
+            SET last_synced_id = EXCLUDED.last_synced_id,
+                last_score_sync_at = EXCLUDED.last_score_sync_at;
+            """,
+            (sheet_name, last_id, synced_at),
+        )
+    logger.info(
+        f"Индекс листа {sheet_name} перестроен: {len(response_ids)} строк."
+    )
 
 
 def google_sheets() -> None:
@@ -301,7 +393,11 @@ def google_sheets() -> None:
     Синхронизирует данные из базы данных PostgreSQL с Google Sheets.
 
     Получает данные из базы данных, очищает соответствующий лист в Google Sheets,
-    а затем добавляет данные о пользовательской истории.
+    а затем добавляет данные о пользовательской истории и перестраивает индекс
+    строк листа для обновления оценок.
+
+    Полная выгрузка используется в режиме `GOOGLE_SHEETS_SYNC_MODE=full` и при
+    первом запуске инкрементальной синхронизации (см. `db.sheets_sync`).
 
     Raises:
         ConnectionError: Ошибка при подключении к Google Sheets.
@@ -309,6 +405,7 @@ def google_sheets() -> None:
         Exception: Неопознанная ошибка при синхронизации с Google Sheets.
     """
     try:
+        synced_at = datetime.now()
         service = get_google_sheets_service()
 
         if service:
@@ -317,7 +414,19 @@ def google_sheets() -> None:
             data_user_history = get_data_user_from_psycopg2("user_history")
 
             if data_user_history:
-                append_data_to_sheet(service, data_user_history, "history")
+                result = append_data_to_sheet(
+                    service, data_user_history, "history"
+                )
+                first_row = first_row_of_range(
+                    (result or {}).get("updates", {}).get("updatedRange")
+                )
+                if first_row is not None:
+                    record_full_sync(
+                        "history",
+                        [row[0] for row in data_user_history],
+                        first_row,
+                        synced_at,
+                    )
             else:
                 logger.info(
                     "Нет данных с отрицательными оценками для синхронизации."
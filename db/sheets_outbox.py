@@ -0,0 +1,406 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+from dotenv import load_dotenv
+from googleapiclient.errors import HttpError
+
+from db.database_connection import db_connection
+from db.google_sheets import (
+    append_rows_to_google_sheet,
+    batch_update_google_sheet,
+    first_row_of_range,
+    get_google_sheets_service,
+)
+from src.services import metrics
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+SHEETS_OUTBOX_BATCH_SIZE: int = int(os.getenv("SHEETS_OUTBOX_BATCH_SIZE", "200"))
+SHEETS_OUTBOX_FLUSH_INTERVAL: float = float(
+    os.getenv("SHEETS_OUTBOX_FLUSH_INTERVAL", "10")
+)
+SHEETS_OUTBOX_RETRY_BASE: float = float(os.getenv("SHEETS_OUTBOX_RETRY_BASE", "5"))
+SHEETS_OUTBOX_RETRY_MAX: float = float(os.getenv("SHEETS_OUTBOX_RETRY_MAX", "600"))
+SHEETS_OUTBOX_LEASE: int = 120
+RATING_COLUMN: str = "D"
+RATING_MAX_ATTEMPTS: int = 30
+
+_flush_requested = asyncio.Event()
+_enqueued_since_flush: int = 0
+_service: Optional[object] = None
+_pending_ratings: Dict[int, Tuple[str, int]] = {}
+
+
+async def create_sheets_tables(connection: asyncpg.Connection) -> None:
+    """
+    Создаёт таблицу очереди строк для выгрузки в Google Sheets и индекс
+    `response_id → номер строки листа`.
+
+    Args:
+        connection (asyncpg.Connection): Соединение с базой данных.
+    """
+    await connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sheets_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            sheet_name TEXT NOT NULL,
+            row_data JSONB NOT NULL,
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    await connection.execute(
+        """
+        CREATE INDEX IF NOT EXISTS sheets_outbox_next_attempt_idx
+        ON sheets_outbox (next_attempt_at, id)
+    """
+    )
+    await connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS google_sheet_index (
+            sheet_name TEXT NOT NULL,
+            response_id BIGINT NOT NULL,
+            row_number INTEGER NOT NULL,
+            PRIMARY KEY (sheet_name, response_id)
+        )
+    """
+    )
+
+
+async def enqueue_sheet_row(
+    connection: asyncpg.Connection,
+    row_data: List[Optional[str]],
+    sheet_name: str,
+) -> None:
+    """
+    Ставит строку в очередь на выгрузку в Google Sheets.
+
+    Вызывается в той же транзакции, что и запись строки в базу, поэтому строка
+    не теряется при падении процесса до отправки.
+
+    Args:
+        connection (asyncpg.Connection): Соединение с открытой транзакцией.
+        row_data (List[Optional[str]]): Данные строки.
+        sheet_name (str): Имя листа.
+    """
+    global _enqueued_since_flush
+
+    await connection.execute(
+        "INSERT INTO sheets_outbox (sheet_name, row_data) VALUES ($1, $2::jsonb)",
+        sheet_name,
+        json.dumps(row_data, ensure_ascii=False),
+    )
+    _enqueued_since_flush += 1
+    metrics.increment("sheets_outbox.enqueued")
+    if _enqueued_since_flush >= SHEETS_OUTBOX_BATCH_SIZE:
+        _flush_requested.set()
+
+
+def _retry_delay(attempts: int) -> float:
+    """
+    Экспоненциальная задержка перед повторной отправкой.
+    """
+    return min(
+        SHEETS_OUTBOX_RETRY_MAX,
+        SHEETS_OUTBOX_RETRY_BASE * 2 ** max(0, attempts - 1),
+    )
+
+
+async def _get_service() -> object:
+    global _service
+
+    if _service is None:
+        _service = await asyncio.to_thread(get_google_sheets_service)
+    return _service
+
+
+async def _claim_batch(limit: int) -> List[asyncpg.Record]:
+    """
+    Забирает пакет готовых к отправке строк, продлевая им срок следующей попытки.
+
+    Если процесс упадёт во время отправки, строки снова станут доступны
+    по истечении `SHEETS_OUTBOX_LEASE` секунд.
+    """
+    async with db_connection() as connection:
+        return await connection.fetch(
+            """
+            UPDATE sheets_outbox
+            SET attempts = attempts + 1,
+                next_attempt_at = LOCALTIMESTAMP + make_interval(secs => $2)
+            WHERE id IN (
+                SELECT id FROM sheets_outbox
+                WHERE next_attempt_at <= LOCALTIMESTAMP
+                ORDER BY id
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, sheet_name, row_data, attempts
+            """,
+            limit,
+            SHEETS_OUTBOX_LEASE,
+        )
+
+
+async def _append_batch(
+    sheet_name: str, records: List[asyncpg.Record]
+) -> None:
+    """
+    Отправляет строки одного листа одним запросом `values.append`, записывает
+    их номера строк в индекс по `updatedRange` ответа и удаляет их из очереди.
+    """
+    service = await _get_service()
+    rows = [json.loads(record["row_data"]) for record in records]
+    result = await asyncio.to_thread(
+        append_rows_to_google_sheet, service, rows, sheet_name
+    )
+    first_row = first_row_of_range(
+        result.get("updates", {}).get("updatedRange")
+    )
+
+    async with db_connection() as connection, connection.transaction():
+        if first_row is not None:
+            await connection.executemany(
+                """
+                INSERT INTO google_sheet_index (sheet_name, response_id, row_number)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (sheet_name, response_id)
+                DO UPDATE SET row_number = EXCLUDED.row_number
+                """,
+                [
+                    (sheet_name, int(row[0]), first_row + offset)
+                    for offset, row in enumerate(rows)
+                ],
+            )
+        else:
+            logger.warning(
+                f"Не удалось определить строки листа {sheet_name} по ответу API, индекс не обновлён."
+            )
+        await connection.execute(
+            "DELETE FROM sheets_outbox WHERE id = ANY($1::bigint[])",
+            [record["id"] for record in records],
+        )
+
+
+async def _schedule_retry(records: List[asyncpg.Record]) -> None:
+    """
+    Откладывает повторную отправку строк с экспоненциальной задержкой.
+    """
+    async with db_connection() as connection:
+        await connection.executemany(
+            """
+            UPDATE sheets_outbox
+            SET next_attempt_at = LOCALTIMESTAMP + make_interval(secs => $2)
+            WHERE id = $1
+            """,
+            [
+                (record["id"], _retry_delay(record["attempts"]))
+                for record in records
+            ],
+        )
+
+
+async def update_outbox_depth() -> int:
+    """
+    Обновляет метрику глубины очереди.
+
+    Returns:
+        int: Количество строк, ожидающих выгрузки.
+    """
+    async with db_connection() as connection:
+        depth = await connection.fetchval("SELECT COUNT(*) FROM sheets_outbox")
+    metrics.gauge("sheets_outbox.depth", depth)
+    return depth
+
+
+async def flush_sheets_outbox(limit: int = SHEETS_OUTBOX_BATCH_SIZE) -> int:
+    """
+    Выгружает в Google Sheets один пакет строк из очереди.
+
+    Строки группируются по листам с сохранением порядка, каждый лист
+    отправляется одним запросом. При ошибке строки листа остаются в очереди
+    и будут отправлены повторно с экспоненциальной задержкой.
+
+    Args:
+        limit (int): Максимальный размер пакета.
+
+    Returns:
+        int: Количество успешно выгруженных строк.
+    """
+    global _enqueued_since_flush
+
+    _enqueued_since_flush = 0
+    records = await _claim_batch(limit)
+    if not records:
+        return 0
+
+    by_sheet: Dict[str, List[asyncpg.Record]] = {}
+    for record in records:
+        by_sheet.setdefault(record["sheet_name"], []).append(record)
+
+    flushed = 0
+    for sheet_name, sheet_records in by_sheet.items():
+        started = time.perf_counter()
+        try:
+            await _append_batch(sheet_name, sheet_records)
+            flushed += len(sheet_records)
+            metrics.observe(
+                "sheets_outbox.flush_latency_ms",
+                (time.perf_counter() - started) * 1000,
+            )
+            metrics.increment("sheets_outbox.flushed_rows", len(sheet_records))
+            logger.info(
+                f"В лист {sheet_name} выгружено {len(sheet_records)} строк из очереди."
+            )
+        except HttpError as e:
+            metrics.increment("sheets_outbox.failures")
+            logger.error(
+                f"Ошибка HTTP при выгрузке {len(sheet_records)} строк в лист {sheet_name}: {str(e)}"
+            )
+            await _schedule_retry(sheet_records)
+        except Exception as e:
+            metrics.increment("sheets_outbox.failures")
+            logger.error(
+                f"Ошибка при выгрузке {len(sheet_records)} строк в лист {sheet_name}: {str(e)}"
+            )
+            await _schedule_retry(sheet_records)
+
+    return flushed
+
+
+def queue_rating_update(response_id: int, rating: str) -> None:
+    """
+    Ставит оценку диалога в очередь на запись в лист `history`.
+
+    Повторные оценки одной записи до отправки схлопываются: в лист попадёт последняя.
+
+    Args:
+        response_id (int): Идентификатор записи в истории.
+        rating (str): Оценка.
+    """
+    _pending_ratings[response_id] = (rating, 0)
+    metrics.gauge("sheets_ratings.pending", len(_pending_ratings))
+
+
+def _requeue_ratings(ratings: Dict[int, Tuple[str, int]]) -> None:
+    """
+    Возвращает оценки в очередь, не затирая более новые оценки тех же записей.
+    """
+    for response_id, (rating, attempts) in ratings.items():
+        if attempts >= RATING_MAX_ATTEMPTS:
+            logger.warning(
+                f"Строка с response_id {response_id} не найдена в индексе Google Sheets, оценка отброшена."
+            )
+            continue
+        _pending_ratings.setdefault(response_id, (rating, attempts))
+
+
+async def flush_rating_updates(sheet_name: str = "history") -> int:
+    """
+    Записывает накопленные оценки в Google Sheets одним запросом `values.batchUpdate`.
+
+    Номера строк берутся из индекса `google_sheet_index`, поэтому лист не
+    скачивается. Оценки записей, строки которых ещё в очереди выгрузки,
+    остаются в очереди до следующего запуска.
+
+    Args:
+        sheet_name (str): Имя листа.
+
+    Returns:
+        int: Количество записанных оценок.
+    """
+    if not _pending_ratings:
+        return 0
+
+    pending = dict(_pending_ratings)
+    _pending_ratings.clear()
+
+    async with db_connection() as connection:
+        rows = await connection.fetch(
+            """
+            SELECT response_id, row_number FROM google_sheet_index
+            WHERE sheet_name = $1 AND response_id = ANY($2::bigint[])
+            """,
+            sheet_name,
+            list(pending),
+        )
+    row_numbers = {row["response_id"]: row["row_number"] for row in rows}
+
+    unresolved = {
+        response_id: (rating, attempts + 1)
+        for response_id, (rating, attempts) in pending.items()
+        if response_id not in row_numbers
+    }
+    data = [
+        {
+            "range": f"{sheet_name}!{RATING_COLUMN}{row_numbers[response_id]}",
+            "values": [[rating]],
+        }
+        for response_id, (rating, _) in pending.items()
+        if response_id in row_numbers
+    ]
+
+    try:
+        if data:
+            started = time.perf_counter()
+            service = await _get_service()
+            await asyncio.to_thread(batch_update_google_sheet, service, data)
+            metrics.observe(
+                "sheets_ratings.flush_latency_ms",
+                (time.perf_counter() - started) * 1000,
+            )
+            metrics.increment("sheets_ratings.flushed", len(data))
+            logger.info(f"В лист {sheet_name} записано {len(data)} оценок.")
+    except Exception:
+        metrics.increment("sheets_ratings.failures")
+        _requeue_ratings(
+            {
+                response_id: rating
+                for response_id, rating in pending.items()
+                if response_id in row_numbers
+            }
+        )
+        raise
+    finally:
+        _requeue_ratings(unresolved)
+        metrics.gauge("sheets_ratings.pending", len(_pending_ratings))
+
+    return len(data)
+
+
+async def run_sheets_outbox_worker() -> None:
+    """
+    Фоновая выгрузка очереди и накопленных оценок в Google Sheets.
+
+    Очередь выгружается каждые `SHEETS_OUTBOX_FLUSH_INTERVAL` секунд или раньше,
+    когда в неё добавлено `SHEETS_OUTBOX_BATCH_SIZE` строк. Полные пакеты
+    выгружаются подряд, пока очередь не опустеет, затем записываются оценки.
+    """
+    logger.info("Фоновая выгрузка очереди Google Sheets запущена.")
+    while True:
+        try:
+            await asyncio.wait_for(
+                _flush_requested.wait(), timeout=SHEETS_OUTBOX_FLUSH_INTERVAL
+            )
+        except asyncio.TimeoutError:
+            pass
+        _flush_requested.clear()
+
+        try:
+            while await flush_sheets_outbox() >= SHEETS_OUTBOX_BATCH_SIZE:
+                pass
+            await update_outbox_depth()
+            await flush_rating_updates()
+        except asyncpg.PostgresError as e:
+            logger.error(f"Ошибка базы данных при выгрузке очереди Google Sheets: {e}")
+        except (OSError, asyncio.TimeoutError) as e:
+            logger.error(f"Ошибка соединения при выгрузке очереди Google Sheets: {e}")
+        except Exception as e:
+            logger.error(f"Неизвестная ошибка при выгрузке очереди Google Sheets: {e}")
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+import asyncpg
+from dotenv import load_dotenv
+
+from db.database_connection import db_connection
+from db.google_sheets import google_sheets, max_sheet_length
+from db.sheets_outbox import queue_rating_update
+from src.services import metrics
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+GOOGLE_SHEETS_SYNC_MODE: str = os.getenv(
+    "GOOGLE_SHEETS_SYNC_MODE", "incremental"
+).lower()
+GOOGLE_SHEETS_SYNC_PAGE_SIZE: int = int(
+    os.getenv("GOOGLE_SHEETS_SYNC_PAGE_SIZE", "500")
+)
+SHEET_NAME: str = "history"
+
+
+async def create_sheets_sync_table(connection: asyncpg.Connection) -> None:
+    """
+    Создаёт таблицу отметок синхронизации листов и столбец времени изменения оценки.
+
+    Args:
+        connection (asyncpg.Connection): Соединение с базой данных.
+    """
+    await connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS google_sheet_sync (
+            sheet_name TEXT PRIMARY KEY,
+            last_synced_id BIGINT NOT NULL DEFAULT 0,
+            last_score_sync_at TIMESTAMP NOT NULL
+        )
+    """
+    )
+    await connection.execute(
+        "ALTER TABLE user_history ADD COLUMN IF NOT EXISTS score_updated_at TIMESTAMP"
+    )
+    await connection.execute(
+        """
+        CREATE INDEX IF NOT EXISTS user_history_score_updated_at_idx
+        ON user_history (score_updated_at)
+        WHERE score_updated_at IS NOT NULL
+    """
+    )
+
+
+async def _get_sync_state(
+    connection: asyncpg.Connection,
+) -> Optional[asyncpg.Record]:
+    return await connection.fetchrow(
+        """
+        SELECT last_synced_id, last_score_sync_at
+        FROM google_sheet_sync WHERE sheet_name = $1
+        """,
+        SHEET_NAME,
+    )
+
+
+async def _sync_new_rows(last_synced_id: int) -> int:
+    """
+    Ставит в очередь выгрузки записи истории новее отметки, которых ещё нет в листе.
+
+    Записи читаются страницами через серверный курсор. Каждая страница
+    ставится в очередь вместе с продвижением отметки в одной транзакции,
+    поэтому прерванная синхронизация продолжится с последней страницы.
+
+    Args:
+        last_synced_id (int): Идентификатор последней синхронизированной записи.
+
+    Returns:
+        int: Количество поставленных в очередь строк.
+    """
+    queued = 0
+    async with db_connection() as reader, reader.transaction():
+        cursor = await reader.cursor(
+            """
+            SELECT h.id, h.question, h.response, h.dialog_score,
+                   (
+                       EXISTS (
+                           SELECT 1 FROM google_sheet_index i
+                           WHERE i.sheet_name = $2 AND i.response_id = h.id
+                       )
+                       OR EXISTS (
+                           SELECT 1 FROM sheets_outbox o
+                           WHERE o.sheet_name = $2
+                             AND (o.row_data->>0)::bigint = h.id
+                       )
+                   ) AS exported
+            FROM user_history h
+            WHERE h.id > $1
+            ORDER BY h.id
+            """,
+            last_synced_id,
+            SHEET_NAME,
+        )
+        while True:
+            page = await cursor.fetch(GOOGLE_SHEETS_SYNC_PAGE_SIZE)
+            if not page:
+                break
+
+            rows = [
+                [
+                    item[:max_sheet_length] if isinstance(item, str) else item
+                    for item in (
+                        record["id"],
+                        record["question"],
+                        record["response"],
+                        record["dialog_score"],
+                    )
+                ]
+                for record in page
+                if not record["exported"]
+            ]
+            async with db_connection() as writer, writer.transaction():
+                await writer.executemany(
+                    "INSERT INTO sheets_outbox (sheet_name, row_data) VALUES ($1, $2::jsonb)",
+                    [
+                        (SHEET_NAME, json.dumps(row, ensure_ascii=False))
+                        for row in rows
+                    ],
+                )
+                await writer.execute(
+                    """
+                    UPDATE google_sheet_sync SET last_synced_id = $2
+                    WHERE sheet_name = $1
+                    """,
+                    SHEET_NAME,
+                    page[-1]["id"],
+                )
+            queued += len(rows)
+    return queued
+
+
+async def _sync_changed_scores(last_score_sync_at: datetime) -> int:
+    """
+    Ставит в очередь оценки, изменённые после отметки синхронизации.
+
+    Args:
+        last_score_sync_at (datetime): Время предыдущей синхронизации оценок.
+
+    Returns:
+        int: Количество поставленных в очередь оценок.
+    """
+    changed = 0
+    async with db_connection() as connection, connection.transaction():
+        synced_at = await connection.fetchval("SELECT LOCALTIMESTAMP")
+        cursor = await connection.cursor(
+            """
+            SELECT id, dialog_score FROM user_history
+            WHERE score_updated_at > $1
+            ORDER BY id
+            """,
+            last_score_sync_at,
+        )
+        while True:
+            page = await cursor.fetch(GOOGLE_SHEETS_SYNC_PAGE_SIZE)
+            if not page:
+                break
+            for record in page:
+                queue_rating_update(record["id"], record["dialog_score"])
+            changed += len(page)
+
+        await connection.execute(
+            """
+            UPDATE google_sheet_sync SET last_score_sync_at = $2
+            WHERE sheet_name = $1
+            """,
+            SHEET_NAME,
+            synced_at,
+        )
+    return changed
+
+
+async def sync_google_sheets() -> None:
+    """
+    Синхронизирует лист `history` с базой данных в фоне после запуска бота.
+
+    В режиме `GOOGLE_SHEETS_SYNC_MODE=full` лист очищается и выгружается
+    целиком. В режиме `incremental` (по умолчанию) в очередь выгрузки
+    попадают только записи новее отметки `google_sheet_sync` и оценки,
+    изменённые после прошлой синхронизации; при отсутствии отметки
+    выполняется полная выгрузка, которая её создаёт.
+    """
+    started = time.perf_counter()
+    try:
+        async with db_connection() as connection:
+            state = await _get_sync_state(connection)
+
+        if GOOGLE_SHEETS_SYNC_MODE == "full" or state is None:
+            logger.info("Полная синхронизация Google Sheets запущена.")
+            await asyncio.to_thread(google_sheets)
+        else:
+            logger.info(
+                f"Инкрементальная синхронизация Google Sheets с записи {state['last_synced_id']}."
+            )
+            queued = await _sync_new_rows(state["last_synced_id"])
+            changed = await _sync_changed_scores(state["last_score_sync_at"])
+            logger.info(
+                f"Инкрементальная синхронизация Google Sheets: {queued} новых строк, {changed} изменённых оценок."
+            )
+
+        metrics.observe(
+            "sheets_sync.duration_ms", (time.perf_counter() - started) * 1000
+        )
+    except asyncpg.PostgresError as e:
+        logger.error(f"Ошибка базы данных при синхронизации с Google Sheets: {e}")
+    except Exception as e:
+        logger.error(f"Неизвестная ошибка при синхронизации с Google Sheets: {e}")
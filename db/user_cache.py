@@ -0,0 +1,322 @@
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError, WatchError
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+USER_CACHE_TTL: int = int(os.getenv("USER_CACHE_TTL", "86400"))
+HISTORY_WINDOW: int = 5
+LIMIT_RESET_INTERVAL: timedelta = timedelta(days=1)
+
+redis_client = aioredis.Redis(
+    host=os.getenv("REDIS_HOST"),
+    port=os.getenv("REDIS_PORT"),
+    db=1,
+    decode_responses=True,
+)
+
+# Списание записывается в кеш, только если оно не устарело: в рамках одного
+# периода лимит при списании может только уменьшаться, поэтому ответ
+# параллельного запроса, пришедший позже, не перезапишет более свежий остаток.
+_DEBIT_SCRIPT = redis_client.register_script(
+    """
+    local reset_at = redis.call('HGET', KEYS[1], 'reset_at')
+    if reset_at == ARGV[2] then
+        local cached = tonumber(redis.call('HGET', KEYS[1], 'limit'))
+        if cached ~= nil and cached <= tonumber(ARGV[1]) then
+            return 0
+        end
+    elseif reset_at and reset_at > ARGV[2] then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], 'limit', ARGV[1], 'reset_at', ARGV[2])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return 1
+    """
+)
+
+
+def _profile_key(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def _limit_key(user_id: int) -> str:
+    return f"user:{user_id}:limit"
+
+
+def _history_key(user_id: int) -> str:
+    return f"user:{user_id}:history"
+
+
+def _history_version_key(user_id: int) -> str:
+    return f"user:{user_id}:history:version"
+
+
+def _limit_ttl(reset_at: datetime) -> int:
+    """
+    Время жизни записи лимита: не дольше `USER_CACHE_TTL` и не дольше момента суточного сброса.
+    """
+    until_reset = reset_at + LIMIT_RESET_INTERVAL - datetime.now()
+    return max(1, min(USER_CACHE_TTL, int(until_reset.total_seconds())))
+
+
+async def get_cached_limit(user_id: int) -> Optional[Tuple[float, datetime]]:
+    """
+    Получает лимит пользователя и время последнего сброса из Redis.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+
+    Returns:
+        Optional[Tuple[float, datetime]]: Лимит и время сброса или None, если записи нет,
+        она устарела или Redis недоступен.
+    """
+    try:
+        cached = await redis_client.hgetall(_limit_key(user_id))
+        if not cached:
+            return None
+
+        reset_at = datetime.fromisoformat(cached["reset_at"])
+        if datetime.now() - reset_at > LIMIT_RESET_INTERVAL:
+            return None
+        return float(cached["limit"]), reset_at
+    except RedisError as error:
+        logger.error(
+            f"Ошибка Redis при получении лимита пользователя {user_id}: {error}"
+        )
+        return None
+    except (KeyError, ValueError) as error:
+        logger.error(
+            f"Некорректная запись лимита пользователя {user_id} в Redis: {error}"
+        )
+        return None
+
+
+async def cache_limit(
+    user_id: int, limit: float, reset_at: datetime, debit: bool = False
+) -> None:
+    """
+    Записывает лимит пользователя в Redis.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+        limit (float): Лимит пользователя, полученный из PostgreSQL.
+        reset_at (datetime): Время последнего сброса лимита.
+        debit (bool): Значение получено списанием; запись не заменит более свежий остаток того же периода.
+    """
+    try:
+        ttl = _limit_ttl(reset_at)
+        reset_at_text = reset_at.isoformat(timespec="microseconds")
+        if debit:
+            await _DEBIT_SCRIPT(
+                keys=[_limit_key(user_id)], args=[limit, reset_at_text, ttl]
+            )
+        else:
+            await redis_client.hset(
+                _limit_key(user_id),
+                mapping={"limit": limit, "reset_at": reset_at_text},
+            )
+            await redis_client.expire(_limit_key(user_id), ttl)
+    except RedisError as error:
+        logger.error(
+            f"Ошибка Redis при сохранении лимита пользователя {user_id}: {error}"
+        )
+        await invalidate_limit(user_id)
+
+
+async def invalidate_limit(user_id: int) -> None:
+    """
+    Удаляет лимит пользователя из Redis, следующий запрос прочитает его из PostgreSQL.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+    """
+    try:
+        await redis_client.delete(_limit_key(user_id))
+    except RedisError as error:
+        logger.error(
+            f"Ошибка Redis при удалении лимита пользователя {user_id}: {error}"
+        )
+
+
+async def get_history_version(user_id: int) -> Optional[str]:
+    """
+    Возвращает номер версии окна истории, который увеличивается при каждой новой записи.
+
+    Читается до запроса к PostgreSQL, чтобы `cache_history` не сохранил устаревшее окно.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+
+    Returns:
+        Optional[str]: Номер версии или None, если записей ещё не было или Redis недоступен.
+    """
+    try:
+        return await redis_client.get(_history_version_key(user_id))
+    except RedisError as error:
+        logger.error(
+            f"Ошибка Redis при получении версии истории пользователя {user_id}: {error}"
+        )
+        return None
+
+
+async def get_cached_history(user_id: int) -> Optional[List[Dict[str, str]]]:
+    """
+    Получает последние записи истории пользователя из Redis в хронологическом порядке.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+
+    Returns:
+        Optional[List[Dict[str, str]]]: Записи истории или None, если окна нет в кеше или Redis недоступен.
+    """
+    try:
+        entries = await redis_client.lrange(
+            _history_key(user_id), 0, HISTORY_WINDOW - 1
+        )
+        if not entries:
+            return None
+        return [json.loads(entry) for entry in reversed(entries)]
+    except RedisError as error:
+        logger.error(
+            f"Ошибка Redis при получении истории пользователя {user_id}: {error}"
+        )
+        return None
+    except ValueError as error:
+        logger.error(
+            f"Некорректная запись истории пользователя {user_id} в Redis: {error}"
+        )
+        return None
+
+
+async def cache_history(
+    user_id: int, history: List[Dict[str, str]], version: Optional[str]
+) -> None:
+    """
+    Сохраняет окно истории, прочитанное из PostgreSQL.
+
+    Окно не сохраняется, если за время чтения появилась новая запись
+    (изменилась версия), чтобы не перезаписать кеш устаревшими данными.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+        history (List[Dict[str, str]]): Записи истории в хронологическом порядке.
+        version (Optional[str]): Версия окна, прочитанная до запроса к PostgreSQL.
+    """
+    if not history:
+        return
+
+    key = _history_key(user_id)
+    version_key = _history_version_key(user_id)
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            await pipe.watch(version_key)
+            if await pipe.get(version_key) != version:
+                return
+            pipe.multi()
+            pipe.delete(key)
+            pipe.lpush(key, *[json.dumps(entry) for entry in history])
+            pipe.ltrim(key, 0, HISTORY_WINDOW - 1)
+            pipe.expire(key, USER_CACHE_TTL)
+            await pipe.execute()
+    except WatchError:
+        logger.info(
+            f"История пользователя {user_id} изменилась во время чтения, кеш не обновлён."
+        )
+    except RedisError as error:
+        logger.error(
+            f"Ошибка Redis при сохранении истории пользователя {user_id}: {error}"
+        )
+
+
+async def push_history_entry(
+    user_id: int, question: str, response: str
+) -> None:
+    """
+    Добавляет новую запись в окно истории в Redis (write-through после записи в PostgreSQL).
+
+    Запись добавляется только в уже загруженное окно; если окна нет,
+    оно будет загружено из PostgreSQL при следующем чтении.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+        question (str): Вопрос пользователя.
+        response (str): Ответ на вопрос.
+    """
+    key = _history_key(user_id)
+    version_key = _history_version_key(user_id)
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.incr(version_key)
+            pipe.expire(version_key, USER_CACHE_TTL)
+            pipe.lpushx(
+                key, json.dumps({"question": question, "response": response})
+            )
+            pipe.ltrim(key, 0, HISTORY_WINDOW - 1)
+            pipe.expire(key, USER_CACHE_TTL)
+            await pipe.execute()
+    except RedisError as error:
+        logger.error(
+            f"Ошибка Redis при добавлении записи истории пользователя {user_id}: {error}"
+        )
+        await invalidate_history(user_id)
+
+
+async def invalidate_history(user_id: int) -> None:
+    """
+    Удаляет окно истории пользователя из Redis.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+    """
+    try:
+        await redis_client.delete(_history_key(user_id))
+    except RedisError as error:
+        logger.error(
+            f"Ошибка Redis при удалении истории пользователя {user_id}: {error}"
+        )
+
+
+async def is_user_registered(user_id: int) -> bool:
+    """
+    Проверяет по профилю в Redis, зарегистрирован ли пользователь.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+
+    Returns:
+        bool: True, если профиль пользователя отмечен как зарегистрированный.
+    """
+    try:
+        return bool(
+            await redis_client.hget(_profile_key(user_id), "registered")
+        )
+    except RedisError as error:
+        logger.error(
+            f"Ошибка Redis при получении профиля пользователя {user_id}: {error}"
+        )
+        return False
+
+
+async def update_profile(user_id: int, **fields: str) -> None:
+    """
+    Обновляет поля профиля пользователя в Redis.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+        **fields (str): Поля профиля, например `language` или `registered`.
+    """
+    try:
+        await redis_client.hset(_profile_key(user_id), mapping=fields)
+    except RedisError as error:
+        logger.error(
+            f"Ошибка Redis при обновлении профиля пользователя {user_id}: {error}"
+        )
@@ -49,6 +49,9 @@ MESSAGES = {
         "en": "Sorry, message limit has been exceeded for today. Check back with us tomorrow :)"
     },
     "process_user_message": {"en": "Your reply is being processed ⏳"},
+    "queue_position": {
+        "en": "There are many requests right now. Your request is number {position} in the queue ⏳"
+    },
     "process_callback_button_strategy_investment": {
         "en": "Cryptocurrency investments can be diverse, and the choice of strategy depends on your goals, risk level, and time horizon\\.\n\n"
         "*Popular Strategies*\n"
@@ -4,19 +4,21 @@ import asyncio
 import logging
 import uuid
 
-import psycopg2
+import asyncpg
 from dotenv import load_dotenv
 from aiogram import Dispatcher, types
 from aiogram.types import ContentType, ContentTypes
 
 from config.bot_config import bot, dp
 from src.services.limit_check import limit_check
+from src.services.token_ledger import TokenLedger
 from src.services.analytics_creating_target import analytics_creating_target
 from src.converter.document_processing import text_extraction_from_a_document
 from src.converter.voice_processing import transcribe_voice_message
 from src.converter.link_processing import link_processing
 from src.converter.you_tube_link_processing import you_tube_link_processing
 from src.generated_answer.process_user_message import process_user_message
+from src.generated_answer.knowledge_base import knowledge_base, reload_knowledge_base
 from db.dbworker import (
     create_user,
     update_user_language,
@@ -26,14 +28,22 @@ from db.dbworker import (
 )
 from src.bot.bot_messages import MESSAGES, MESSAGES_ERROR
 from db.background_functions import start_background_tasks
+from db.database_connection import close_db_pool
+from db.sheets_outbox import flush_rating_updates, flush_sheets_outbox
 from db.dbworker import get_user_status_you_tube, update_status_you_tube
 from src.services.clear_directory import clear_directory
+from src.services.llm_client import bind_event_loop, close_llm_client
 
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 API_TOKEN = os.getenv("TG_TOKEN")
+ADMIN_IDS = {
+    int(admin_id)
+    for admin_id in os.getenv("ADMIN_IDS", "").split(",")
+    if admin_id.strip()
+}
 
 image_path = "downloads/image.jpg"
 
@@ -41,6 +51,7 @@ image_path = "downloads/image.jpg"
 async def on_startup(dispatcher: Dispatcher) -> None:
     """
     Выполняет действия при старте бота:
+    - Передаёт цикл событий клиенту OpenAI для синхронных вызовов эмбеддингов.
     - Запускает фоновые задачи.
     - Устанавливает команды бота.
     - Удаляет вебхук, если он установлен.
@@ -54,6 +65,7 @@ async def on_startup(dispatcher: Dispatcher) -> None:
         Exception: Любая другая ошибка.
     """
     try:
+        bind_event_loop(asyncio.get_running_loop())
         asyncio.create_task(start_background_tasks(dp.bot))
         logger.info("Фоновая задача напоминания запущена")
 
@@ -74,6 +86,33 @@ async def on_startup(dispatcher: Dispatcher) -> None:
         )
 
 
+async def on_shutdown(dispatcher: Dispatcher) -> None:
+    """
+    Освобождает ресурсы при остановке бота: выгружает накопленную очередь
+    Google Sheets, закрывает пул соединений с базой данных и пул HTTP
+    соединений с OpenAI.
+
+    Args:
+        dispatcher (Dispatcher): Диспетчер Aiogram.
+    """
+    try:
+        await flush_sheets_outbox()
+        await flush_rating_updates()
+    except Exception as e:
+        logger.error(
+            f"Ошибка выгрузки очереди Google Sheets при остановке бота: {str(e)}",
+            exc_info=True,
+        )
+    try:
+        await close_db_pool()
+    except Exception as e:
+        logger.error(
+            f"Ошибка при остановке бота: {str(e)}",
+            exc_info=True,
+        )
+    await close_llm_client()
+
+
 async def set_default_commands(dp: Dispatcher) -> None:
     """
     Устанавливает команды бота.
@@ -118,14 +157,14 @@ async def start(message: types.Message) -> None:
         message (types.Message): Сообщение пользователя.
 
     Raises:
-        psycopg2.Error: Ошибки взаимодействия с базой данных.
+        asyncpg.PostgresError: Ошибки взаимодействия с базой данных.
         Exception: Любая другая ошибка.
     """
     user_id = message.from_user.id
     user_name = message.from_user.username
 
     try:
-        create_user(user_id, user_name)
+        await create_user(user_id, user_name)
         logger.info(
             f"Пользователь {user_name} (ID: {user_id}) добавлен в базу данных"
         )
@@ -142,7 +181,7 @@ async def start(message: types.Message) -> None:
             user_name,
             target_start_id=os.getenv("TARGET_START_ID_START"),
         )
-    except psycopg2.Error as db_error:
+    except asyncpg.PostgresError as db_error:
         logger.error(
             f"Ошибка базы данных при обработке команды /start: {db_error}",
             exc_info=True,
@@ -204,6 +243,43 @@ async def donate(message: types.Message) -> None:
         )
 
 
+@dp.message_handler(
+    lambda message: message.from_user.id in ADMIN_IDS, commands=["reload_kb"]
+)
+async def reload_kb(message: types.Message) -> None:
+    """
+    Обрабатывает команду администратора /reload_kb: загружает опубликованную
+    версию базы знаний без перезапуска бота.
+
+    Загрузка и ожидание завершения запросов к старому индексу выполняются
+    в отдельном потоке, обработка сообщений пользователей не прерывается.
+
+    Args:
+        message (types.Message): Сообщение с командой.
+    """
+    try:
+        await message.answer("Загружаю опубликованную версию базы знаний...")
+        reloaded = await asyncio.to_thread(reload_knowledge_base)
+        with knowledge_base() as snapshot:
+            version = snapshot.version
+        if reloaded:
+            await message.answer(f"База знаний обновлена до версии {version}.")
+        else:
+            await message.answer(f"Загружена актуальная версия {version}.")
+        logger.info(
+            f"Перезагрузка базы знаний по команде администратора {message.from_user.id}: версия {version}"
+        )
+    except FileNotFoundError as e:
+        logger.error(f"Файлы новой версии FAISS индекса не найдены: {e}")
+        await message.answer(f"Файлы индекса не найдены: {e}")
+    except Exception as e:
+        logger.error(
+            f"Ошибка перезагрузки базы знаний по команде /reload_kb: {str(e)}",
+            exc_info=True,
+        )
+        await message.answer(f"Ошибка перезагрузки базы знаний: {e}")
+
+
 @dp.message_handler(
     auto_group=True, mention_bot=True, content_types=ContentType.VOICE
 )
@@ -220,17 +296,19 @@ async def voice(message: types.Message) -> None:
         ValueError: Ошибка транскрибации.
         Exception: Любая другая ошибка.
     """
+    ledger = None
     try:
         user_id = message.from_user.id
         chat_id = message.chat.id
         user_name = message.from_user.username
-        history = get_user_history(user_id)
+        history = await get_user_history(user_id)
 
-        limit = get_user_limit(user_id)
+        limit = await get_user_limit(user_id)
         if not await limit_check(limit, message, user_id, user_name):
             return
 
-        text = await transcribe_voice_message(message, user_id, user_name, bot)
+        ledger = TokenLedger(user_id, limit)
+        text = await transcribe_voice_message(message, ledger, user_name, bot)
         if not text:
             raise ValueError("Ошибка транскрибации голосового сообщения")
 
@@ -245,6 +323,7 @@ async def voice(message: types.Message) -> None:
             history=history,
             prompt="text_voice",
             bot=bot,
+            ledger=ledger,
             message=message,
         )
     except ValueError as value_error:
@@ -259,6 +338,9 @@ async def voice(message: types.Message) -> None:
             exc_info=True,
         )
         await message.reply(MESSAGES_ERROR["voice_error"]["en"])
+    finally:
+        if ledger is not None:
+            await ledger.commit()
 
 
 @dp.message_handler(
@@ -287,7 +369,7 @@ async def you_tube_link_handler(message: types.Message) -> None:
         user_name = message.from_user.username
         text = message.text
 
-        limit = get_user_limit(user_id)
+        limit = await get_user_limit(user_id)
         if not await limit_check(limit, message, user_id, user_name):
             return
 
@@ -303,7 +385,7 @@ async def you_tube_link_handler(message: types.Message) -> None:
             f"Получена ссылка: {url} от пользователя {user_name} (ID: {user_id})"
         )
 
-        history = get_user_history(user_id)
+        history = await get_user_history(user_id)
 
         awaiting_message = await message.answer(
             MESSAGES["link_handler_await"]["en"]
@@ -324,6 +406,7 @@ async def you_tube_link_handler(message: types.Message) -> None:
             history=history,
             prompt="you_tube_link",
             bot=bot,
+            ledger=TokenLedger(user_id, limit),
             data_from_question=[text, url],
             message=message,
         )
@@ -366,7 +449,7 @@ async def link_handler(message: types.Message) -> None:
         user_name = message.from_user.username
         text = message.text
 
-        limit = get_user_limit(user_id)
+        limit = await get_user_limit(user_id)
         if not await limit_check(limit, message, user_id, user_name):
             return
 
@@ -380,7 +463,7 @@ async def link_handler(message: types.Message) -> None:
             f"Получена ссылка: {url} от пользователя {user_name} (ID: {user_id})"
         )
 
-        history = get_user_history(user_id)
+        history = await get_user_history(user_id)
 
         awaiting_message = await message.answer(
             MESSAGES["link_handler_await"]["en"]
@@ -400,6 +483,7 @@ async def link_handler(message: types.Message) -> None:
             history=history,
             prompt="link",
             bot=bot,
+            ledger=TokenLedger(user_id, limit),
             data_from_question=[text, url],
             message=message,
         )
@@ -435,9 +519,9 @@ async def text_handler(message: types.Message) -> None:
         chat_id = message.chat.id
         user_name = message.from_user.username
         text = message.text
-        history = get_user_history(user_id)
+        history = await get_user_history(user_id)
 
-        limit = get_user_limit(user_id)
+        limit = await get_user_limit(user_id)
         if not await limit_check(limit, message, user_id, user_name):
             return
 
@@ -452,6 +536,7 @@ async def text_handler(message: types.Message) -> None:
             history=history,
             prompt="text_voice",
             bot=bot,
+            ledger=TokenLedger(user_id, limit),
             message=message,
         )
     except ValueError as value_error:
@@ -502,7 +587,7 @@ async def document_handler(message: types.Message) -> None:
         await file_info.download(destination_file=file_path)
         logger.info(f"Файл {file_name} загружен в папку downloads")
 
-        limit = get_user_limit(user_id)
+        limit = await get_user_limit(user_id)
         if not await limit_check(limit, message, user_id, user_name):
             return
 
@@ -527,7 +612,7 @@ async def document_handler(message: types.Message) -> None:
         )
 
         question = f'Содержание документа "{file_name}":\n{text_document}'
-        history = get_user_history(user_id)
+        history = await get_user_history(user_id)
 
         await process_user_message(
             user_id=user_id,
@@ -536,6 +621,7 @@ async def document_handler(message: types.Message) -> None:
             history=history,
             prompt="document",
             bot=bot,
+            ledger=TokenLedger(user_id, limit),
             data_from_question=[question, file_name],
             message=message,
         )
@@ -586,12 +672,12 @@ async def handle_photo(message: types.Message) -> None:
         file_url = f"https://api.telegram.org/file/bot{API_TOKEN}/{file_path}"
         logger.info(f"Фотография загружена: {file_url}")
 
-        limit = get_user_limit(user_id)
+        limit = await get_user_limit(user_id)
         if not await limit_check(limit, message, user_id, user_name):
             return
 
         question = f"Ссылка на изображение: {file_url}"
-        history = get_user_history(user_id)
+        history = await get_user_history(user_id)
 
         await process_user_message(
             user_id=user_id,
@@ -600,6 +686,7 @@ async def handle_photo(message: types.Message) -> None:
             history=history,
             prompt="image",
             bot=bot,
+            ledger=TokenLedger(user_id, limit),
             message=message,
             file_url=file_url,
         )
@@ -704,7 +791,7 @@ async def process_callback_rating(callback_query: types.CallbackQuery) -> None:
             reply_markup=None,
         )
 
-        update_dialog_score(rating, response_id)
+        await update_dialog_score(rating, response_id)
         logger.info(
             f"Оценка {rating} сохранена для сообщения с ID {response_id} пользователя {user_name} (ID: {user_id})"
         )
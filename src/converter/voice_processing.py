@@ -3,29 +3,30 @@ import os
 import uuid
 from typing import Tuple
 
-import aiohttp
 from dotenv import load_dotenv
+from openai import APIConnectionError, APIStatusError, APITimeoutError
 
-from db.dbworker import get_user_limit, update_user_limit
 from src.bot.bot_messages import MESSAGES, MESSAGES_ERROR
 from src.services.count_token import count_vois_tokens
 from src.services.limit_check import limit_check
 from src.services.clear_directory import clear_directory
 from src.services.count_token import count_output_tokens
+from src.services.llm_client import LLM_TIMEOUT, openai_client
+from src.services.token_ledger import TokenLedger
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
 
 async def transcribe_voice_message(
-    message, user_id: int, user_name: str, bot
+    message, ledger: TokenLedger, user_name: str, bot
 ) -> str:
     """
     Обрабатывает транскрипцию голосового сообщения.
 
     Args:
         message: Сообщение Telegram с голосовым сообщением.
-        user_id (int): Идентификатор пользователя Telegram.
+        ledger (TokenLedger): Учёт токенов текущего запроса пользователя.
         user_name (str): Имя пользователя Telegram.
         bot: Telegram-бот.
     Returns:
@@ -35,6 +36,7 @@ async def transcribe_voice_message(
         ValueError: Ошибка проверки лимита или данных.
         Exception: Общая ошибка обработки голосового сообщения.
     """
+    user_id = ledger.user_id
     request_id = str(uuid.uuid4())
     base_dir = os.path.join("downloads", str(user_id), request_id)
     os.makedirs(base_dir, exist_ok=True)
@@ -45,8 +47,7 @@ async def transcribe_voice_message(
         await new_file.download(destination_file=audio_path)
 
         voice_token = await count_vois_tokens([audio_path])
-        user_token = get_user_limit(user_id)
-        remaining_limit = user_token - voice_token
+        remaining_limit = ledger.available - voice_token
 
         if not await limit_check(remaining_limit, message, user_id, user_name):
             logger.info(
@@ -56,7 +57,7 @@ async def transcribe_voice_message(
             return None
 
         transcript_text, token = await transcribe_voice(
-            audio_path, message, user_id, bot
+            audio_path, message, ledger, bot
         )
 
         if not transcript_text:
@@ -83,7 +84,7 @@ async def transcribe_voice_message(
 
 
 async def transcribe_voice(
-    audio_path: str, message, user_id: int, bot
+    audio_path: str, message, ledger: TokenLedger, bot
 ) -> Tuple[str, str]:
     """
     Выполняет транскрипцию голосового сообщения с использованием модели OpenAI Whisper.
@@ -91,7 +92,7 @@ async def transcribe_voice(
     Args:
         audio_path (str): Путь к аудиофайлу.
         message: Сообщение Telegram для контекста.
-        user_id (int): Уникальный идентификатор пользователя.
+        ledger (TokenLedger): Учёт токенов текущего запроса пользователя.
         bot: Telegram-бот.
     Returns:
         Optional[str]: Текст транскрипции или None в случае ошибки.
@@ -105,52 +106,31 @@ async def transcribe_voice(
         if not api_key:
             raise ValueError("Ключ API OpenAI не установлен.")
 
-        url = "https://api.openai.com/v1/audio/transcriptions"
-        headers = {"Authorization": f"Bearer {api_key}"}
+        with open(audio_path, "rb") as audio_file:
+            result = await openai_client.audio.transcriptions.create(
+                model="whisper-1", file=audio_file, timeout=LLM_TIMEOUT
+            )
 
-        async with aiohttp.ClientSession() as session:
-            with open(audio_path, "rb") as audio_file:
-                data = aiohttp.FormData()
-                data.add_field("model", "whisper-1")
-                data.add_field(
-                    "file", audio_file, filename=os.path.basename(audio_path)
+        transcript_text = result.text
+        if transcript_text:
+            token_count = count_output_tokens(transcript_text, model="gpt-4")
+            if not ledger.can_spend(token_count + 1):
+                logger.warning("Недостаточно токенов.")
+                await bot.edit_message_text(
+                    text=MESSAGES["token_limit_exceeded"]["en"]
                 )
+                return
+            ledger.charge(token_count, "transcribe_voice")
+            logger.info(
+                f"Транскрибированный текст содержит {token_count} токенов."
+            )
+            logger.info(f"лимит пользователя: {ledger.available}")
 
-                async with session.post(
-                    url, headers=headers, data=data
-                ) as response:
-                    if response.status != 200:
-                        error_message = await response.text()
-                        raise ValueError(
-                            f"Ошибка запроса: {response.status} - {error_message}"
-                        )
-
-                    result = await response.json()
-                    transcript_text = result.get("text")
-                    if transcript_text:
-                        token_count = count_output_tokens(
-                            transcript_text, model="gpt-4"
-                        )
-                        limit = get_user_limit(user_id)
-                        if limit - token_count <= 0:
-                            logger.warning("Недостаточно токенов.")
-                            await bot.edit_message_text(
-                                text=MESSAGES["token_limit_exceeded"]["en"]
-                            )
-                            return
-                        update_user_limit(user_id, limit - token_count)
-                        logger.info(
-                            f"Транскрибированный текст содержит {token_count} токенов."
-                        )
-                        logger.info(
-                            f"лимит пользователя: {limit - token_count}"
-                        )
-
-                    else:
-                        logger.warning("Транскрипция вернула пустой текст.")
-                        return None, 0
-
-                    return transcript_text, token_count
+        else:
+            logger.warning("Транскрипция вернула пустой текст.")
+            return None, 0
+
+        return transcript_text, token_count
 
     except ValueError as ve:
         logger.error(f"Ошибка валидации данных: {ve}")
@@ -159,7 +139,14 @@ async def transcribe_voice(
         )
         return None
 
-    except aiohttp.ClientError as ce:
+    except APIStatusError as e:
+        logger.error(f"Ошибка запроса: {e.status_code} - {e.message}")
+        await message.answer(
+            "Произошла ошибка при проверке API ключа или данных."
+        )
+        return None
+
+    except (APIConnectionError, APITimeoutError) as ce:
         logger.error(f"Ошибка соединения с API OpenAI: {ce}")
         await message.answer(
             "Произошла ошибка подключения к сервису транскрипции."
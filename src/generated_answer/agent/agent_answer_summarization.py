@@ -1,16 +1,18 @@
-from langchain_openai import ChatOpenAI
-import os
 from dotenv import load_dotenv
 import logging
+from typing import Awaitable, Callable, Optional
+
+from src.services.llm_client import ainvoke, astream_text, chat_model
 
 
 load_dotenv()
 logger = logging.getLogger(__name__)
-api_key = os.getenv("GPT_SECRET_KEY_FASOLKAAI")
-client = ChatOpenAI(model_name="gpt-4o-mini", openai_api_key=api_key)
+client = chat_model("gpt-4o-mini")
 
 
-def answer_summarization(text):
+async def answer_summarization(
+    text, on_token: Optional[Callable[[str], Awaitable[None]]] = None
+):
     summarization_prompt = (
         f"""You are an expert in text editing and summarization.
 
@@ -42,9 +44,11 @@ def answer_summarization(text):
             {"role": "system", "content": summarization_prompt},
             {"role": "user", "content": text}
         ]
-        response = client.invoke(messages)
-
-        response_text = response.content
+        if on_token is None:
+            response = await ainvoke(client, messages)
+            response_text = response.content
+        else:
+            response_text = await astream_text(client, messages, on_token)
         logger.info(f"Резюме ответа: {response_text}")
 
         return response_text
@@ -3,24 +3,25 @@ import logging
 import os
 import re
 
-from typing import List, Dict, Optional, Tuple, Union
+from typing import Awaitable, Callable, List, Dict, Optional, Tuple, Union
 from dotenv import load_dotenv
 from langchain_core.output_parsers import JsonOutputParser
 
-from db.dbworker import get_user_limit, update_user_limit
 from langchain.agents import AgentType, Tool, initialize_agent
-from langchain.memory import ConversationBufferMemory
-from langchain.schema import AIMessage, HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages import get_buffer_string
 from src.bot.bot_messages import MESSAGES
 from src.generated_answer.agent.web_search import openai_web_search
-from src.services.count_token import count_output_tokens, count_input_tokens
 from src.bot.promt import PROMTS
+from src.services.llm_client import ainvoke, chat_model, usage_stage
+from src.services.token_ledger import TokenLedger
 
 from src.generated_answer.agent.agent_answer_summarization import answer_summarization
 from src.generated_answer.agent.generate_plan import generate_plan, parse_plan
-from src.generated_answer.agent.faiss_search import knowledge_base_search
-from src.generated_answer.agent.bot_link import bot_link
+from src.generated_answer.agent.faiss_search import (
+    aknowledge_base_search,
+    knowledge_base_search,
+)
 
 
 load_dotenv()
@@ -31,14 +32,15 @@ logger = logging.getLogger(__name__)
 API_KEY: str = os.getenv("GPT_SECRET_KEY_FASOLKAAI", "")
 MODEL_NAME: str = os.getenv("MODEL_NAME", "")
 FAISS_INDEX_PATH: str = "faiss_index_RU"
+AGENT_POINT_TIMEOUT: float = float(os.getenv("AGENT_POINT_TIMEOUT", "180"))
+AGENT_MAX_CONCURRENCY: int = int(os.getenv("AGENT_MAX_CONCURRENCY", "8"))
 
 if not API_KEY:
     raise ValueError("API-ключ OpenAI не найден. Проверьте файл .env.")
 
 try:
-    llm = ChatOpenAI(
-        model_name=MODEL_NAME,
-        api_key=API_KEY,
+    llm = chat_model(
+        MODEL_NAME,
         temperature=0.7,
         top_p=0.9,
         frequency_penalty=0.5,
@@ -55,77 +57,61 @@ tools = [
     Tool(
         name="Knowledge Base",
         func=knowledge_base_search,
+        coroutine=aknowledge_base_search,
         description="Used to answer questions based on the internal knowledge base.",
     ),
     Tool(
         name="OpenAI Web Search",
-        func=openai_web_search,
+        func=None,
+        coroutine=openai_web_search,
         description="Used to search for additional information on the internet.",
     ),
 ]
 
-def create_agent(
+try:
+    agent_executor = initialize_agent(
+        tools=tools,
+        llm=llm,
+        agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
+        verbose=True,
+        handle_parsing_errors=True,
+    )
+    logger.info("Агент успешно создан.")
+except Exception as e:
+    logger.error(f"Ошибка инициализации агента: {e}")
+    raise RuntimeError("Не удалось инициализировать агента.")
+
+agent_semaphore = asyncio.Semaphore(AGENT_MAX_CONCURRENCY)
+
+
+def build_chat_history(
         prompt_text: str, history: Optional[List[Dict[str, str]]] = None
-):
+) -> str:
     """
-    Создание агента для обработки запросов.
+    Формирует историю общения для одного вызова агента.
+
+    Агент создаётся один раз и не хранит память, поэтому системный промпт и
+    история передаются во входных данных каждого вызова.
 
     Args:
-        prompt_text (str): Начальный текст для агента.
+        prompt_text (str): Системный промпт агента.
         history (Optional[List[Dict[str, str]]]): История общения.
 
     Returns:
-        Any: Инициализированный агент.
-
-    Raises:
-        ValueError: Ошибка в переданных данных (например, пустая история или некорректный формат).
-        RuntimeError: Ошибка инициализации агента.
+        str: История в формате переменной `chat_history` промпта агента.
     """
-    try:
-        memory = ConversationBufferMemory(
-            memory_key="chat_history", return_messages=True
-        )
-        memory.clear()
-
-        if prompt_text:
-            memory.chat_memory.messages.append(
-                SystemMessage(content=prompt_text)
-            )
+    messages: List[BaseMessage] = []
+    if prompt_text:
+        messages.append(SystemMessage(content=prompt_text))
+
+    for entry in history or []:
+        if "question" in entry and "response" in entry:
+            messages.append(HumanMessage(content=entry["question"]))
+            messages.append(AIMessage(content=entry["response"]))
+        else:
+            logger.warning(f"Пропущена некорректная запись истории: {entry}")
 
-        if history:
-            for entry in history:
-                if "question" in entry and "response" in entry:
-                    memory.chat_memory.messages.append(
-                        HumanMessage(content=entry["question"])
-                    )
-                    memory.chat_memory.messages.append(
-                        AIMessage(content=entry["response"])
-                    )
-                else:
-                    logger.warning(
-                        f"Пропущена некорректная запись истории: {entry}"
-                    )
-
-        agent = initialize_agent(
-            tools=tools,
-            llm=llm,
-            agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
-            memory=memory,
-            verbose=True,
-            handle_parsing_errors=True,
-            agent_kwargs={"system_message": prompt_text},
-        )
-        logger.info("Агент успешно создан.")
-        return agent
-    except ValueError as e:
-        logger.error(f"Ошибка создания агента: некорректные данные. {e}")
-        raise ValueError("Ошибка в переданных данных для создания агента.")
-    except RuntimeError as e:
-        logger.error(f"Ошибка инициализации агента: {e}")
-        raise RuntimeError("Не удалось инициализировать агента.")
-    except Exception as e:
-        logger.error(f"Непредвиденная ошибка при создании агента: {e}")
-        raise
+    return get_buffer_string(messages)
 
 
 def clean_agent_response(response: str) -> str:
@@ -151,20 +137,28 @@ def clean_agent_response(response: str) -> str:
     return response
 
 
-async def get_information_for_point_with_agent(point: str, agent, loop) -> str:
+async def get_information_for_point_with_agent(point: str, chat_history: str) -> str:
     """
     Использует агента для обработки каждого пункта плана.
 
+    Каждый вызов получает собственный список промежуточных шагов агента,
+    поэтому пункты плана обрабатываются параллельно без общего состояния.
+    Число одновременных вызовов ограничено `AGENT_MAX_CONCURRENCY`.
+
     Args:
         point (str): Пункт плана.
-        agent (AgentExecutor): Инициализированный агент LangChain.
-        loop (asyncio.AbstractEventLoop): Текущий event loop.
+        chat_history (str): История общения (`build_chat_history`).
 
     Returns:
         str: Сформированный ответ агента.
     """
     try:
-        response = await loop.run_in_executor(None, agent.invoke, point)
+        async with agent_semaphore:
+            response = await ainvoke(
+                agent_executor,
+                {"input": point, "chat_history": chat_history},
+                timeout=AGENT_POINT_TIMEOUT,
+            )
 
         if isinstance(response, dict) and "output" in response and response["output"]:
             clean_response = clean_agent_response(response["output"])
@@ -179,43 +173,61 @@ async def get_information_for_point_with_agent(point: str, agent, loop) -> str:
 
 
 async def run_agent(
-        user_id: int,
+        ledger: TokenLedger,
         user_input: str,
         history: List[Dict[str, str]],
         prompt_text: str,
+        plan_answer: Optional[str] = None,
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None,
 ) -> Union[str, Tuple[None, str]]:
-    try:
+    """
+    Отвечает на вопрос по плану: агент прорабатывает пункты плана
+    параллельно, затем ответы сводятся в один текст.
+
+    Args:
+        ledger (TokenLedger): Учёт токенов запроса.
+        user_input (str): Вопрос пользователя.
+        history (List[Dict[str, str]]): История диалога.
+        prompt_text (str): Системный промпт агента.
+        plan_answer (Optional[str]): План, построенный заранее (см.
+            `pipeline.answer_text_question`); если не передан, строится здесь.
+        on_token (Optional[Callable[[str], Awaitable[None]]]): Обработчик
+            фрагментов итогового ответа при потоковой генерации.
 
-        plan_answer = await generate_plan(user_input, llm)
+    Returns:
+        Union[str, Tuple[None, str]]: Ответ или сообщение о превышении лимита.
+    """
+    user_id = ledger.user_id
+    try:
+        if plan_answer is None:
+            plan_answer = await generate_plan(user_input, llm)
         plan_points = parse_plan(plan_answer)
 
         if not plan_points:
             logger.error("Ошибка: список пунктов плана пустой.")
             return "Ошибка: план ответа пуст."
 
-        agent = create_agent(prompt_text, history)
-        loop = asyncio.get_event_loop()
+        if ledger.exhausted:
+            logger.warning(f"Пользователь {user_id} превысил лимит токенов.")
+            return None, MESSAGES["get_user_limit"]["en"]
 
-        responses = await asyncio.gather(*[
-            get_information_for_point_with_agent(
-                f"You are elaborating on the item: {point} from the following topic: {user_input}.", agent, loop) for
-            point in plan_points
-        ])
+        chat_history = build_chat_history(prompt_text, history)
 
-        total_tokens_input = count_input_tokens(
-            history, user_input, prompt_text, model=MODEL_NAME
-        )
+        with usage_stage("agent_points"):
+            responses = await asyncio.gather(*[
+                get_information_for_point_with_agent(
+                    f"You are elaborating on the item: {point} from the following topic: {user_input}.", chat_history) for
+                point in plan_points
+            ])
 
-        limit = get_user_limit(user_id)
-        if limit - total_tokens_input <= 0:
+        if ledger.exhausted:
             logger.warning(f"Пользователь {user_id} превысил лимит токенов.")
             return None, MESSAGES["get_user_limit"]["en"]
 
         final_answer = "\n\n".join(responses)
         logger.info(f"Ответ модели: {final_answer}")
-        summarization_text = answer_summarization(final_answer)
-        link_bot = await bot_link(user_input, user_id, llm)
-        return summarization_text + link_bot
+        with usage_stage("summarization"):
+            return await answer_summarization(final_answer, on_token)
 
     except ValueError as e:
         logger.error(f"Некорректный ввод пользователя {user_id}: {e}")
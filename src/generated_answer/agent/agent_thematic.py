@@ -1,42 +1,61 @@
-import os
+import asyncio
 import logging
+from typing import Optional
+
 from dotenv import load_dotenv
-from langchain.chat_models import ChatOpenAI
 from langchain.schema import SystemMessage, HumanMessage
 
-from src.services.count_token import count_output_tokens
-from db.dbworker import get_user_limit, update_user_limit, get_user_history
+from db.dbworker import get_user_history
 from src.generated_answer.agent.agent_response import knowledge_base_search
 from src.bot.promt import PROMTS
+from src.services.llm_client import ainvoke, chat_model
+from src.services.token_ledger import TokenLedger
 
 
 logger = logging.getLogger(__name__)
 load_dotenv()
-OPENAI_API_KEY = os.getenv("GPT_SECRET_KEY_FASOLKAAI")
 
-llm = ChatOpenAI(
-    model_name="gpt-4o-mini",
-    openai_api_key=OPENAI_API_KEY
-)
+llm = chat_model("gpt-4o-mini")
+
+def has_knowledge(knowledge_snippets: Optional[str]) -> bool:
+    """
+    Нашлось ли что-то в базе знаний по результату `knowledge_base_search`.
+    """
+    return bool(knowledge_snippets) and "No search results found" not in knowledge_snippets
+
+
+async def is_crypto_related(
+    question: str, ledger: TokenLedger, knowledge_snippets: Optional[str] = None
+) -> bool:
+    """
+    Проверяет, относится ли вопрос к тематике бота.
+
+    Если по вопросу есть результаты в базе знаний, вопрос считается
+    тематическим без обращения к модели.
+
+    Args:
+        question (str): Вопрос пользователя.
+        ledger (TokenLedger): Учёт токенов запроса.
+        knowledge_snippets (Optional[str]): Уже найденные результаты поиска
+            в базе знаний; если не переданы, поиск выполняется здесь.
 
-async def is_crypto_related(question: str, user_id: int) -> bool:
-    logger.debug(f"[is_crypto_related] Проверяем вопрос: '{question}' для user_id={user_id}")
+    Returns:
+        bool: True, если вопрос тематический.
+    """
+    logger.debug(f"[is_crypto_related] Проверяем вопрос: '{question}' для user_id={ledger.user_id}")
 
-    knowledge_snippets = knowledge_base_search(question)
-    has_knowledge = knowledge_snippets and "No search results found" not in knowledge_snippets
+    if knowledge_snippets is None:
+        knowledge_snippets = await asyncio.to_thread(knowledge_base_search, question)
 
-    if has_knowledge:
+    if has_knowledge(knowledge_snippets):
         logger.info(f"[is_crypto_related] Вопрос '{question}' найден в базе знаний и автоматически классифицирован как криптовалютный.")
         return True
 
     system_prompt = PROMTS["system_prompt"]
     user_prompt = f"{PROMTS['user_prompt']} {question}\n\nReply with 'True' if the question is directly related to the topic of cryptocurrencies, otherwise reply with 'False'."
 
-    total_tokens = count_output_tokens(system_prompt + user_prompt) + 4
-    limit = get_user_limit(user_id)
-
-    if limit - total_tokens < 0:
-        logger.warning(f"[is_crypto_related] Недостаточно токенов. Остаток: {limit}, нужно: {total_tokens}")
+    if ledger.exhausted:
+        logger.warning(f"[is_crypto_related] Недостаточно токенов. Остаток: {ledger.available}")
         return False
 
     messages = [
@@ -44,8 +63,7 @@ async def is_crypto_related(question: str, user_id: int) -> bool:
         HumanMessage(content=user_prompt)
     ]
 
-    response = llm(messages)
-    update_user_limit(user_id, limit - total_tokens)
+    response = await ainvoke(llm, messages)
 
     model_answer = response.content.strip()
     logger.debug(f"[is_crypto_related] Ответ модели: '{model_answer}'")
@@ -53,15 +71,15 @@ async def is_crypto_related(question: str, user_id: int) -> bool:
     return model_answer == "True"
 
 
-async def context_completion(question: str, user_id: int) -> str:
+async def context_completion(question: str, ledger: TokenLedger) -> str:
     """
     Переформулировать вопрос, если он явно ссылается
     на предыдущий контекст диалога. Если без контекста
     всё понятно, вернуть вопрос без изменений.
     """
-    logger.debug(f"[context_completion] Получен вопрос: '{question}' для user_id={user_id}")
+    logger.debug(f"[context_completion] Получен вопрос: '{question}' для user_id={ledger.user_id}")
 
-    history = get_user_history(user_id)
+    history = await get_user_history(ledger.user_id)
     if not history:
         logger.debug("[context_completion] История отсутствует. Возвращаем исходный вопрос без изменений.")
         return question
@@ -102,11 +120,11 @@ async def context_completion(question: str, user_id: int) -> str:
             f"Assistant response {i + 1}: {assistant_text}\n\n"
         )
 
-        knowledge_snippets = knowledge_base_search(question)
-        if knowledge_snippets and "No search results found" not in knowledge_snippets:
-            knowledge_block = f"📚 Here are relevant excerpts from the knowledge base:\n{knowledge_snippets}\n\n"
-        else:
-            knowledge_block = ""
+    knowledge_snippets = await asyncio.to_thread(knowledge_base_search, question)
+    if has_knowledge(knowledge_snippets):
+        knowledge_block = f"📚 Here are relevant excerpts from the knowledge base:\n{knowledge_snippets}\n\n"
+    else:
+        knowledge_block = ""
 
     user_prompt = (
         f"Knowledge base content: {knowledge_block}"
@@ -115,14 +133,9 @@ async def context_completion(question: str, user_id: int) -> str:
         "Return either the original question or a rephrased version of it with no references to prior context."
     )
 
-    total_tokens = count_output_tokens(system_prompt + user_prompt) + 4
-    limit = get_user_limit(user_id)
-
-    logger.debug(f"[context_completion] Подсчитано total_tokens={total_tokens}, доступно limit={limit}")
-
-    if limit - total_tokens < 0:
+    if ledger.exhausted:
         logger.warning(
-            f"[context_completion] Недостаточно токенов. Остаток: {limit}, нужно: {total_tokens}. "
+            f"[context_completion] Недостаточно токенов. Остаток: {ledger.available}. "
             "Возвращаем исходный вопрос."
         )
         return question
@@ -132,9 +145,7 @@ async def context_completion(question: str, user_id: int) -> str:
         HumanMessage(content=user_prompt)
     ]
 
-    response = llm(messages)
-    new_limit = limit - total_tokens
-    update_user_limit(user_id, new_limit)
+    response = await ainvoke(llm, messages)
 
     revised_question = response.content.strip()
     logger.debug(f"[context_completion] Модель вернула переформулированный вопрос: '{revised_question}'")
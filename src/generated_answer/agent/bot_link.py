@@ -2,20 +2,20 @@ import logging
 from dotenv import load_dotenv
 from langchain.schema import SystemMessage, HumanMessage
 
-from src.services.count_token import count_output_tokens
-from db.dbworker import get_user_limit, update_user_limit
+from src.services.llm_client import ainvoke
+from src.services.token_ledger import TokenLedger
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
 
-async def bot_link(question: str, user_id: int, llm) -> str | None:
+async def bot_link(question: str, ledger: TokenLedger, llm) -> str | None:
     """
     Модель решает, нужно ли направить пользователя к криптоаналитику.
     Если нужно — возвращает готовый текст с упоминанием @FasolkaAI_Analyst_bot.
     Если не нужно — возвращает None.
     """
-    logger.debug(f"[bot_link] Проверка вопроса: '{question}' от user_id={user_id}")
+    logger.debug(f"[bot_link] Проверка вопроса: '{question}' от user_id={ledger.user_id}")
 
     system_prompt = (
         "You are an assistant that helps with user questions.\n"
@@ -28,15 +28,11 @@ async def bot_link(question: str, user_id: int, llm) -> str | None:
         HumanMessage(content=question)
     ]
 
-    total_tokens = count_output_tokens(system_prompt + question)
-    user_limit = get_user_limit(user_id)
-
-    if user_limit < total_tokens:
-        logger.warning(f"[bot_link] Недостаточно токенов. Осталось: {user_limit}, нужно: {total_tokens}")
+    if ledger.exhausted:
+        logger.warning(f"[bot_link] Недостаточно токенов. Осталось: {ledger.available}")
         return None
 
-    response = llm(messages)
-    update_user_limit(user_id, user_limit - total_tokens)
+    response = await ainvoke(llm, messages)
 
     model_answer = response.content.strip()
     logger.debug(f"[bot_link] Ответ модели: '{model_answer}'")
@@ -1,40 +1,28 @@
+import asyncio
 import logging
-import os
 
-from dotenv import load_dotenv
-
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import FAISS
+from src.generated_answer.knowledge_base import (
+    SCORE_THRESHOLD,
+    SEARCH_K,
+    knowledge_base,
+)
+from src.generated_answer.retrieval_cache import (
+    cache_result,
+    get_cached_result,
+    retrieval_key,
+)
 
 
-load_dotenv()
 logger = logging.getLogger(__name__)
 
-API_KEY: str = os.getenv("GPT_SECRET_KEY_FASOLKAAI", "")
-MODEL_NAME: str = os.getenv("MODEL_NAME", "")
-FAISS_INDEX_PATH: str = "faiss_index_RU"
-
-if not API_KEY:
-    raise ValueError("API-ключ OpenAI не найден. Проверьте файл .env.")
-
-embeddings = OpenAIEmbeddings(
-    openai_api_key=API_KEY, model="text-embedding-ada-002"
-)
-
-try:
-    retriever = FAISS.load_local(
-        "faiss_index_RU", embeddings, allow_dangerous_deserialization=True
-    ).as_retriever(
-        k=4, search_type="similarity_score_threshold", search_kwargs={"score_threshold": 0.78, "k": 6}, fetch_k=50
-    )
-    logger.info("FAISS индекс успешно загружен.")
-except Exception as e:
-    logger.error(f"Ошибка загрузки FAISS индекса: {e}")
-    raise
 
 def knowledge_base_search(query: str) -> str:
     """
-    Поиск информации в базе знаний.
+    Поиск информации в базе знаний: векторный поиск и BM25 по точным терминам.
+
+    Результат кешируется по нормализованному запросу, параметрам поиска и
+    версии индекса. Поиск выполняется по одному снимку индекса, поэтому
+    версия в ключе кеша совпадает с индексом, по которому найден результат.
 
     Args:
         query (str): Запрос пользователя.
@@ -50,15 +38,26 @@ def knowledge_base_search(query: str) -> str:
         if not query.strip():
             raise ValueError("Запрос не может быть пустым.")
 
-        if not retriever:
-            raise RuntimeError("Ретривер базы знаний недоступен.")
+        with knowledge_base() as snapshot:
+            key = retrieval_key(
+                query, SEARCH_K, SCORE_THRESHOLD, snapshot.version
+            )
+            cached = get_cached_result(key)
+            if cached is not None:
+                logger.info(f"Результат поиска взят из кеша для запроса: {query}")
+                return cached
+
+            retriever = snapshot.threshold_retriever()
+            if not retriever:
+                raise RuntimeError("Ретривер базы знаний недоступен.")
 
-        docs = retriever.get_relevant_documents(query)
+            docs = retriever.get_relevant_documents(query)
         if not docs:
             logger.info(f"Результаты поиска отсутствуют для запроса: {query}")
 
         results = "\n".join([doc.page_content for doc in docs])
         logger.info(f"Найдено {len(docs)} документов для запроса: {query}")
+        cache_result(key, results)
         return results
     except ValueError as e:
         logger.error(f"Ошибка поиска в базе знаний: {e}")
@@ -66,3 +65,11 @@ def knowledge_base_search(query: str) -> str:
         logger.error(f"Ошибка доступа к базе знаний: {e}")
     except Exception as e:
         logger.error(f"Неизвестная ошибка во время поиска: {e}")
+
+
+async def aknowledge_base_search(query: str) -> str:
+    """
+    Асинхронная версия `knowledge_base_search` для инструментов агента:
+    поиск выполняется в отдельном потоке, не блокируя цикл событий.
+    """
+    return await asyncio.to_thread(knowledge_base_search, query)
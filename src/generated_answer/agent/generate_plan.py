@@ -1,11 +1,13 @@
+import asyncio
 import re
 from datetime import datetime
 
-from typing import List
+from typing import List, Optional
 from langchain.schema import SystemMessage
 import logging
 
 from src.generated_answer.agent.faiss_search import knowledge_base_search
+from src.services.llm_client import ainvoke
 
 logger = logging.getLogger(__name__)
 
@@ -26,18 +28,24 @@ def parse_plan(plan_text: str) -> List[str]:
     return points
 
 
-async def generate_plan(user_question: str, llm) -> str:
+async def generate_plan(
+    user_question: str, llm, kb_results: Optional[str] = None
+) -> str:
     """
     Генерирует план ответа на основе пользовательского запроса.
 
     Args:
         user_question (str): Вопрос пользователя.
+        llm: Модель для генерации плана.
+        kb_results (Optional[str]): Уже найденные результаты поиска в базе
+            знаний; если не переданы, поиск выполняется здесь.
 
     Returns:
         str: Сформированный план ответа.
     """
     try:
-        kb_results = knowledge_base_search(user_question)
+        if kb_results is None:
+            kb_results = await asyncio.to_thread(knowledge_base_search, user_question)
 
         plan_prompt = f"""
         You are an expert in cryptocurrencies and blockchain technologies. Your task is to create a response plan strictly focused on the specified topic and strictly within the scope of the user's question.
@@ -79,7 +87,7 @@ async def generate_plan(user_question: str, llm) -> str:
         """
 
         messages = [SystemMessage(content=plan_prompt)]
-        response = llm(messages)
+        response = await ainvoke(llm, messages)
         text = response.content.strip()
         logger.info(f"План ответа для модели: {text}")
         return text
@@ -1,20 +1,111 @@
-from openai import OpenAI
-import os
-from dotenv import load_dotenv
+import asyncio
+import contextvars
 import logging
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from src.generated_answer.web_search_cache import (
+    cache_search,
+    get_cached_search,
+    web_search_key,
+)
+from src.services import metrics
+from src.services.llm_client import LLM_TIMEOUT, openai_client, record_usage
 
 logger = logging.getLogger(__name__)
 load_dotenv()
-api_key = os.getenv("GPT_SECRET_KEY_FASOLKAAI")
-client = OpenAI(api_key=api_key)
 
-def openai_web_search(query: str) -> str:
+# Модель и токены запроса и ответа одного поиска.
+SearchUsage = Tuple[str, int, int]
+
+
+@dataclass
+class InFlightSearch:
+    """
+    Выполняющийся поиск и количество запросов, ожидающих его результата.
+    """
+
+    task: "asyncio.Task[Tuple[Optional[str], Optional[SearchUsage]]]"
+    waiters: int = 0
+
+
+_in_flight: Dict[str, InFlightSearch] = {}
+
+
+async def _search(query: str, key: str) -> Tuple[Optional[str], Optional[SearchUsage]]:
     try:
-        response = client.responses.create(
+        response = await openai_client.responses.create(
             model="gpt-4o",
             tools=[{"type": "web_search_preview"}],
-            input=query
+            input=query,
+            timeout=LLM_TIMEOUT,
         )
-        return response.output_text
+        usage = None
+        if response.usage is not None:
+            usage = (
+                response.model,
+                response.usage.input_tokens,
+                response.usage.output_tokens,
+            )
+        result = response.output_text
+        if result:
+            await cache_search(key, result)
+        return result, usage
     except Exception as e:
-        logger.error(f"Ошибка при поиске: {e}")
\ No newline at end of file
+        logger.error(f"Ошибка при поиске: {e}")
+        return None, None
+
+
+async def openai_web_search(query: str) -> str:
+    """
+    Поиск информации в интернете через OpenAI Responses API.
+
+    Результаты кешируются в пределах окна актуальности (`web_search_cache`).
+    Одинаковые запросы, пришедшие во время выполнения поиска (например, от
+    параллельных пунктов плана или разных пользователей), не запускают
+    новый поиск, а ждут результата уже выполняющегося. Расход токенов поиска
+    делится поровну между дождавшимися его запросами и списывается в учёт
+    каждого из них.
+
+    Args:
+        query (str): Поисковый запрос.
+
+    Returns:
+        str: Найденная информация или None при ошибке.
+    """
+    key = web_search_key(query)
+    cached = await get_cached_search(key)
+    if cached is not None:
+        return cached
+
+    search = _in_flight.get(key)
+    if search is None:
+        # Пустой контекст: поиск общий для всех ожидающих и не должен
+        # наследовать учёт токенов запроса, который его запустил.
+        task = asyncio.create_task(
+            _search(query, key), context=contextvars.Context()
+        )
+        search = _in_flight[key] = InFlightSearch(task)
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    else:
+        metrics.increment("web_search.coalesced")
+        logger.info(f"Поиск в интернете объединён с выполняющимся: {query}")
+
+    search.waiters += 1
+    try:
+        # Отмена одного из ожидающих не должна прерывать поиск для остальных.
+        result, usage = await asyncio.shield(search.task)
+    except asyncio.CancelledError:
+        search.waiters -= 1
+        raise
+
+    if usage is not None:
+        model, input_tokens, output_tokens = usage
+        record_usage(
+            model,
+            input_tokens / search.waiters,
+            output_tokens / search.waiters,
+        )
+    return result
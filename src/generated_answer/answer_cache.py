@@ -0,0 +1,281 @@
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import FrozenSet, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from src.generated_answer.knowledge_base import embeddings, knowledge_base
+from src.services import metrics
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIZE: int = int(os.getenv("ANSWER_CACHE_SIZE", "2000"))
+ANSWER_CACHE_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.97"))
+ANSWER_CACHE_TTL: int = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_VOLATILE_TTL: int = int(os.getenv("ANSWER_CACHE_VOLATILE_TTL", "900"))
+
+_VOLATILE_PATTERN = re.compile(
+    r"\b(price|prices|cost|rate|rates|market ?cap|today|tomorrow|yesterday|now|"
+    r"current|currently|latest|recent|news|this (?:week|month|year)|"
+    r"20\d\d|цена|цены|курс|стоимость|сегодня|завтра|вчера|сейчас|новости)\b",
+    re.IGNORECASE,
+)
+
+
+# Тикеры, названия проектов и числа: слова с заглавной буквой или цифрой.
+_ENTITY_PATTERN = re.compile(r"\b\w*(?:[A-ZА-ЯЁ]|\d)\w*\b")
+
+
+def question_entities(text: str) -> FrozenSet[str]:
+    """
+    Выделяет из вопроса тикеры, названия и числа.
+
+    Эмбеддинги вопросов, отличающихся только ими («цена BTC» и «цена ETH»),
+    почти совпадают, поэтому ответ из кеша подходит, только если этот
+    набор совпадает.
+
+    Args:
+        text (str): Вопрос после `context_completion`.
+
+    Returns:
+        FrozenSet[str]: Слова вопроса в нижнем регистре.
+    """
+    return frozenset(word.lower() for word in _ENTITY_PATTERN.findall(text))
+
+
+def is_time_sensitive(text: str) -> bool:
+    """
+    Проверяет, касается ли вопрос цен, курсов, новостей или дат, ответ на
+    которые быстро устаревает.
+
+    Args:
+        text (str): Вопрос или поисковый запрос.
+
+    Returns:
+        bool: True, если ответ быстро устаревает.
+    """
+    return bool(_VOLATILE_PATTERN.search(text))
+
+
+def answer_ttl(question: str) -> int:
+    """
+    Определяет срок хранения ответа: `ANSWER_CACHE_VOLATILE_TTL` секунд для
+    вопросов, ответ на которые быстро устаревает (`is_time_sensitive`),
+    иначе `ANSWER_CACHE_TTL`.
+
+    Args:
+        question (str): Вопрос после `context_completion`.
+
+    Returns:
+        int: Срок хранения в секундах.
+    """
+    if is_time_sensitive(question):
+        return ANSWER_CACHE_VOLATILE_TTL
+    return ANSWER_CACHE_TTL
+
+
+@dataclass
+class CachedAnswer:
+    """
+    Ответ в семантическом кеше.
+
+    Attributes:
+        question (str): Вопрос, на который получен ответ.
+        answer (str): Ответ до форматирования.
+        vector (np.ndarray): Нормированный эмбеддинг вопроса.
+        entities (FrozenSet[str]): Тикеры, названия и числа вопроса (`question_entities`).
+        expires_at (float): Момент устаревания (`time.monotonic`).
+        generation_ms (float): Время получения ответа без кеша, мс.
+    """
+
+    question: str
+    answer: str
+    vector: np.ndarray
+    entities: FrozenSet[str]
+    expires_at: float
+    generation_ms: float
+
+
+class SemanticAnswerCache:
+    """
+    Кеш ответов по смыслу вопроса.
+
+    Вопрос ищется по косинусному сходству эмбеддингов: ответ возвращается,
+    если сходство с закешированным вопросом не ниже `threshold` и у вопросов
+    совпадают тикеры, названия и числа (`question_entities`). Все
+    ответы привязаны к версии базы знаний и сбрасываются при её смене.
+    Кеш хранится в памяти процесса; поиск — одно умножение матрицы на
+    вектор, что для нескольких тысяч записей занимает доли миллисекунды.
+    """
+
+    def __init__(
+        self,
+        max_size: int = ANSWER_CACHE_SIZE,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+    ) -> None:
+        """
+        Args:
+            max_size (int): Максимальное количество ответов.
+            threshold (float): Минимальное косинусное сходство вопросов.
+        """
+        self.max_size = max_size
+        self.threshold = threshold
+        self._entries: List[CachedAnswer] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._lookups = 0
+
+    def _sync_version(self, version: str) -> None:
+        if version == self._version:
+            return
+        if self._entries:
+            logger.info(
+                f"Версия базы знаний изменилась ({self._version} -> {version}), "
+                f"кеш ответов очищен: {len(self._entries)} записей"
+            )
+            metrics.increment("answer_cache.invalidations")
+        self._entries = []
+        self._matrix = None
+        self._version = version
+
+    def _drop_expired(self, now: float) -> None:
+        alive = [entry for entry in self._entries if entry.expires_at > now]
+        if len(alive) != len(self._entries):
+            self._entries = alive
+            self._matrix = None
+
+    def lookup(
+        self, question: str, vector: np.ndarray, version: str
+    ) -> Optional[CachedAnswer]:
+        """
+        Ищет ответ на вопрос, близкий по смыслу.
+
+        Args:
+            question (str): Вопрос после `context_completion`.
+            vector (np.ndarray): Нормированный эмбеддинг вопроса.
+            version (str): Текущая версия базы знаний.
+
+        Returns:
+            Optional[CachedAnswer]: Ответ или None при промахе.
+        """
+        with self._lock:
+            self._sync_version(version)
+            self._drop_expired(time.monotonic())
+            found = None
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix = np.vstack([entry.vector for entry in self._entries])
+                similarities = self._matrix @ vector
+                entities = question_entities(question)
+                candidates = np.flatnonzero(similarities >= self.threshold)
+                for index in candidates[np.argsort(similarities[candidates])[::-1]]:
+                    if self._entries[index].entities == entities:
+                        found = self._entries[index]
+                        break
+
+            self._lookups += 1
+            self._hits += found is not None
+            hit_rate = self._hits / self._lookups
+            metrics.gauge("answer_cache.size", len(self._entries))
+
+        metrics.increment("answer_cache.hits" if found else "answer_cache.misses")
+        metrics.gauge("answer_cache.hit_rate", round(hit_rate, 4))
+        return found
+
+    def store(
+        self,
+        question: str,
+        vector: np.ndarray,
+        answer: str,
+        version: str,
+        generation_ms: float,
+    ) -> None:
+        """
+        Сохраняет ответ; при переполнении вытесняется самая старая запись.
+
+        Args:
+            question (str): Вопрос после `context_completion`.
+            vector (np.ndarray): Нормированный эмбеддинг вопроса.
+            answer (str): Ответ до форматирования.
+            version (str): Версия базы знаний, по которой получен ответ.
+            generation_ms (float): Время получения ответа, мс.
+        """
+        entry = CachedAnswer(
+            question=question,
+            answer=answer,
+            vector=vector,
+            entities=question_entities(question),
+            expires_at=time.monotonic() + answer_ttl(question),
+            generation_ms=generation_ms,
+        )
+        with self._lock:
+            self._sync_version(version)
+            if len(self._entries) >= self.max_size:
+                self._entries.pop(0)
+            self._entries.append(entry)
+            self._matrix = None
+
+
+answer_cache = SemanticAnswerCache()
+
+
+def _current_version() -> str:
+    with knowledge_base() as snapshot:
+        return snapshot.version
+
+
+async def lookup_answer(
+    question: str,
+) -> Tuple[Optional[CachedAnswer], Optional[np.ndarray], str]:
+    """
+    Ищет готовый ответ на вопрос в семантическом кеше.
+
+    Эмбеддинг вопроса берётся через `CachedEmbeddings`, поэтому следующий
+    за ним поиск в базе знаний не запрашивает его повторно. При попадании
+    сэкономленное время пишется в метрику `answer_cache.latency_saved_ms`.
+
+    Args:
+        question (str): Вопрос после `context_completion`.
+
+    Returns:
+        Tuple[Optional[CachedAnswer], Optional[np.ndarray], str]: Ответ или
+            None, эмбеддинг вопроса (None, если получить его не удалось) и
+            версия базы знаний.
+    """
+    version = _current_version()
+    if not ANSWER_CACHE_ENABLED:
+        return None, None, version
+
+    started = time.perf_counter()
+    try:
+        raw = await embeddings.aembed_query(question)
+    except Exception as e:
+        logger.error(f"Ошибка получения эмбеддинга для кеша ответов: {e}")
+        return None, None, version
+
+    vector = np.asarray(raw, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector = vector / norm
+
+    cached = answer_cache.lookup(question, vector, version)
+    if cached is not None:
+        lookup_ms = (time.perf_counter() - started) * 1000
+        metrics.observe(
+            "answer_cache.latency_saved_ms", max(cached.generation_ms - lookup_ms, 0.0)
+        )
+        logger.info(
+            f"Ответ взят из кеша для вопроса «{question}» "
+            f"(закеширован для «{cached.question}»)"
+        )
+    return cached, vector, version
@@ -0,0 +1,165 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+BM25_FILE: str = "bm25.json"
+BM25_K1: float = 1.5
+BM25_B: float = 0.75
+
+_TOKEN_PATTERN = re.compile(r"\w+(?:[-.']\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Разбивает текст на термины для BM25.
+
+    Составные термины («erc-4337», «air-gapped», «web3.js») сохраняются целиком
+    и дополнительно разбиваются на части, поэтому находятся и по точному
+    написанию, и по отдельным словам.
+
+    Args:
+        text (str): Текст.
+
+    Returns:
+        List[str]: Термины в нижнем регистре.
+    """
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = re.split(r"[-.']", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+class BM25Index:
+    """
+    Инвертированный индекс BM25 по фрагментам базы знаний.
+
+    Строится из того же хранилища документов, что и FAISS индекс, и хранит
+    для каждого термина список (номер документа, частота). Поиск проходит
+    только по спискам терминов запроса и занимает миллисекунды.
+    """
+
+    def __init__(
+        self,
+        doc_ids: List[str],
+        doc_lengths: List[int],
+        postings: Dict[str, List[Tuple[int, int]]],
+    ) -> None:
+        """
+        Args:
+            doc_ids (List[str]): Идентификаторы документов в хранилище FAISS.
+            doc_lengths (List[int]): Длины документов в терминах.
+            postings (Dict[str, List[Tuple[int, int]]]): Списки вхождений терминов.
+        """
+        self.doc_ids = doc_ids
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.average_length = (
+            sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+        )
+        self.idf = {
+            term: math.log(
+                1 + (len(doc_ids) - len(entries) + 0.5) / (len(entries) + 0.5)
+            )
+            for term, entries in postings.items()
+        }
+
+    @classmethod
+    def from_texts(cls, doc_ids: List[str], texts: List[str]) -> "BM25Index":
+        """
+        Строит индекс по текстам документов.
+
+        Args:
+            doc_ids (List[str]): Идентификаторы документов.
+            texts (List[str]): Тексты документов в том же порядке.
+
+        Returns:
+            BM25Index: Индекс.
+        """
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        doc_lengths = []
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                postings.setdefault(term, []).append((position, frequency))
+        return cls(list(doc_ids), doc_lengths, postings)
+
+    def search(self, query: str, k: int, min_score: float = 0.0) -> List[Tuple[str, float]]:
+        """
+        Ищет документы по терминам запроса.
+
+        Args:
+            query (str): Запрос.
+            k (int): Максимальное количество документов.
+            min_score (float): Минимальная оценка BM25.
+
+        Returns:
+            List[Tuple[str, float]]: Пары (идентификатор, оценка) по убыванию оценки.
+        """
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            entries = self.postings.get(term)
+            if not entries:
+                continue
+            idf = self.idf[term]
+            for position, frequency in entries:
+                norm = BM25_K1 * (
+                    1 - BM25_B
+                    + BM25_B * self.doc_lengths[position] / self.average_length
+                )
+                scores[position] = scores.get(position, 0.0) + idf * (
+                    frequency * (BM25_K1 + 1) / (frequency + norm)
+                )
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [
+            (self.doc_ids[position], score)
+            for position, score in ranked[:k]
+            if score >= min_score
+        ]
+
+    def save(self, directory: str) -> None:
+        """
+        Сохраняет индекс в `bm25.json` в директории версии индекса.
+
+        Args:
+            directory (str): Директория версии индекса.
+        """
+        with open(os.path.join(directory, BM25_FILE), "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "doc_ids": self.doc_ids,
+                    "doc_lengths": self.doc_lengths,
+                    "postings": self.postings,
+                },
+                file,
+                ensure_ascii=False,
+            )
+
+    @classmethod
+    def load(cls, directory: str) -> "BM25Index":
+        """
+        Загружает индекс из `bm25.json`.
+
+        Args:
+            directory (str): Директория версии индекса.
+
+        Returns:
+            BM25Index: Индекс.
+
+        Raises:
+            FileNotFoundError: Файл индекса не найден.
+        """
+        with open(os.path.join(directory, BM25_FILE), "r", encoding="utf-8") as file:
+            data = json.load(file)
+        postings = {
+            term: [tuple(entry) for entry in entries]
+            for term, entries in data["postings"].items()
+        }
+        return cls(data["doc_ids"], data["doc_lengths"], postings)
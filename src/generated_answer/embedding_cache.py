@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import threading
+from typing import List, Optional
+
+import numpy as np
+import redis
+from cachetools import LRUCache
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from redis.exceptions import RedisError
+
+from src.services import metrics
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_TTL: int = int(os.getenv("EMBEDDING_CACHE_TTL", str(30 * 86400)))
+
+redis_client = redis.Redis(
+    host=os.getenv("REDIS_HOST"),
+    port=os.getenv("REDIS_PORT"),
+    db=1,
+    socket_timeout=0.2,
+)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Приводит текст запроса к каноническому виду: без лишних пробелов и в нижнем регистре.
+
+    Args:
+        text (str): Исходный текст.
+
+    Returns:
+        str: Нормализованный текст.
+    """
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Кеширующая обёртка над моделью эмбеддингов.
+
+    Эмбеддинг ищется в LRU-кеше процесса, затем в Redis, и только при
+    промахе обоих уровней запрашивается у модели. Ключ — хеш
+    нормализованного текста и имени модели, поэтому одинаковые запросы
+    разных пользователей не требуют повторного обращения к API.
+
+    Асинхронные методы обращаются к Redis в отдельном потоке и запрашивают
+    модель через её `aembed_*`, не блокируя цикл событий.
+    """
+
+    def __init__(self, underlying: Embeddings, model: str) -> None:
+        """
+        Args:
+            underlying (Embeddings): Модель эмбеддингов.
+            model (str): Имя модели, входит в ключ кеша.
+        """
+        self.underlying = underlying
+        self.model = model
+        self._memory: LRUCache = LRUCache(maxsize=EMBEDDING_CACHE_SIZE)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._lookups = 0
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"embedding:{self.model}:{digest}"
+
+    def _record(self, hit: bool, tier: str) -> None:
+        with self._lock:
+            self._lookups += 1
+            self._hits += hit
+            hit_rate = self._hits / self._lookups
+        metrics.increment(f"embedding_cache.{tier}")
+        metrics.gauge("embedding_cache.hit_rate", round(hit_rate, 4))
+
+    def _get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._memory.get(key)
+        if vector is not None:
+            self._record(True, "memory_hits")
+            return vector
+
+        try:
+            raw = redis_client.get(key)
+        except RedisError as e:
+            logger.warning(f"Кеш эмбеддингов в Redis недоступен: {e}")
+            raw = None
+        if raw is not None:
+            vector = np.frombuffer(raw, dtype=np.float32).tolist()
+            with self._lock:
+                self._memory[key] = vector
+            self._record(True, "redis_hits")
+            return vector
+
+        self._record(False, "misses")
+        return None
+
+    def _put(self, key: str, vector: List[float]) -> None:
+        with self._lock:
+            self._memory[key] = vector
+        try:
+            redis_client.set(
+                key,
+                np.asarray(vector, dtype=np.float32).tobytes(),
+                ex=EMBEDDING_CACHE_TTL,
+            )
+        except RedisError as e:
+            logger.warning(f"Не удалось сохранить эмбеддинг в Redis: {e}")
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Возвращает эмбеддинг запроса, по возможности из кеша.
+
+        Нормализованный текст используется только как ключ кеша; модели
+        передаётся исходный текст с сокращёнными пробелами, поэтому регистр
+        (тикеры, названия проектов) влияет на эмбеддинг так же, как без кеша.
+
+        Args:
+            text (str): Текст запроса.
+
+        Returns:
+            List[float]: Вектор эмбеддинга.
+        """
+        key = self._key(normalize_text(text))
+        vector = self._get(key)
+        if vector is None:
+            vector = self.underlying.embed_query(re.sub(r"\s+", " ", text).strip())
+            self._put(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """
+        Асинхронная версия `embed_query`.
+
+        Args:
+            text (str): Текст запроса.
+
+        Returns:
+            List[float]: Вектор эмбеддинга.
+        """
+        key = self._key(normalize_text(text))
+        vector = await asyncio.to_thread(self._get, key)
+        if vector is None:
+            vector = await self.underlying.aembed_query(
+                re.sub(r"\s+", " ", text).strip()
+            )
+            await asyncio.to_thread(self._put, key, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Возвращает эмбеддинги документов; отсутствующие в кеше запрашиваются одним вызовом.
+
+        Тексты документов не нормализуются, чтобы эмбеддинги совпадали с
+        построенными без кеша.
+
+        Args:
+            texts (List[str]): Тексты документов.
+
+        Returns:
+            List[List[float]]: Векторы эмбеддингов в порядке текстов.
+        """
+        keys = [self._key(text) for text in texts]
+        vectors: List[Optional[List[float]]] = [self._get(key) for key in keys]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.underlying.embed_documents(
+                [texts[i] for i in missing]
+            )
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+                self._put(keys[i], vector)
+        return vectors
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Асинхронная версия `embed_documents`.
+
+        Args:
+            texts (List[str]): Тексты документов.
+
+        Returns:
+            List[List[float]]: Векторы эмбеддингов в порядке текстов.
+        """
+        keys = [self._key(text) for text in texts]
+        vectors: List[Optional[List[float]]] = await asyncio.to_thread(
+            lambda: [self._get(key) for key in keys]
+        )
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = await self.underlying.aembed_documents(
+                [texts[i] for i in missing]
+            )
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+                await asyncio.to_thread(self._put, keys[i], vector)
+        return vectors
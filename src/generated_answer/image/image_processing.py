@@ -4,22 +4,20 @@ import uuid
 from typing import Tuple
 
 from dotenv import load_dotenv
-import tiktoken
-import requests
+import httpx
 import logging
-from langchain_openai import ChatOpenAI
-from db.dbworker import get_user_limit
 from src.bot.bot_messages import MESSAGES
-from db.dbworker import update_user_limit
-from src.services.count_token import count_input_tokens
+from src.services.count_token import count_image_tokens, count_input_tokens
 from src.services.clear_directory import clear_directory
+from src.services.llm_client import ainvoke, chat_model, http_client, usage_stage
+from src.services.token_ledger import TokenLedger
 from aiogram import types
 
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
-client = ChatOpenAI(model_name="gpt-4o-mini", openai_api_key=os.getenv("GPT_SECRET_KEY_FASOLKAAI"))
+client = chat_model("gpt-4o-mini")
 
 
 async def encode_image(image_path: str) -> str:
@@ -70,7 +68,7 @@ async def downloads_image(
     try:
         logger.info("URL изображения: %s", file_url)
         logger.info("Загрузка изображения...")
-        response = requests.get(file_url)
+        response = await http_client.get(file_url)
 
         if response.status_code != 200:
             logger.error(
@@ -86,7 +84,7 @@ async def downloads_image(
             f.write(response.content)
             logger.info("Изображение успешно загружено в %s", image_path)
         return image_path, base_dir
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(
             f"Ошибка запроса при загрузке изображения: {e}", exc_info=True
         )
@@ -103,7 +101,7 @@ async def downloads_image(
 
 
 async def image_processing(
-    message, question: str, bot, user_id: int, file_url: str, prompt: str
+    message, question: str, bot, ledger: TokenLedger, file_url: str, prompt: str
 ) -> str:
     """
     Обрабатывает изображение и отправляет запрос к OpenAI для получения описания.
@@ -112,7 +110,7 @@ async def image_processing(
         message: Сообщение Telegram.
         question (str): Вопрос пользователя.
         bot: Экземпляр Telegram-бота.
-        user_id (int): ID пользователя.
+        ledger (TokenLedger): Учёт токенов текущего запроса пользователя.
         file_url (str): Путь к картинке.
         prompt (str): Промт с текущей датой.
 
@@ -154,11 +152,14 @@ async def image_processing(
         ]
 
         logger.info("Подсчёт токенов в запросе...")
-        encoding = tiktoken.encoding_for_model("gpt-4o")
-        num_tokens = sum(len(encoding.encode(str(msg))) for msg in messages)
-        limit = get_user_limit(user_id)
+        photo = message.photo[-1] if message.photo else None
+        num_tokens = count_input_tokens(
+            user_input=question, prompt=prompt, model="gpt-4o"
+        ) + count_image_tokens(
+            photo.width if photo else None, photo.height if photo else None
+        )
 
-        if limit - num_tokens <= 0:
+        if not ledger.can_spend(num_tokens + 1):
             logger.warning("Недостаточно токенов.")
             await bot.edit_message_text(
                 text=MESSAGES["token_limit_exceeded"]["en"]
@@ -166,16 +167,10 @@ async def image_processing(
             return
 
         logger.info("Отправка изображения и запроса в OpenAI...")
-        response = client.invoke(messages)
+        with usage_stage("image_processing"):
+            response = await ainvoke(client, messages)
         response_text = response.content
 
-        total_tokens_response = count_input_tokens(
-            user_input=response_text, model="gpt-4o"
-        )
-        update_user_limit(
-            user_id, limit - (num_tokens + total_tokens_response)
-        )
-
         logger.info(response_text)
         if response_text:
             logger.info("Успешно получен ответ от OpenAI.")
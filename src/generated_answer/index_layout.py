@@ -0,0 +1,48 @@
+import os
+
+CURRENT_POINTER: str = "CURRENT"
+VERSIONS_DIR: str = "versions"
+VERSION_FILE: str = "VERSION"
+
+
+def resolve_index_path(root: str) -> str:
+    """
+    Возвращает путь к текущей версии индекса.
+
+    Если в `root` есть указатель `CURRENT`, используется версия из него,
+    иначе `root` считается индексом старого формата без версий.
+
+    Args:
+        root (str): Корневая директория индекса.
+
+    Returns:
+        str: Путь к директории с `index.faiss` и `index.pkl`.
+    """
+    pointer = os.path.join(root, CURRENT_POINTER)
+    if os.path.exists(pointer):
+        with open(pointer, "r", encoding="utf-8") as file:
+            return os.path.join(root, VERSIONS_DIR, file.read().strip())
+    return root
+
+
+def read_index_version(path: str) -> str:
+    """
+    Возвращает версию индекса.
+
+    Версия берётся из файла `VERSION` рядом с индексом, а для индексов без
+    него — из времени изменения и размера `index.faiss`, поэтому каждая
+    новая публикация `create_vectorstore.py` получает новую версию.
+
+    Args:
+        path (str): Путь к директории версии индекса.
+
+    Returns:
+        str: Версия индекса.
+    """
+    version_path = os.path.join(path, VERSION_FILE)
+    if os.path.exists(version_path):
+        with open(version_path, encoding="utf-8") as file:
+            return file.read().strip()
+
+    stat = os.stat(os.path.join(path, "index.faiss"))
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
@@ -0,0 +1,179 @@
+import logging
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES: List[str] = ["flat", "ivfpq", "hnsw", "sq8"]
+DEFAULT_NLIST: int = 1024
+DEFAULT_PQ_M: int = 64
+DEFAULT_HNSW_M: int = 32
+PQ_TRAINING_POINTS: int = 256
+MIN_POINTS_PER_CENTROID: int = 39
+
+
+def index_factory_string(
+    index_type: str,
+    count: int,
+    nlist: int = DEFAULT_NLIST,
+    pq_m: int = DEFAULT_PQ_M,
+    hnsw_m: int = DEFAULT_HNSW_M,
+) -> str:
+    """
+    Строит описание индекса для `faiss.index_factory`.
+
+    - `flat` — точный поиск, все векторы в float32.
+    - `ivfpq` — `nlist` кластеров и product quantization по `pq_m` подвекторам
+      по 8 бит: порядка `pq_m` байт на вектор вместо `4 * d`.
+    - `hnsw` — граф HNSW с `hnsw_m` связями, векторы без сжатия.
+    - `sq8` — скалярное квантование до 8 бит на компоненту, в 4 раза меньше flat.
+
+    Для IVF число кластеров уменьшается, если векторов меньше, чем нужно для
+    обучения `nlist` центроидов.
+
+    Args:
+        index_type (str): Тип индекса из `INDEX_TYPES`.
+        count (int): Количество векторов для обучения.
+        nlist (int): Число кластеров IVF.
+        pq_m (int): Число подвекторов PQ, должно делить размерность.
+        hnsw_m (int): Число связей HNSW.
+
+    Returns:
+        str: Описание индекса.
+
+    Raises:
+        ValueError: Неизвестный тип индекса.
+    """
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivfpq":
+        nlist = max(1, min(nlist, count // MIN_POINTS_PER_CENTROID))
+        return f"IVF{nlist},PQ{pq_m}x8"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m}"
+    if index_type == "sq8":
+        return "SQ8"
+    raise ValueError(f"Неизвестный тип индекса: {index_type}")
+
+
+def create_index(
+    index_type: str,
+    vectors: np.ndarray,
+    nlist: int = DEFAULT_NLIST,
+    pq_m: int = DEFAULT_PQ_M,
+    hnsw_m: int = DEFAULT_HNSW_M,
+) -> faiss.Index:
+    """
+    Создаёт и обучает пустой индекс заданного типа.
+
+    Векторы только используются для обучения и в индекс не добавляются.
+    Для PQ нужно не меньше `PQ_TRAINING_POINTS` векторов: на меньшей базе
+    знаний вместо `ivfpq` создаётся flat индекс.
+
+    Args:
+        index_type (str): Тип индекса из `INDEX_TYPES`.
+        vectors (np.ndarray): Векторы float32 формы (n, d).
+        nlist (int): Число кластеров IVF.
+        pq_m (int): Число подвекторов PQ.
+        hnsw_m (int): Число связей HNSW.
+
+    Returns:
+        faiss.Index: Обученный пустой индекс.
+    """
+    count, dimension = vectors.shape
+    if index_type == "ivfpq" and count < PQ_TRAINING_POINTS:
+        logger.warning(
+            f"Для ivfpq нужно не меньше {PQ_TRAINING_POINTS} векторов, "
+            f"а их {count}: создаётся flat индекс."
+        )
+        index_type = "flat"
+
+    description = index_factory_string(index_type, count, nlist, pq_m, hnsw_m)
+    index = faiss.index_factory(dimension, description, faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(vectors)
+    logger.info(f"Создан индекс {description} для {count} векторов.")
+    return index
+
+
+def set_search_params(
+    index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None
+) -> None:
+    """
+    Задаёт параметры поиска, если тип индекса их поддерживает.
+
+    Args:
+        index (faiss.Index): Индекс.
+        nprobe (Optional[int]): Число просматриваемых кластеров IVF.
+        ef_search (Optional[int]): Размер очереди поиска HNSW.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW) and ef_search:
+        index.hnsw.efSearch = ef_search
+
+
+def supports_incremental_delete(index: faiss.Index) -> bool:
+    """
+    Можно ли удалять векторы из индекса без пересборки.
+
+    LangChain после `remove_ids` нумерует оставшиеся векторы подряд, что
+    верно только для индексов с плоским хранением кодов (flat, SQ): они
+    сдвигают векторы при удалении. IVF сохраняет исходные номера, а HNSW
+    удаление не поддерживает, поэтому такие индексы пересобираются.
+
+    Args:
+        index (faiss.Index): Индекс.
+
+    Returns:
+        bool: True для flat и SQ индексов.
+    """
+    return isinstance(index, faiss.IndexFlatCodes)
+
+
+def index_type_of(index: faiss.Index) -> str:
+    """
+    Определяет тип загруженного индекса в терминах `INDEX_TYPES`.
+
+    Args:
+        index (faiss.Index): Индекс.
+
+    Returns:
+        str: Тип индекса; неизвестные типы считаются `flat`.
+    """
+    if faiss.try_extract_index_ivf(index) is not None:
+        return "ivfpq"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "sq8"
+    return "flat"
+
+
+def describe_index(index: faiss.Index) -> Dict[str, object]:
+    """
+    Краткое описание индекса для вывода в `create_vectorstore.py inspect`.
+
+    Args:
+        index (faiss.Index): Индекс.
+
+    Returns:
+        Dict[str, object]: Класс, размерность, число векторов и размер в байтах.
+    """
+    description: Dict[str, object] = {
+        "class": type(index).__name__,
+        "dimension": index.d,
+        "vectors": index.ntotal,
+        "bytes": faiss.serialize_index(index).nbytes,
+    }
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        description["nlist"] = ivf.nlist
+        description["nprobe"] = ivf.nprobe
+    if isinstance(index, faiss.IndexHNSW):
+        description["efSearch"] = index.hnsw.efSearch
+    return description
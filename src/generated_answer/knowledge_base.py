@@ -0,0 +1,391 @@
+import asyncio
+import logging
+import os
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import faiss
+from dotenv import load_dotenv
+from langchain.vectorstores import FAISS
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from src.generated_answer.bm25_index import BM25Index
+from src.generated_answer.embedding_cache import CachedEmbeddings
+from src.generated_answer.index_layout import read_index_version, resolve_index_path
+from src.generated_answer.index_types import set_search_params
+from src.services import metrics
+from src.services.llm_client import ClientEmbeddings
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+API_KEY: str = os.getenv("GPT_SECRET_KEY_FASOLKAAI", "")
+FAISS_INDEX_PATH: str = os.getenv("FAISS_INDEX_PATH", "faiss_index_RU")
+FAISS_MMAP: bool = os.getenv("FAISS_MMAP", "false").lower() == "true"
+FAISS_RELOAD_INTERVAL: int = int(os.getenv("FAISS_RELOAD_INTERVAL", "60"))
+FAISS_DRAIN_TIMEOUT: int = int(os.getenv("FAISS_DRAIN_TIMEOUT", "120"))
+FAISS_NPROBE: int = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH: int = int(os.getenv("FAISS_EF_SEARCH", "64"))
+EMBEDDING_MODEL: str = "text-embedding-ada-002"
+SCORE_THRESHOLD: float = 0.78
+SEARCH_K: int = 6
+BM25_MIN_SCORE: float = float(os.getenv("BM25_MIN_SCORE", "2.0"))
+HYBRID_FETCH_K: int = int(os.getenv("HYBRID_FETCH_K", "20"))
+RRF_K: int = 60
+
+if not API_KEY:
+    raise ValueError("API-ключ OpenAI не найден. Проверьте файл .env.")
+
+embeddings = CachedEmbeddings(ClientEmbeddings(EMBEDDING_MODEL), EMBEDDING_MODEL)
+
+
+def load_vectorstore(path: str = FAISS_INDEX_PATH, mmap: bool = FAISS_MMAP) -> FAISS:
+    """
+    Загружает FAISS индекс базы знаний.
+
+    `path` может указывать на версионную директорию с указателем `CURRENT`
+    (см. `create_vectorstore.py`) или на индекс старого формата.
+
+    При `mmap=True` векторы индекса отображаются в память с диска и не
+    копируются в память процесса; если тип индекса этого не поддерживает,
+    индекс загружается обычным способом.
+
+    Тип индекса определяется файлом (flat, IVF-PQ, HNSW, SQ8, см.
+    `index_types.py`); параметры поиска IVF и HNSW задаются переменными
+    `FAISS_NPROBE` и `FAISS_EF_SEARCH`.
+
+    Args:
+        path (str): Корневая директория индекса.
+        mmap (bool): Отобразить индекс в память вместо чтения.
+
+    Returns:
+        FAISS: Векторное хранилище.
+
+    Raises:
+        FileNotFoundError: Файлы индекса не найдены.
+        RuntimeError: Ошибка чтения индекса FAISS.
+    """
+    path = resolve_index_path(path)
+    if mmap:
+        try:
+            index = faiss.read_index(
+                os.path.join(path, "index.faiss"),
+                faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+            )
+            with open(os.path.join(path, "index.pkl"), "rb") as file:
+                docstore, index_to_docstore_id = pickle.load(file)
+            set_search_params(index, FAISS_NPROBE, FAISS_EF_SEARCH)
+            logger.info(f"FAISS индекс {path} отображён в память.")
+            return FAISS(embeddings, index, docstore, index_to_docstore_id)
+        except RuntimeError as e:
+            logger.warning(
+                f"Индекс {path} не поддерживает отображение в память, загружаем полностью: {e}"
+            )
+
+    vectorstore = FAISS.load_local(
+        path, embeddings, allow_dangerous_deserialization=True
+    )
+    set_search_params(vectorstore.index, FAISS_NPROBE, FAISS_EF_SEARCH)
+    logger.info(f"FAISS индекс {path} успешно загружен.")
+    return vectorstore
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[Document]], k: int = RRF_K
+) -> List[Document]:
+    """
+    Объединяет несколько ранжированных списков документов методом reciprocal rank fusion.
+
+    Оценка документа — сумма `1 / (k + ранг)` по всем спискам, где он найден,
+    поэтому документ, найденный и по смыслу, и по точным терминам, поднимается
+    выше, а оценки разных поисков не нужно приводить к одной шкале.
+
+    Args:
+        rankings (List[List[Document]]): Списки документов по убыванию релевантности.
+        k (int): Сглаживающая константа RRF.
+
+    Returns:
+        List[Document]: Документы по убыванию суммарной оценки.
+    """
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = document.page_content
+            scores[key] = scores.get(key, 0.0) + 1 / (k + rank)
+            documents.setdefault(key, document)
+    return [
+        documents[key]
+        for key in sorted(scores, key=lambda key: scores[key], reverse=True)
+    ]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Ретривер базы знаний: векторный поиск FAISS и BM25 по тем же фрагментам.
+
+    Векторный поиск находит документы по смыслу, BM25 — по точным терминам
+    (тикерам, названиям стандартов и контрактов), которые часто не проходят
+    порог сходства эмбеддингов. Результаты объединяются через
+    `reciprocal_rank_fusion`.
+
+    Возвращаются копии документов с оценками `vector_score` (релевантность
+    эмбеддингов от 0 до 1, 0 — если найден только BM25) и `bm25_score` в
+    метаданных; их использует упаковка контекста (`rag/context_packing.py`).
+    """
+
+    vectorstore: FAISS
+    bm25: BM25Index
+    k: int = SEARCH_K
+    score_threshold: Optional[float] = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector_results = self.vectorstore.similarity_search_with_relevance_scores(
+            query, k=HYBRID_FETCH_K, score_threshold=self.score_threshold
+        )
+        vector_documents = [document for document, _ in vector_results]
+
+        started = time.perf_counter()
+        lexical_results = self.bm25.search(query, HYBRID_FETCH_K, BM25_MIN_SCORE)
+        metrics.observe("bm25.search_ms", (time.perf_counter() - started) * 1000)
+        lexical_matches = [
+            (self.vectorstore.docstore.search(doc_id), score)
+            for doc_id, score in lexical_results
+        ]
+        lexical_matches = [
+            (document, score)
+            for document, score in lexical_matches
+            if isinstance(document, Document)
+        ]
+        lexical_documents = [document for document, _ in lexical_matches]
+
+        documents = reciprocal_rank_fusion([vector_documents, lexical_documents])
+        if lexical_documents and not vector_documents:
+            metrics.increment("hybrid_search.lexical_only")
+
+        vector_scores = {
+            document.page_content: score for document, score in vector_results
+        }
+        lexical_scores = {
+            document.page_content: score for document, score in lexical_matches
+        }
+        return [
+            Document(
+                page_content=document.page_content,
+                metadata={
+                    **document.metadata,
+                    "vector_score": vector_scores.get(document.page_content, 0.0),
+                    "bm25_score": lexical_scores.get(document.page_content, 0.0),
+                },
+            )
+            for document in documents[: self.k]
+        ]
+
+
+def load_bm25(path: str, vectorstore: FAISS) -> BM25Index:
+    """
+    Загружает BM25 индекс версии или строит его по хранилищу документов FAISS.
+
+    Индексы, собранные до появления BM25, не содержат `bm25.json`; для них
+    индекс строится при загрузке из тех же фрагментов.
+
+    Args:
+        path (str): Директория версии индекса.
+        vectorstore (FAISS): Загруженное векторное хранилище.
+
+    Returns:
+        BM25Index: BM25 индекс.
+    """
+    try:
+        return BM25Index.load(path)
+    except FileNotFoundError:
+        documents = vectorstore.docstore._dict
+        logger.info(
+            f"BM25 индекс для {path} не найден, строим по {len(documents)} документам."
+        )
+        return BM25Index.from_texts(
+            list(documents),
+            [document.page_content for document in documents.values()],
+        )
+
+
+class KnowledgeBaseSnapshot:
+    """
+    Загруженная версия индекса базы знаний и счётчик её читателей.
+
+    Снимок не изменяется после создания: перезагрузка создаёт новый снимок,
+    а старый освобождается, когда его перестают использовать.
+    """
+
+    def __init__(self, vectorstore: FAISS, version: str, bm25: BM25Index) -> None:
+        """
+        Args:
+            vectorstore (FAISS): Векторное хранилище.
+            version (str): Версия индекса.
+            bm25 (BM25Index): BM25 индекс по тем же фрагментам.
+        """
+        self.vectorstore: Optional[FAISS] = vectorstore
+        self.bm25: Optional[BM25Index] = bm25
+        self.version = version
+        self._readers = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._condition:
+            self._readers += 1
+
+    def release(self) -> None:
+        with self._condition:
+            self._readers -= 1
+            if self._readers == 0:
+                self._condition.notify_all()
+
+    def wait_drained(self, timeout: float) -> bool:
+        """
+        Ждёт завершения всех запросов к снимку.
+
+        Args:
+            timeout (float): Максимальное время ожидания в секундах.
+
+        Returns:
+            bool: True, если читателей не осталось.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._readers == 0, timeout)
+
+    def threshold_retriever(self) -> HybridRetriever:
+        """
+        Ретривер агента: до `SEARCH_K` документов; векторные кандидаты
+        отбираются с релевантностью не ниже `SCORE_THRESHOLD`, BM25 —
+        с оценкой не ниже `BM25_MIN_SCORE`.
+        """
+        return HybridRetriever(
+            vectorstore=self.vectorstore,
+            bm25=self.bm25,
+            k=SEARCH_K,
+            score_threshold=SCORE_THRESHOLD,
+        )
+
+    def similarity_retriever(self, k: int = SEARCH_K) -> HybridRetriever:
+        """
+        Ретривер RAG-цепочки: `k` документов без порога векторного сходства.
+        """
+        return HybridRetriever(vectorstore=self.vectorstore, bm25=self.bm25, k=k)
+
+
+def load_snapshot(path: str) -> KnowledgeBaseSnapshot:
+    """
+    Загружает версию индекса базы знаний вместе с BM25 индексом.
+
+    Args:
+        path (str): Директория версии индекса.
+
+    Returns:
+        KnowledgeBaseSnapshot: Снимок индекса.
+    """
+    vectorstore = load_vectorstore(path)
+    return KnowledgeBaseSnapshot(
+        vectorstore, read_index_version(path), load_bm25(path, vectorstore)
+    )
+
+
+_current_lock = threading.Lock()
+_reload_lock = threading.Lock()
+
+try:
+    _current = load_snapshot(resolve_index_path(FAISS_INDEX_PATH))
+except Exception as e:
+    logger.error(f"Ошибка загрузки FAISS индекса: {e}")
+    raise
+
+
+@contextmanager
+def knowledge_base() -> Iterator[KnowledgeBaseSnapshot]:
+    """
+    Выдаёт текущий снимок индекса на время запроса.
+
+    Пока блок `with` не завершён, снимок не освобождается, даже если за это
+    время опубликована и загружена новая версия. Ретриверы, полученные из
+    снимка, нельзя использовать за пределами блока.
+
+    Yields:
+        KnowledgeBaseSnapshot: Снимок индекса.
+    """
+    with _current_lock:
+        snapshot = _current
+        snapshot.acquire()
+    try:
+        yield snapshot
+    finally:
+        snapshot.release()
+
+
+def reload_knowledge_base() -> bool:
+    """
+    Загружает опубликованную версию индекса и атомарно подменяет ею текущую.
+
+    Схема read-copy-update: новая версия загружается целиком, пока запросы
+    обслуживаются старой; затем ссылка на текущий снимок заменяется под
+    блокировкой, и новые запросы получают новый снимок. Старый снимок
+    освобождается после завершения начатых на нём запросов, но не дольше
+    `FAISS_DRAIN_TIMEOUT` секунд ожидания. При ошибке загрузки в работе
+    остаётся старый индекс.
+
+    Вызывается из фонового потока: загрузка и ожидание блокирующие.
+
+    Returns:
+        bool: True, если индекс был заменён.
+    """
+    global _current
+
+    with _reload_lock:
+        path = resolve_index_path(FAISS_INDEX_PATH)
+        version = read_index_version(path)
+        if version == _current.version:
+            return False
+
+        snapshot = load_snapshot(path)
+        with _current_lock:
+            previous, _current = _current, snapshot
+        logger.info(
+            f"FAISS индекс заменён: версия {previous.version} -> {version}."
+        )
+
+        if previous.wait_drained(FAISS_DRAIN_TIMEOUT):
+            previous.vectorstore = previous.bm25 = None
+            logger.info(f"FAISS индекс версии {previous.version} освобождён.")
+        else:
+            logger.warning(
+                f"Запросы к FAISS индексу версии {previous.version} не завершились "
+                f"за {FAISS_DRAIN_TIMEOUT} с, индекс будет освобождён после них."
+            )
+        return True
+
+
+async def watch_knowledge_base(interval: int = FAISS_RELOAD_INTERVAL) -> None:
+    """
+    Следит за указателем `CURRENT` и подхватывает новые версии индекса.
+
+    Раз в `interval` секунд проверяется версия опубликованного индекса;
+    загрузка новой версии выполняется в отдельном потоке, чтобы не
+    блокировать цикл событий.
+
+    Args:
+        interval (int): Интервал проверки в секундах.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(reload_knowledge_base)
+        except FileNotFoundError as e:
+            logger.error(f"Файлы новой версии FAISS индекса не найдены: {e}")
+        except Exception as e:
+            logger.error(f"Ошибка перезагрузки FAISS индекса: {e}")
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import os
+import time
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from dotenv import load_dotenv
+
+from src.generated_answer.agent.agent_response import llm, run_agent
+from src.generated_answer.agent.agent_thematic import (
+    context_completion,
+    has_knowledge,
+    is_crypto_related,
+)
+from src.generated_answer.agent.bot_link import bot_link
+from src.generated_answer.agent.faiss_search import knowledge_base_search
+from src.generated_answer.agent.generate_plan import generate_plan
+from src.generated_answer.answer_cache import answer_cache, lookup_answer
+from src.services import metrics
+from src.services.llm_client import usage_stage
+from src.services.token_ledger import TokenLedger
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+PIPELINE_SPECULATIVE_PLAN: bool = (
+    os.getenv("PIPELINE_SPECULATIVE_PLAN", "true").lower() == "true"
+)
+
+T = TypeVar("T")
+
+
+class OffTopicQuestion(Exception):
+    """
+    Вопрос не относится к тематике бота.
+    """
+
+
+class StageTimer:
+    """
+    Замеряет длительность этапов обработки одного запроса.
+
+    Этапы могут выполняться параллельно, поэтому сумма их длительностей
+    может превышать общее время запроса.
+    """
+
+    def __init__(self) -> None:
+        self.timings: Dict[str, float] = {}
+        self._started = time.perf_counter()
+
+    async def run(self, name: str, awaitable: Awaitable[T]) -> T:
+        """
+        Выполняет этап и записывает его длительность в метрику `pipeline.<этап>_ms`.
+        Расход токенов вызовов модели внутри этапа относится к этому этапу.
+
+        Args:
+            name (str): Имя этапа.
+            awaitable (Awaitable[T]): Корутина этапа.
+
+        Returns:
+            T: Результат этапа.
+        """
+        started = time.perf_counter()
+        try:
+            with usage_stage(name):
+                return await awaitable
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.timings[name] = elapsed
+            metrics.observe(f"pipeline.{name}_ms", elapsed)
+
+    def report(self, user_id: int) -> None:
+        total = (time.perf_counter() - self._started) * 1000
+        metrics.observe("pipeline.total_ms", total)
+        stages = ", ".join(
+            f"{name}={elapsed:.0f}" for name, elapsed in self.timings.items()
+        )
+        logger.info(
+            f"Этапы ответа пользователю {user_id}, мс: {stages}; всего {total:.0f}"
+        )
+
+
+def _cancel(tasks: List[Optional[asyncio.Task]]) -> None:
+    for task in tasks:
+        if task is not None and not task.done():
+            task.cancel()
+
+
+async def answer_text_question(
+    ledger: TokenLedger,
+    question: str,
+    history: List[Dict[str, str]],
+    prompt_text: str,
+    on_token: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> Union[str, Tuple[None, str]]:
+    """
+    Отвечает на текстовый вопрос, выполняя независимые этапы параллельно.
+
+    Порядок этапов: `context_completion`, поиск в семантическом кеше
+    ответов, поиск в базе знаний, затем
+    параллельно `is_crypto_related`, `generate_plan` и `bot_link`; после
+    плана — `run_agent`, к ответу которого добавляется результат `bot_link`.
+
+    - Поиск в базе знаний выполняется один раз, его результат получают и
+      проверка тематики, и планирование.
+    - `bot_link` не зависит от ответа и выполняется параллельно с остальными
+      этапами.
+    - Если вопрос найден в базе знаний, он тематический без обращения к
+      модели, и план строится сразу. Иначе план строится спекулятивно
+      одновременно с проверкой тематики (`PIPELINE_SPECULATIVE_PLAN`) и
+      отменяется, если вопрос не тематический.
+
+    - Если на близкий по смыслу вопрос уже есть ответ в кеше
+      (`answer_cache`), он возвращается сразу, остальные этапы не
+      выполняются. Новый ответ сохраняется в кеш, если он построен без
+      истории диалога.
+
+    Длительность каждого этапа пишется в лог и в метрики `pipeline.*_ms`.
+
+    Args:
+        ledger (TokenLedger): Учёт токенов запроса.
+        question (str): Вопрос пользователя.
+        history (List[Dict[str, str]]): История диалога.
+        prompt_text (str): Системный промпт агента.
+        on_token (Optional[Callable[[str], Awaitable[None]]]): Обработчик
+            фрагментов итогового ответа; если передан, итоговая генерация
+            выполняется потоково.
+
+    Returns:
+        Union[str, Tuple[None, str]]: Ответ.
+
+    Raises:
+        OffTopicQuestion: Вопрос не относится к тематике бота.
+        ValueError: Модель не сформировала ответ.
+    """
+    started = time.perf_counter()
+    timer = StageTimer()
+    link_task: Optional[asyncio.Task] = None
+    plan_task: Optional[asyncio.Task] = None
+    try:
+        context_question = await timer.run(
+            "context_completion", context_completion(question, ledger)
+        )
+        cached, question_vector, kb_version = await timer.run(
+            "answer_cache", lookup_answer(context_question)
+        )
+        if cached is not None:
+            return cached.answer
+
+        knowledge = await timer.run(
+            "knowledge_base_search",
+            asyncio.to_thread(knowledge_base_search, context_question),
+        )
+
+        link_task = asyncio.create_task(
+            timer.run("bot_link", bot_link(context_question, ledger, llm))
+        )
+        if has_knowledge(knowledge) or PIPELINE_SPECULATIVE_PLAN:
+            plan_task = asyncio.create_task(
+                timer.run(
+                    "generate_plan",
+                    generate_plan(context_question, llm, knowledge),
+                )
+            )
+
+        thematic = await timer.run(
+            "is_crypto_related",
+            is_crypto_related(context_question, ledger, knowledge),
+        )
+        if not thematic:
+            raise OffTopicQuestion(context_question)
+
+        if plan_task is None:
+            plan_task = asyncio.create_task(
+                timer.run(
+                    "generate_plan",
+                    generate_plan(context_question, llm, knowledge),
+                )
+            )
+        plan_answer = await plan_task
+
+        answer = await timer.run(
+            "run_agent",
+            run_agent(
+                ledger,
+                context_question,
+                history,
+                prompt_text=prompt_text,
+                plan_answer=plan_answer,
+                on_token=on_token,
+            ),
+        )
+        if not answer:
+            raise ValueError("Пустой ответ от модели")
+        try:
+            link = await link_task
+        except Exception as e:
+            # Ответ уже сформирован (и, возможно, показан потоково),
+            # ошибка подбора ссылки не должна его отбрасывать.
+            logger.error(f"Ошибка при подборе ссылки для ответа: {e}")
+            link = None
+        if isinstance(answer, str) and link:
+            answer += link
+        # Ответ, построенный с учётом истории диалога, может содержать
+        # сведения из переписки пользователя, а кеш общий для всех.
+        if (
+            question_vector is not None
+            and not history
+            and isinstance(answer, str)
+            and not answer.startswith(("Error", "Ошибка"))
+        ):
+            answer_cache.store(
+                context_question,
+                question_vector,
+                answer,
+                kb_version,
+                (time.perf_counter() - started) * 1000,
+            )
+        return answer
+    except BaseException:
+        _cancel([link_task, plan_task])
+        raise
+    finally:
+        timer.report(ledger.user_id)
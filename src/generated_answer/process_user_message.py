@@ -1,53 +1,114 @@
 import logging
+import time
 from datetime import datetime
 
 from openai import BadRequestError, RateLimitError
 from aiogram.types import ChatActions
+from aiogram.utils.exceptions import TelegramAPIError
 
-from db.dbworker import add_history_entry, get_user_limit, update_user_limit
+from db.dbworker import add_history_entry, get_user_history
 from src.bot.bot_messages import MESSAGES, MESSAGES_ERROR
 from src.bot.promt import PROMTS
 from src.generated_answer.rag.rag_response import run_gpt
-from src.generated_answer.agent.agent_response import run_agent
+from src.generated_answer.pipeline import OffTopicQuestion, answer_text_question
 from src.generated_answer.image.image_processing import image_processing
-from src.generated_answer.text_formatting import convert_markdown_to_markdownv2
+from src.generated_answer.streaming_message import (
+    STREAM_EDIT_INTERVAL,
+    STREAM_GROUP_EDIT_INTERVAL,
+    STREAMING_ANSWERS,
+    StreamingMessage,
+    observe_first_visible,
+)
+from src.generated_answer.text_formatting import (
+    convert_markdown_to_markdownv2,
+    smart_split_text,
+)
 from src.keyboards.drating_inline_buttons_keyboard import (
     drating_inline_buttons_keyboard,
 )
-from src.generated_answer.agent.agent_thematic import is_crypto_related, context_completion
+from src.services.llm_client import current_ledger
+from src.services.request_scheduler import request_scheduler
+from src.services.token_ledger import TokenLedger
 
 logger = logging.getLogger(__name__)
 
-async def smart_split_text(text, max_length=4000):
+async def process_user_message(
+    user_id: int,
+    chat_id: str,
+    text: str,
+    history: list,
+    prompt: str,
+    bot,
+    ledger: TokenLedger,
+    message=None,
+    data_from_question=None,
+    file_url=None,
+) -> None:
     """
-    Разбивает текст по абзацам, сохраняя форматирование MarkdownV2.
-    Никогда не разрывает Markdown-выделения и формулы.
+    Ставит сообщение пользователя в очередь `request_scheduler` и
+    обрабатывает его, когда освободится слот (`answer_user_message`).
+
+    Если свободного слота нет, пользователь получает сообщение с позицией в
+    очереди. После ожидания история диалога читается заново: за это время
+    могли быть обработаны предыдущие сообщения пользователя. Получив слот,
+    запрос резервирует токены лимита (`TokenLedger.reserve`).
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+        chat_id (int): Идентификатор чата.
+        text (str): Текст сообщения.
+        history (list): История диалога.
+        prompt (str): Тип запроса.
+        bot: Telegram-бот.
+        ledger (TokenLedger): Учёт токенов запроса.
+        message: Объект сообщения Telegram.
+        data_from_question: Дополнительные данные для обработки запроса.
+        file_url
     """
-    paragraphs = text.split("\n")
-    messages = []
-    current_message = ""
+    queue_message = None
 
-    for paragraph in paragraphs:
-        if len(current_message) + len(paragraph) + 1 <= max_length:
-            current_message += paragraph + "\n"
-        else:
-            if current_message:
-                messages.append(current_message.strip())
-            current_message = paragraph + "\n"
+    async def notify_queued(position: int) -> None:
+        nonlocal queue_message
+        queue_message = await bot.send_message(
+            chat_id=chat_id,
+            text=MESSAGES["queue_position"]["en"].format(position=position),
+        )
 
-    if current_message:
-        messages.append(current_message.strip())
+    async with request_scheduler.slot(user_id, on_queued=notify_queued) as queued:
+        if queue_message is not None:
+            try:
+                await bot.delete_message(
+                    chat_id=chat_id, message_id=queue_message.message_id
+                )
+            except TelegramAPIError as e:
+                logger.warning(f"Не удалось удалить сообщение об очереди: {e}")
 
-    return messages
+        if queued:
+            history = await get_user_history(user_id)
+        await ledger.reserve()
 
+        await answer_user_message(
+            user_id,
+            chat_id,
+            text,
+            history,
+            prompt,
+            bot,
+            ledger,
+            message=message,
+            data_from_question=data_from_question,
+            file_url=file_url,
+        )
 
-async def process_user_message(
+
+async def answer_user_message(
     user_id: int,
     chat_id: str,
     text: str,
     history: list,
     prompt: str,
     bot,
+    ledger: TokenLedger,
     message=None,
     data_from_question=None,
     file_url=None,
@@ -62,6 +123,9 @@ async def process_user_message(
         history (list): История диалога.
         prompt (str): Тип запроса.
         bot: Telegram-бот.
+        ledger (TokenLedger): Учёт токенов запроса: на время обработки
+            становится `current_ledger`, в него списывается фактический расход
+            всех вызовов модели; фиксируется по завершении обработки.
         message: Объект сообщения Telegram.
         data_from_question: Дополнительные данные для обработки запроса.
         file_url
@@ -71,6 +135,9 @@ async def process_user_message(
         RateLimitError: Если превышено ограничение на количество запросов.
         Exception: Для всех остальных непредвиденных ошибок.
     """
+    started = time.perf_counter()
+    streamer = None
+    ledger_token = current_ledger.set(ledger)
     try:
         await bot.send_chat_action(
             chat_id=message.chat.id, action=ChatActions.TYPING
@@ -86,11 +153,11 @@ async def process_user_message(
         prompt_and_data = PROMTS[prompt]["en"] + f"{datetime.now()}"
         if prompt == "image":
             response = await image_processing(
-                message, text, bot, user_id, file_url, prompt=prompt_and_data
+                message, text, bot, ledger, file_url, prompt=prompt_and_data
             )
         elif prompt in ("you_tube_link", "link", "document"):
             response = await run_gpt(
-                user_id,
+                ledger,
                 bot,
                 prompt_text=prompt_and_data,
                 user_input=text,
@@ -99,24 +166,41 @@ async def process_user_message(
             question, name_document_link = data_from_question
             text = f'User request: {question}. The user provided a link: "{name_document_link}"'
         else:
-            context_question = await context_completion(text, user_id)
-            thematic_check = await is_crypto_related(context_question, user_id)
-            if thematic_check:
-                response_gent = await run_agent(
-                    user_id, context_question, history, prompt_text=prompt_and_data
+            if STREAMING_ANSWERS:
+                streamer = StreamingMessage(
+                    bot,
+                    chat_id,
+                    first_message.message_id,
+                    started,
+                    interval=(
+                        STREAM_EDIT_INTERVAL
+                        if chat_id == user_id
+                        else STREAM_GROUP_EDIT_INTERVAL
+                    ),
+                )
+            try:
+                response = await answer_text_question(
+                    ledger,
+                    text,
+                    history,
+                    prompt_text=prompt_and_data,
+                    on_token=streamer.append if streamer else None,
                 )
-                response = response_gent
-            else:
+            except OffTopicQuestion:
                 await bot.send_message(
                     chat_id=chat_id,
                     text="I only respond to questions related to cryptocurrencies, blockchain, finance, and development in these areas. If you have specific questions on any of these topics, please feel free to ask!"
                 )
                 return
+            if isinstance(response, tuple):
+                # run_agent прервал ответ: лимит токенов исчерпан.
+                await bot.send_message(chat_id=chat_id, text=response[1])
+                return
 
         if not response:
             raise ValueError("Пустой ответ от модели")
 
-        assistant_response_id = add_history_entry(user_id, text, response)
+        assistant_response_id = await add_history_entry(user_id, text, response)
         if chat_id == user_id:
             rating_keyboard = drating_inline_buttons_keyboard(
                 assistant_response_id
@@ -130,13 +214,17 @@ async def process_user_message(
         logger.info(f"Текс не переведенный в markdownv2{response_with_rating}")
         formatted_text = convert_markdown_to_markdownv2(response_with_rating)
         logger.info(f"Текс переведенный в markdownv2{formatted_text}")
-        for part in await smart_split_text(formatted_text):
-            await bot.send_message(
-                chat_id=chat_id,
-                text=part,
-                reply_markup=rating_keyboard,
-                parse_mode="MarkdownV2"
-            )
+        if streamer is not None and streamer.visible:
+            await streamer.finish(formatted_text, reply_markup=rating_keyboard)
+        else:
+            for part in await smart_split_text(formatted_text):
+                await bot.send_message(
+                    chat_id=chat_id,
+                    text=part,
+                    reply_markup=rating_keyboard,
+                    parse_mode="MarkdownV2"
+                )
+            observe_first_visible(started, streamed=False)
 
     except ValueError as ve:
         logger.error(f"Ошибка: {ve}")
@@ -163,6 +251,9 @@ async def process_user_message(
             chat_id=chat_id, text=MESSAGES_ERROR["error_response"]["en"]
         )
     finally:
-        await bot.delete_message(
-            chat_id=chat_id, message_id=first_message.message_id
-        )
+        current_ledger.reset(ledger_token)
+        await ledger.commit()
+        if streamer is None or not streamer.visible:
+            await bot.delete_message(
+                chat_id=chat_id, message_id=first_message.message_id
+            )
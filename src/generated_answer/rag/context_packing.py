@@ -0,0 +1,188 @@
+import logging
+import os
+from dataclasses import dataclass
+from typing import List, Set, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from src.generated_answer.bm25_index import tokenize
+from src.services import metrics
+from src.services.count_token import count_tokens_batch, get_encoding
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2500"))
+CONTEXT_MAX_DOCS: int = int(os.getenv("CONTEXT_MAX_DOCS", "6"))
+CONTEXT_DEDUP_THRESHOLD: float = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+CONTEXT_LEXICAL_WEIGHT: float = float(os.getenv("CONTEXT_LEXICAL_WEIGHT", "0.4"))
+SHINGLE_SIZE: int = 3
+DOCUMENT_SEPARATOR_TOKENS: int = 2
+
+
+@dataclass
+class PackedContext:
+    """
+    Результат упаковки контекста.
+
+    Attributes:
+        documents (List[Document]): Документы для подстановки в промпт.
+        retrieved_tokens (int): Токены всех найденных документов.
+        packed_tokens (int): Токены упакованных документов.
+        duplicates (int): Количество отброшенных почти одинаковых документов.
+    """
+
+    documents: List[Document]
+    retrieved_tokens: int
+    packed_tokens: int
+    duplicates: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.retrieved_tokens - self.packed_tokens
+
+
+def _shingles(tokens: List[str]) -> Set[Tuple[str, ...]]:
+    if len(tokens) < SHINGLE_SIZE:
+        return {tuple(tokens)}
+    return {
+        tuple(tokens[i:i + SHINGLE_SIZE])
+        for i in range(len(tokens) - SHINGLE_SIZE + 1)
+    }
+
+
+def _jaccard(left: Set[Tuple[str, ...]], right: Set[Tuple[str, ...]]) -> float:
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+def relevance_score(query_terms: Set[str], document: Document) -> float:
+    """
+    Дешёвая оценка релевантности: доля терминов запроса в документе и
+    векторная релевантность из ретривера.
+
+    Args:
+        query_terms (Set[str]): Термины запроса (`bm25_index.tokenize`).
+        document (Document): Документ с `vector_score` в метаданных.
+
+    Returns:
+        float: Оценка от 0 до 1.
+    """
+    lexical = (
+        len(query_terms & set(tokenize(document.page_content))) / len(query_terms)
+        if query_terms
+        else 0.0
+    )
+    vector = float(document.metadata.get("vector_score", 0.0))
+    return CONTEXT_LEXICAL_WEIGHT * lexical + (1 - CONTEXT_LEXICAL_WEIGHT) * vector
+
+
+def pack_context(
+    query: str,
+    documents: List[Document],
+    model: str,
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    max_documents: int = CONTEXT_MAX_DOCS,
+) -> PackedContext:
+    """
+    Отбирает документы для промпта в пределах бюджета токенов.
+
+    1. Почти одинаковые фрагменты (сходство Жаккара по шинглам из трёх
+       терминов не ниже `CONTEXT_DEDUP_THRESHOLD`) считаются дубликатами,
+       остаётся первый по порядку ретривера.
+    2. Оставшиеся документы сортируются по `relevance_score`.
+    3. Документы добавляются, пока их сумма токенов (tiktoken) помещается
+       в `budget`; не поместившиеся пропускаются, более короткие ещё могут
+       войти. Если не помещается даже первый документ, он обрезается.
+
+    Args:
+        query (str): Поисковый запрос.
+        documents (List[Document]): Документы от ретривера.
+        model (str): Модель для подсчёта токенов.
+        budget (int): Бюджет токенов контекста.
+        max_documents (int): Максимальное количество документов.
+
+    Returns:
+        PackedContext: Упакованные документы и статистика.
+    """
+    encoding = get_encoding(model)
+    token_counts = count_tokens_batch([doc.page_content for doc in documents], model)
+
+    unique: List[Tuple[Document, int]] = []
+    kept_shingles: List[Set[Tuple[str, ...]]] = []
+    for document, tokens in zip(documents, token_counts):
+        shingles = _shingles(tokenize(document.page_content))
+        if any(
+            _jaccard(shingles, kept) >= CONTEXT_DEDUP_THRESHOLD
+            for kept in kept_shingles
+        ):
+            continue
+        kept_shingles.append(shingles)
+        unique.append((document, tokens))
+
+    query_terms = set(tokenize(query))
+    ranked = sorted(
+        unique,
+        key=lambda item: relevance_score(query_terms, item[0]),
+        reverse=True,
+    )
+
+    packed: List[Document] = []
+    used = 0
+    for document, tokens in ranked:
+        if len(packed) == max_documents:
+            break
+        cost = tokens + DOCUMENT_SEPARATOR_TOKENS
+        if used + cost <= budget:
+            packed.append(document)
+            used += cost
+        elif not packed:
+            text = encoding.decode(encoding.encode(document.page_content)[:budget])
+            packed.append(
+                Document(page_content=text, metadata=document.metadata)
+            )
+            used = budget
+
+    return PackedContext(
+        documents=packed,
+        retrieved_tokens=sum(token_counts),
+        packed_tokens=used,
+        duplicates=len(documents) - len(unique),
+    )
+
+
+class PackedRetriever(BaseRetriever):
+    """
+    Обёртка ретривера, упаковывающая найденные документы в бюджет токенов
+    (`pack_context`) перед подстановкой в промпт.
+    """
+
+    retriever: BaseRetriever
+    model: str
+    budget: int = CONTEXT_TOKEN_BUDGET
+    max_documents: int = CONTEXT_MAX_DOCS
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        documents = self.retriever.invoke(
+            query, config={"callbacks": run_manager.get_child()}
+        )
+        context = pack_context(
+            query, documents, self.model, self.budget, self.max_documents
+        )
+
+        metrics.observe("context_packing.tokens_saved", context.tokens_saved)
+        metrics.observe("context_packing.packed_tokens", context.packed_tokens)
+        metrics.increment("context_packing.duplicates", context.duplicates)
+        logger.info(
+            f"Контекст: {len(context.documents)} из {len(documents)} документов, "
+            f"{context.packed_tokens} из {context.retrieved_tokens} токенов "
+            f"(сэкономлено {context.tokens_saved}, дубликатов {context.duplicates})"
+        )
+        return context.documents
@@ -1,4 +1,3 @@
-import asyncio
 import logging
 import os
 from typing import List, Dict, Union, Any
@@ -6,7 +5,6 @@ from typing import List, Dict, Union, Any
 from dotenv import load_dotenv
 from openai import BadRequestError, RateLimitError
 
-from db.dbworker import get_user_limit, update_user_limit
 from langchain.chains import (
     create_history_aware_retriever,
     create_retrieval_chain,
@@ -18,11 +16,13 @@ from langchain.prompts.chat import (
     MessagesPlaceholder,
     SystemMessagePromptTemplate,
 )
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import FAISS
 from langchain_openai import ChatOpenAI
+from langchain_core.retrievers import BaseRetriever
 from src.bot.bot_messages import MESSAGES
-from src.services.count_token import count_output_tokens, count_input_tokens
+from src.generated_answer.knowledge_base import knowledge_base
+from src.generated_answer.rag.context_packing import PackedRetriever
+from src.services.llm_client import ainvoke, chat_model, usage_stage
+from src.services.token_ledger import TokenLedger
 
 
 load_dotenv()
@@ -30,29 +30,14 @@ logger = logging.getLogger(__name__)
 
 API_KEY: str = os.getenv("GPT_SECRET_KEY_FASOLKAAI", "")
 MODEL_NAME: str = os.getenv("MODEL_NAME", "")
+RAG_RETRIEVAL_K: int = int(os.getenv("RAG_RETRIEVAL_K", "10"))
 
 if not API_KEY:
     raise ValueError("API-ключ OpenAI не найден. Проверьте файл .env.")
 
-embeddings = OpenAIEmbeddings(
-    openai_api_key=API_KEY, model="text-embedding-ada-002"
-)
-
-try:
-    retriever = FAISS.load_local(
-        "faiss_index_RU", embeddings, allow_dangerous_deserialization=True
-    ).as_retriever(
-        k=4, search_type="similarity", search_kwargs={"k": 6}, fetch_k=50
-    )
-    logger.info("FAISS индекс успешно загружен.")
-except Exception as e:
-    logger.error(f"Ошибка загрузки FAISS индекса: {e}")
-    raise
-
 try:
-    llm = ChatOpenAI(
-        model_name=MODEL_NAME,
-        api_key=API_KEY,
+    llm = chat_model(
+        MODEL_NAME,
         temperature=0.7,
         top_p=0.9,
         frequency_penalty=0.5,
@@ -67,7 +52,7 @@ except Exception as e:
 
 
 async def get_context_retriever_chain(
-    llm_2: ChatOpenAI, prompt_text: str
+    llm_2: ChatOpenAI, prompt_text: str, retriever: BaseRetriever
 ) -> Any:
     """
     Создание цепочки для поиска контекста.
@@ -75,6 +60,7 @@ async def get_context_retriever_chain(
     Args:
         llm_2 (ChatOpenAI): LLM модель.
         prompt_text (str): Текст контекста.
+        retriever (BaseRetriever): Ретривер базы знаний.
 
     Returns:
         Any: Цепочка поиска.
@@ -95,7 +81,9 @@ async def get_context_retriever_chain(
                 ),
             ]
         )
-        return create_history_aware_retriever(llm_2, retriever, prompt)
+        return create_history_aware_retriever(
+            llm_2, retriever, prompt
+        )
     except ValueError as e:
         logger.error(f"Ошибка параметров шаблона для контекста: {str(e)}")
         raise
@@ -157,7 +145,7 @@ async def get_conversational_rag_chain(
 
 
 async def run_gpt(
-    user_id: int,
+    ledger: TokenLedger,
     bot: Any,
     prompt_text: str,
     user_input: str,
@@ -167,7 +155,7 @@ async def run_gpt(
     Обработка большого объема текста с использованием RAG (Retrieval-Augmented Generation).
 
     Args:
-        user_id (int): Идентификатор пользователя.
+        ledger (TokenLedger): Учёт токенов текущего запроса пользователя.
         bot (Any): Экземпляр Telegram-бота.
         prompt_text (str): Текст начальной подсказки для модели.
         user_input (str): Ввод пользователя.
@@ -181,6 +169,7 @@ async def run_gpt(
         RateLimitError: Превышен лимит запросов к модели.
         Exception: Непредвиденная ошибка.
     """
+    user_id = ledger.user_id
     try:
         formatted_history = [
             (
@@ -197,44 +186,29 @@ async def run_gpt(
                 "Некорректный формат истории для пользователя. Пропущены некоторые записи."
             )
 
-        total_tokens_input = count_input_tokens(
-            history=history,
-            user_input=user_input,
-            prompt=prompt_text,
-            model=MODEL_NAME,
-        )
-        logger.info(
-            f"Общее количество токенов для запроса: {total_tokens_input}"
-        )
-
-        limit = get_user_limit(user_id)
-        if limit - total_tokens_input <= 0:
-            logger.info(f"Не хватает токенов: {limit - total_tokens_input}")
+        if ledger.exhausted:
+            logger.info(f"Не хватает токенов: {ledger.available}")
             await bot.send_message(user_id, MESSAGES["get_user_limit"]["ru"])
             return None
 
-        retriever_chain = await get_context_retriever_chain(llm, prompt_text)
-        conversation_rag_chain = await get_conversational_rag_chain(
-            retriever_chain, llm, prompt_text
-        )
+        with knowledge_base() as snapshot, usage_stage("run_gpt"):
+            retriever = PackedRetriever(
+                retriever=snapshot.similarity_retriever(RAG_RETRIEVAL_K),
+                model=MODEL_NAME,
+            )
+            retriever_chain = await get_context_retriever_chain(
+                llm, prompt_text, retriever
+            )
+            conversation_rag_chain = await get_conversational_rag_chain(
+                retriever_chain, llm, prompt_text
+            )
 
-        response = await asyncio.to_thread(
-            conversation_rag_chain.invoke,
-            {"history": formatted_history, "input": user_input},
-        )
+            response = await ainvoke(
+                conversation_rag_chain,
+                {"history": formatted_history, "input": user_input},
+            )
 
         response_text = response.get("answer", "")
-        total_tokens_response = count_output_tokens(
-            response_text, model=MODEL_NAME
-        )
-
-        total_tokens = total_tokens_input + total_tokens_response
-        logger.info(
-            f"Общее количество токенов (входные + ответ): {total_tokens}"
-        )
-
-        new_limit = limit - total_tokens
-        update_user_limit(user_id, new_limit)
         logger.info(f"Не переформулированный ответ: {response_text}")
         return response_text
     except BadRequestError as e:
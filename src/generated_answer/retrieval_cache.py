@@ -0,0 +1,94 @@
+import hashlib
+import logging
+import os
+import threading
+from typing import Optional
+
+import redis
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from redis.exceptions import RedisError
+
+from src.generated_answer.embedding_cache import normalize_text
+from src.services import metrics
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_CACHE_SIZE: int = int(os.getenv("RETRIEVAL_CACHE_SIZE", "5000"))
+RETRIEVAL_CACHE_TTL: int = int(os.getenv("RETRIEVAL_CACHE_TTL", "86400"))
+
+redis_client = redis.Redis(
+    host=os.getenv("REDIS_HOST"),
+    port=os.getenv("REDIS_PORT"),
+    db=1,
+    socket_timeout=0.2,
+    decode_responses=True,
+)
+
+_memory: TTLCache = TTLCache(maxsize=RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL)
+_lock = threading.Lock()
+
+
+def retrieval_key(query: str, k: int, threshold: float, index_version: str) -> str:
+    """
+    Строит ключ кеша результата поиска.
+
+    Версия индекса входит в ключ, поэтому после публикации нового индекса
+    старые результаты больше не находятся и вытесняются по TTL.
+
+    Args:
+        query (str): Запрос.
+        k (int): Количество документов.
+        threshold (float): Порог релевантности.
+        index_version (str): Версия индекса.
+
+    Returns:
+        str: Ключ кеша.
+    """
+    digest = hashlib.sha256(normalize_text(query).encode("utf-8")).hexdigest()
+    return f"retrieval:hybrid:{index_version}:{k}:{threshold}:{digest}"
+
+
+def get_cached_result(key: str) -> Optional[str]:
+    """
+    Возвращает закешированный результат поиска.
+
+    Args:
+        key (str): Ключ из `retrieval_key`.
+
+    Returns:
+        Optional[str]: Результат поиска или None при промахе.
+    """
+    with _lock:
+        result = _memory.get(key)
+
+    if result is None:
+        try:
+            result = redis_client.get(key)
+        except RedisError as e:
+            logger.warning(f"Кеш результатов поиска в Redis недоступен: {e}")
+        if result is not None:
+            with _lock:
+                _memory[key] = result
+
+    metrics.increment(
+        "retrieval_cache.hits" if result is not None else "retrieval_cache.misses"
+    )
+    return result
+
+
+def cache_result(key: str, result: str) -> None:
+    """
+    Сохраняет результат поиска в кеше процесса и в Redis.
+
+    Args:
+        key (str): Ключ из `retrieval_key`.
+        result (str): Результат поиска.
+    """
+    with _lock:
+        _memory[key] = result
+    try:
+        redis_client.set(key, result, ex=RETRIEVAL_CACHE_TTL)
+    except RedisError as e:
+        logger.warning(f"Не удалось сохранить результат поиска в Redis: {e}")
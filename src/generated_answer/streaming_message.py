@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+import time
+from typing import List, Optional
+
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.exceptions import (
+    CantParseEntities,
+    MessageNotModified,
+    RetryAfter,
+    TelegramAPIError,
+)
+from dotenv import load_dotenv
+
+from src.generated_answer.text_formatting import (
+    convert_partial_markdown_to_markdownv2,
+    smart_split_text,
+)
+from src.services import metrics
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+STREAMING_ANSWERS: bool = os.getenv("STREAMING_ANSWERS", "true").lower() == "true"
+STREAM_EDIT_INTERVAL: float = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+STREAM_GROUP_EDIT_INTERVAL: float = float(
+    os.getenv("STREAM_GROUP_EDIT_INTERVAL", "3.0")
+)
+
+
+def observe_first_visible(started: float, streamed: bool) -> None:
+    """
+    Записывает время от получения вопроса до появления первого текста
+    ответа в метрику `answer.first_visible_ms`.
+
+    Args:
+        started (float): Момент получения вопроса (`time.perf_counter`).
+        streamed (bool): Ответ выводится потоково.
+    """
+    elapsed = (time.perf_counter() - started) * 1000
+    metrics.observe("answer.first_visible_ms", elapsed)
+    metrics.observe(
+        f"answer.first_visible_{'streamed' if streamed else 'full'}_ms", elapsed
+    )
+    logger.info(f"Первый текст ответа показан через {elapsed:.0f} мс")
+
+
+class StreamingMessage:
+    """
+    Показывает ответ по мере генерации, редактируя сообщения в Telegram.
+
+    Сообщения редактируются не чаще одного раза в `interval` секунд
+    (ограничения Telegram на редактирование); при `RetryAfter` следующее
+    редактирование откладывается на указанное время. Текст, который
+    `smart_split_text` разбил бы на несколько частей, продолжается в новом
+    сообщении, а завершённые части больше не меняются.
+    """
+
+    def __init__(
+        self,
+        bot,
+        chat_id: int,
+        message_id: int,
+        started: float,
+        interval: float = STREAM_EDIT_INTERVAL,
+    ) -> None:
+        """
+        Args:
+            bot: Telegram-бот.
+            chat_id (int): Идентификатор чата.
+            message_id (int): Сообщение-заглушка, в котором начнётся ответ.
+            started (float): Момент получения вопроса (`time.perf_counter`).
+            interval (float): Минимальный интервал между редактированиями, с.
+        """
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_ids: List[int] = [message_id]
+        self.shown: List[str] = [""]
+        self.started = started
+        self.interval = interval
+        self.text = ""
+        self.visible = False
+        self._next_edit = 0.0
+
+    async def append(self, chunk: str) -> None:
+        """
+        Добавляет фрагмент ответа и при необходимости обновляет сообщения.
+
+        Args:
+            chunk (str): Очередной фрагмент сгенерированного текста.
+        """
+        self.text += chunk
+        if time.monotonic() < self._next_edit:
+            return
+        self._next_edit = time.monotonic() + self.interval
+        formatted = convert_partial_markdown_to_markdownv2(self.text)
+        parts = [part for part in await smart_split_text(formatted) if part]
+        try:
+            await self._show(parts)
+        except CantParseEntities as e:
+            logger.warning(f"Незаконченный ответ не разобран Telegram: {e}")
+        except RetryAfter as e:
+            self._next_edit = time.monotonic() + e.timeout
+            logger.warning(f"Редактирование ответа отложено на {e.timeout} с")
+        except TelegramAPIError as e:
+            logger.error(f"Ошибка обновления ответа в чате {self.chat_id}: {e}")
+
+    async def finish(
+        self,
+        formatted_text: str,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+    ) -> None:
+        """
+        Выводит окончательный отформатированный ответ.
+
+        Если окончательный ответ разбит на меньшее число частей, чем было
+        показано при потоковом выводе, лишние сообщения удаляются.
+
+        Args:
+            formatted_text (str): Ответ в формате MarkdownV2.
+            reply_markup (Optional[InlineKeyboardMarkup]): Клавиатура оценки ответа.
+
+        Raises:
+            TelegramAPIError: Telegram не принял окончательный ответ.
+        """
+        parts = [part for part in await smart_split_text(formatted_text) if part]
+        while True:
+            try:
+                await self._show(parts, reply_markup)
+                break
+            except RetryAfter as e:
+                await asyncio.sleep(e.timeout)
+        await self._delete_extra(max(len(parts), 1))
+
+    async def _delete_extra(self, count: int) -> None:
+        for message_id in self.message_ids[count:]:
+            try:
+                await self.bot.delete_message(
+                    chat_id=self.chat_id, message_id=message_id
+                )
+            except TelegramAPIError as e:
+                logger.warning(
+                    f"Не удалось удалить лишнее сообщение ответа в чате {self.chat_id}: {e}"
+                )
+        del self.message_ids[count:]
+        del self.shown[count:]
+
+    async def _show(
+        self,
+        parts: List[str],
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+    ) -> None:
+        for index, part in enumerate(parts):
+            if index < len(self.message_ids):
+                if self.shown[index] == part and reply_markup is None:
+                    continue
+                await self._edit(index, part, reply_markup)
+            else:
+                message = await self.bot.send_message(
+                    chat_id=self.chat_id,
+                    text=part,
+                    reply_markup=reply_markup,
+                    parse_mode="MarkdownV2",
+                )
+                self.message_ids.append(message.message_id)
+                self.shown.append(part)
+
+            if not self.visible:
+                self.visible = True
+                observe_first_visible(self.started, streamed=True)
+
+    async def _edit(
+        self,
+        index: int,
+        text: str,
+        reply_markup: Optional[InlineKeyboardMarkup],
+    ) -> None:
+        try:
+            await self.bot.edit_message_text(
+                chat_id=self.chat_id,
+                message_id=self.message_ids[index],
+                text=text,
+                reply_markup=reply_markup,
+                parse_mode="MarkdownV2",
+            )
+        except MessageNotModified:
+            pass
+        self.shown[index] = text
+        metrics.increment("answer.stream_edits")
@@ -3,6 +3,8 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+MARKDOWN_V2_SPECIAL_CHARS: str = "\\_*[]()~`>#+-=|{}.!"
+
 
 def process_latex_blocks(text: str) -> str:
     """
@@ -347,3 +349,60 @@ def convert_markdown_to_markdownv2(text: str) -> str:
     except Exception as e:
         logger.error(f"Ошибка перевода в MarkdownV2: {str(e)}")
         return text
+
+
+def escape_markdown_v2(text: str) -> str:
+    """
+    Экранирует все спецсимволы MarkdownV2, чтобы текст отобразился как есть.
+
+    Args:
+        text (str): Исходный текст.
+
+    Returns:
+        str: Экранированный текст.
+    """
+    return re.sub(f"([{re.escape(MARKDOWN_V2_SPECIAL_CHARS)}])", r"\\\1", text)
+
+
+def convert_partial_markdown_to_markdownv2(text: str) -> str:
+    """
+    Преобразует в MarkdownV2 незаконченный текст, который ещё генерируется.
+
+    Завершённые строки форматируются `convert_markdown_to_markdownv2`,
+    незаконченная последняя строка выводится экранированной, без разметки:
+    её выделения ещё могут быть не закрыты. Незакрытый блок кода
+    закрывается, чтобы Telegram принял сообщение.
+
+    Args:
+        text (str): Начало ответа в формате Markdown.
+
+    Returns:
+        str: Текст в формате MarkdownV2.
+    """
+    if text.count("```") % 2:
+        return convert_markdown_to_markdownv2(text + "\n```")
+    complete, newline, tail = text.rpartition("\n")
+    return convert_markdown_to_markdownv2(complete + newline) + escape_markdown_v2(tail)
+
+
+async def smart_split_text(text, max_length=4000):
+    """
+    Разбивает текст по абзацам, сохраняя форматирование MarkdownV2.
+    Никогда не разрывает Markdown-выделения и формулы.
+    """
+    paragraphs = text.split("\n")
+    messages = []
+    current_message = ""
+
+    for paragraph in paragraphs:
+        if len(current_message) + len(paragraph) + 1 <= max_length:
+            current_message += paragraph + "\n"
+        else:
+            if current_message:
+                messages.append(current_message.strip())
+            current_message = paragraph + "\n"
+
+    if current_message:
+        messages.append(current_message.strip())
+
+    return messages
@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import os
+import time
+from typing import Optional
+
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from src.generated_answer.answer_cache import is_time_sensitive
+from src.generated_answer.embedding_cache import normalize_text
+from src.services import metrics
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+WEB_SEARCH_CACHE_SIZE: int = int(os.getenv("WEB_SEARCH_CACHE_SIZE", "2000"))
+WEB_SEARCH_FRESHNESS: int = int(os.getenv("WEB_SEARCH_FRESHNESS", "3600"))
+WEB_SEARCH_VOLATILE_FRESHNESS: int = int(
+    os.getenv("WEB_SEARCH_VOLATILE_FRESHNESS", "300")
+)
+
+redis_client = aioredis.Redis(
+    host=os.getenv("REDIS_HOST"),
+    port=os.getenv("REDIS_PORT"),
+    db=1,
+    socket_timeout=0.2,
+    decode_responses=True,
+)
+
+_memory: TTLCache = TTLCache(
+    maxsize=WEB_SEARCH_CACHE_SIZE,
+    ttl=max(WEB_SEARCH_FRESHNESS, WEB_SEARCH_VOLATILE_FRESHNESS),
+)
+
+
+def freshness_window(query: str) -> int:
+    """
+    Определяет окно актуальности результата поиска: `WEB_SEARCH_VOLATILE_FRESHNESS`
+    секунд для запросов о ценах, новостях и датах, иначе `WEB_SEARCH_FRESHNESS`.
+
+    Args:
+        query (str): Поисковый запрос.
+
+    Returns:
+        int: Длительность окна в секундах.
+    """
+    if is_time_sensitive(query):
+        return WEB_SEARCH_VOLATILE_FRESHNESS
+    return WEB_SEARCH_FRESHNESS
+
+
+def web_search_key(query: str) -> str:
+    """
+    Строит ключ кеша результата поиска в интернете.
+
+    Время делится на окна длительностью `freshness_window`, номер окна
+    входит в ключ: в пределах окна одинаковые запросы получают один
+    результат, в следующем окне поиск выполняется заново.
+
+    Args:
+        query (str): Поисковый запрос.
+
+    Returns:
+        str: Ключ кеша.
+    """
+    window = freshness_window(query)
+    bucket = int(time.time() // window)
+    digest = hashlib.sha256(normalize_text(query).encode("utf-8")).hexdigest()
+    return f"web_search:{window}:{bucket}:{digest}"
+
+
+async def get_cached_search(key: str) -> Optional[str]:
+    """
+    Возвращает закешированный результат поиска в интернете.
+
+    Args:
+        key (str): Ключ из `web_search_key`.
+
+    Returns:
+        Optional[str]: Результат поиска или None при промахе.
+    """
+    result = _memory.get(key)
+    if result is None:
+        try:
+            result = await redis_client.get(key)
+        except RedisError as e:
+            logger.warning(f"Кеш поиска в интернете в Redis недоступен: {e}")
+        if result is not None:
+            _memory[key] = result
+
+    metrics.increment(
+        "web_search_cache.hits" if result is not None else "web_search_cache.misses"
+    )
+    return result
+
+
+async def cache_search(key: str, result: str) -> None:
+    """
+    Сохраняет результат поиска в интернете до конца окна актуальности.
+
+    Args:
+        key (str): Ключ из `web_search_key`.
+        result (str): Результат поиска.
+    """
+    _memory[key] = result
+    window = int(key.split(":")[1])
+    try:
+        await redis_client.set(key, result, ex=window)
+    except RedisError as e:
+        logger.warning(f"Не удалось сохранить результат поиска в интернете в Redis: {e}")
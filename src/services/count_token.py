@@ -1,11 +1,129 @@
 import asyncio
 import logging
-from typing import List
+import math
+from functools import lru_cache
+from typing import Any, List, Optional
 
 import tiktoken
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_ENCODING: str = "cl100k_base"
+# Кодировки моделей, которых нет в таблице установленной версии tiktoken
+# (новые модели и имена вида "gpt-4o-2024-xx-xx-custom"); ищется самый
+# длинный подходящий префикс.
+MODEL_ENCODING_FALLBACK = {
+    "gpt-4o": "o200k_base",
+    "gpt-4.1": "o200k_base",
+    "gpt-4.5": "o200k_base",
+    "gpt-5": "o200k_base",
+    "o1": "o200k_base",
+    "o3": "o200k_base",
+    "o4": "o200k_base",
+    "gpt-4": "cl100k_base",
+    "gpt-3.5": "cl100k_base",
+    "text-embedding": "cl100k_base",
+}
+MESSAGE_OVERHEAD_TOKENS: int = 4
+
+# Изображения: detail=low — фиксированная стоимость; detail=high — изображение
+# вписывается в 2048x2048, короткая сторона уменьшается до 768, затем каждая
+# плитка 512x512 стоит IMAGE_TILE_TOKENS.
+IMAGE_BASE_TOKENS: int = 85
+IMAGE_TILE_TOKENS: int = 170
+IMAGE_TILE_SIZE: int = 512
+IMAGE_MAX_SIDE: int = 2048
+IMAGE_SHORT_SIDE: int = 768
+# Оценка изображения неизвестного размера: 4 плитки, как у 1024x1024.
+IMAGE_TOKENS_ESTIMATE: int = IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * 4
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """
+    Возвращает кодировку tiktoken для модели; создаётся один раз на модель.
+
+    Для моделей, неизвестных tiktoken, кодировка выбирается по префиксу
+    имени (`MODEL_ENCODING_FALLBACK`), иначе используется `DEFAULT_ENCODING`.
+
+    Args:
+        model (str): Название модели.
+
+    Returns:
+        tiktoken.Encoding: Кодировка.
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        prefixes = [prefix for prefix in MODEL_ENCODING_FALLBACK if model.startswith(prefix)]
+        name = (
+            MODEL_ENCODING_FALLBACK[max(prefixes, key=len)]
+            if prefixes
+            else DEFAULT_ENCODING
+        )
+        logger.warning(f"Модель {model!r} неизвестна tiktoken, используется {name}")
+        return tiktoken.get_encoding(name)
+
+
+@lru_cache(maxsize=64)
+def _short_text_tokens(text: str, model: str) -> int:
+    return len(get_encoding(model).encode(text))
+
+
+def encode_batch(texts: List[str], model: str = "gpt-4") -> List[List[int]]:
+    """
+    Кодирует несколько текстов одним вызовом (tiktoken распределяет их по потокам).
+
+    Args:
+        texts (List[str]): Тексты.
+        model (str): Название модели.
+
+    Returns:
+        List[List[int]]: Токены каждого текста.
+    """
+    return get_encoding(model).encode_batch(texts, disallowed_special=())
+
+
+def count_tokens_batch(texts: List[str], model: str = "gpt-4") -> List[int]:
+    """
+    Подсчитывает токены нескольких текстов одним вызовом `encode_batch`.
+
+    Args:
+        texts (List[str]): Тексты.
+        model (str): Название модели.
+
+    Returns:
+        List[int]: Количество токенов каждого текста.
+    """
+    return [len(tokens) for tokens in encode_batch(texts, model)]
+
+
+def count_image_tokens(
+    width: Optional[int] = None, height: Optional[int] = None, detail: str = "high"
+) -> int:
+    """
+    Оценивает токены изображения по его размерам, как их считает OpenAI.
+
+    Args:
+        width (Optional[int]): Ширина в пикселях; None, если неизвестна.
+        height (Optional[int]): Высота в пикселях; None, если неизвестна.
+        detail (str): Режим детализации: "low", "high" или "auto".
+
+    Returns:
+        int: Количество токенов изображения.
+    """
+    if detail == "low":
+        return IMAGE_BASE_TOKENS
+    if not width or not height:
+        return IMAGE_TOKENS_ESTIMATE
+
+    scale = min(1.0, IMAGE_MAX_SIDE / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, IMAGE_SHORT_SIDE / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / IMAGE_TILE_SIZE) * math.ceil(height / IMAGE_TILE_SIZE)
+    return IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * tiles
+
 
 def count_output_tokens(text: str, model: str = "gpt-4") -> int:
     """
@@ -22,10 +140,9 @@ def count_output_tokens(text: str, model: str = "gpt-4") -> int:
         Exception: Для любых ошибок при подсчёте токенов.
     """
     try:
-        encoding = tiktoken.encoding_for_model(model)
-        tokens = encoding.encode(text)
-        logger.info(f"Токенов выходных данных: {len(tokens)}")
-        return len(tokens)
+        tokens = len(get_encoding(model).encode(text, disallowed_special=()))
+        logger.info(f"Токенов выходных данных: {tokens}")
+        return tokens
     except Exception as e:
         logger.error(f"Ошибка подсчёта токенов: {e}")
         raise
@@ -40,6 +157,8 @@ def count_input_tokens(
     """
     Подсчитывает общее количество токенов в истории чата и текущем запросе пользователя.
 
+    Тексты всех сообщений кодируются одним вызовом `encode_batch`.
+
     Args:
         history (List[dict]): История чата в виде списка словарей с ключами 'question' и 'response'.
         user_input (str): Текущий ввод пользователя.
@@ -71,12 +190,12 @@ def count_input_tokens(
 
         messages.append({"role": "user", "content": user_input})
 
-        encoding = tiktoken.encoding_for_model(model)
-        total_tokens = 0
-        for msg in messages:
-            role_tokens = encoding.encode(msg["role"])
-            content_tokens = encoding.encode(msg["content"])
-            total_tokens += len(role_tokens) + len(content_tokens)
+        content_tokens = count_tokens_batch(
+            [msg["content"] for msg in messages], model
+        )
+        total_tokens = sum(content_tokens) + sum(
+            _short_text_tokens(msg["role"], model) for msg in messages
+        )
         logger.info(f"Токенов входных данных: {total_tokens}")
         return total_tokens
     except ValueError as ve:
@@ -87,6 +206,53 @@ def count_input_tokens(
         raise
 
 
+def count_request_tokens(payload: dict) -> int:
+    """
+    Оценивает количество токенов запроса к OpenAI API так, как их учитывает
+    лимит TPM: текст сообщений и входных данных, изображения и
+    запрошенный максимум токенов ответа.
+
+    Тексты собираются из всего тела и кодируются одним `encode_batch`;
+    изображения в base64 не кодируются, а оцениваются `count_image_tokens`.
+
+    Args:
+        payload (dict): JSON-тело запроса (chat completions, responses, embeddings).
+
+    Returns:
+        int: Оценочное количество токенов.
+    """
+    texts: List[str] = []
+
+    def collect(value: Any) -> int:
+        if isinstance(value, str):
+            texts.append(value)
+            return 0
+        if isinstance(value, int):
+            return 1
+        if isinstance(value, list):
+            return sum(collect(item) for item in value)
+        if isinstance(value, dict):
+            if value.get("type") in ("image_url", "input_image"):
+                image = value.get("image_url")
+                if not isinstance(image, dict):
+                    image = value
+                return count_image_tokens(detail=image.get("detail", "auto"))
+            tokens = MESSAGE_OVERHEAD_TOKENS if "role" in value else 0
+            for key in ("content", "text", "input"):
+                tokens += collect(value.get(key))
+            return tokens
+        return 0
+
+    tokens = sum(collect(payload.get(key)) for key in ("messages", "input", "prompt"))
+    tokens += sum(count_tokens_batch(texts, payload.get("model", ""))) if texts else 0
+    return tokens + (
+        payload.get("max_tokens")
+        or payload.get("max_completion_tokens")
+        or payload.get("max_output_tokens")
+        or 0
+    )
+
+
 async def get_audio_duration(audio_file: str) -> float:
     """
     Определяет продолжительность аудиофайла с использованием ffprobe.
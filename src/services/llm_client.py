@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable
+from langchain_openai import ChatOpenAI
+from openai import AsyncOpenAI
+
+from src.services import metrics
+from src.services.rate_limiter import RateLimitedTransport
+from src.services.token_ledger import TokenLedger
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+API_KEY: str = os.getenv("GPT_SECRET_KEY_FASOLKAAI", "")
+LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT: float = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE: int = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+# Повторы SDK при ошибках соединения и 5xx. Ответы 429 повторяет только
+# RateLimitedTransport в пределах RATE_LIMIT_MAX_WAIT.
+LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+http_client = httpx.AsyncClient(
+    transport=RateLimitedTransport(
+        httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                keepalive_expiry=30,
+            ),
+        )
+    ),
+    timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+)
+
+openai_client = AsyncOpenAI(
+    api_key=API_KEY,
+    http_client=http_client,
+    timeout=LLM_TIMEOUT,
+    max_retries=LLM_MAX_RETRIES,
+)
+
+
+# Учёт токенов запроса пользователя и текущий этап обработки. Значения
+# наследуются задачами, созданными внутри запроса (параллельные этапы,
+# пункты плана), поэтому расход любого вызова модели относится к нужному
+# пользователю без передачи `TokenLedger` через все функции.
+current_ledger: ContextVar[Optional[TokenLedger]] = ContextVar(
+    "current_ledger", default=None
+)
+current_stage: ContextVar[str] = ContextVar("current_stage", default="other")
+
+
+@contextmanager
+def usage_stage(stage: str) -> Iterator[None]:
+    """
+    Относит расход токенов вызовов модели внутри блока к этапу `stage`.
+
+    Args:
+        stage (str): Название этапа.
+    """
+    token = current_stage.set(stage)
+    try:
+        yield
+    finally:
+        current_stage.reset(token)
+
+
+def record_usage(model: str, prompt_tokens: int, completion_tokens: int) -> None:
+    """
+    Записывает фактический расход токенов вызова модели.
+
+    Расход списывается в `TokenLedger` текущего запроса (`current_ledger`)
+    по текущему этапу; в базе он фиксируется один раз в `TokenLedger.commit`
+    по завершении запроса. Вызовы вне запроса пользователя попадают только
+    в метрики.
+
+    Args:
+        model (str): Модель.
+        prompt_tokens (int): Токены запроса.
+        completion_tokens (int): Токены ответа.
+    """
+    stage = current_stage.get()
+    metrics.increment(f"usage.{stage}.prompt_tokens", prompt_tokens)
+    metrics.increment(f"usage.{stage}.completion_tokens", completion_tokens)
+    metrics.increment(f"usage.{model}.tokens", prompt_tokens + completion_tokens)
+
+    ledger = current_ledger.get()
+    if ledger is None:
+        logger.debug(f"Расход {model} вне запроса пользователя: {prompt_tokens}+{completion_tokens}")
+        return
+    ledger.charge(prompt_tokens + completion_tokens, stage)
+
+
+class UsageCollector(AsyncCallbackHandler):
+    """
+    Обработчик LangChain, передающий в `record_usage` поле `usage` каждого
+    ответа модели, в том числе вызовов внутри агента и цепочек.
+    """
+
+    async def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        model = (response.llm_output or {}).get("model_name", "")
+        prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    prompt_tokens += usage.get("input_tokens", 0)
+                    completion_tokens += usage.get("output_tokens", 0)
+                    model = model or message.response_metadata.get("model_name", "")
+
+        if not prompt_tokens and not completion_tokens:
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt_tokens = token_usage.get("prompt_tokens", 0)
+            completion_tokens = token_usage.get("completion_tokens", 0)
+
+        if prompt_tokens or completion_tokens:
+            record_usage(model or "unknown", prompt_tokens, completion_tokens)
+
+
+usage_collector = UsageCollector()
+
+
+def chat_model(model: str, **kwargs: Any) -> ChatOpenAI:
+    """
+    Создаёт модель LangChain, асинхронные вызовы которой идут через общий
+    пул соединений `http_client`, а расход токенов учитывается
+    `usage_collector`, в том числе при потоковой генерации.
+
+    Args:
+        model (str): Имя модели.
+        **kwargs: Параметры генерации (temperature, top_p и т. д.).
+
+    Returns:
+        ChatOpenAI: Модель.
+    """
+    return ChatOpenAI(
+        model=model,
+        api_key=API_KEY,
+        http_async_client=http_client,
+        timeout=LLM_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+        stream_usage=True,
+        callbacks=[usage_collector],
+        **kwargs,
+    )
+
+
+async def ainvoke(
+    runnable: Runnable, payload: Any, timeout: Optional[float] = LLM_TIMEOUT
+) -> Any:
+    """
+    Асинхронно вызывает модель или цепочку с ограничением времени.
+
+    По истечении `timeout` вызов отменяется и выбрасывается
+    `asyncio.TimeoutError`; отмена вызывающей задачи (например, отмена
+    спекулятивного этапа в `pipeline.py`) также прерывает HTTP-запрос.
+
+    Args:
+        runnable (Runnable): Модель, цепочка или агент LangChain.
+        payload (Any): Сообщения или входные данные цепочки.
+        timeout (Optional[float]): Ограничение времени в секундах; None — без ограничения.
+
+    Returns:
+        Any: Результат `runnable.ainvoke`.
+    """
+    return await asyncio.wait_for(runnable.ainvoke(payload), timeout)
+
+
+async def astream_text(
+    runnable: Runnable,
+    payload: Any,
+    on_token: Callable[[str], Awaitable[None]],
+    timeout: Optional[float] = LLM_TIMEOUT,
+) -> str:
+    """
+    Асинхронно вызывает модель в режиме потоковой генерации.
+
+    Каждый полученный фрагмент текста передаётся в `on_token` сразу после
+    получения. Ограничение `timeout` действует на всю генерацию, как в
+    `ainvoke`.
+
+    Args:
+        runnable (Runnable): Модель или цепочка LangChain.
+        payload (Any): Сообщения или входные данные цепочки.
+        on_token (Callable[[str], Awaitable[None]]): Обработчик фрагментов.
+        timeout (Optional[float]): Ограничение времени в секундах; None — без ограничения.
+
+    Returns:
+        str: Полный текст ответа.
+    """
+
+    async def consume() -> str:
+        parts = []
+        async for chunk in runnable.astream(payload):
+            text = getattr(chunk, "content", chunk)
+            if text:
+                parts.append(text)
+                await on_token(text)
+        return "".join(parts)
+
+    return await asyncio.wait_for(consume(), timeout)
+
+
+# Цикл событий бота: в нём синхронные вызовы эмбеддингов из рабочих
+# потоков выполняют запросы через общий `http_client`.
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def bind_event_loop(loop: asyncio.AbstractEventLoop) -> None:
+    """
+    Запоминает цикл событий бота для синхронных вызовов `ClientEmbeddings`.
+
+    Args:
+        loop (asyncio.AbstractEventLoop): Цикл событий, в котором работает бот.
+    """
+    global _event_loop
+    _event_loop = loop
+
+
+class ClientEmbeddings(Embeddings):
+    """
+    Эмбеддинги OpenAI через общий клиент `openai_client`: запросы проходят
+    через `RateLimitedTransport`, а расход токенов записывается в
+    `record_usage` под этапом `embeddings`.
+
+    Синхронные методы (поиск FAISS в рабочем потоке) выполняют запрос в
+    цикле событий бота (`bind_event_loop`). Контекст потока передаётся в
+    задачу, поэтому расход относится к запросу пользователя, как и у
+    асинхронных вызовов.
+    """
+
+    def __init__(self, model: str) -> None:
+        """
+        Args:
+            model (str): Модель эмбеддингов.
+        """
+        self.model = model
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        response = await openai_client.embeddings.create(
+            model=self.model, input=texts, timeout=LLM_TIMEOUT
+        )
+        if response.usage is not None:
+            with usage_stage("embeddings"):
+                record_usage(response.model, response.usage.prompt_tokens, 0)
+        return [item.embedding for item in response.data]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        loop = _event_loop
+        if loop is None or loop.is_closed():
+            raise RuntimeError("Цикл событий бота не задан (bind_event_loop).")
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError(
+                "Синхронный вызов эмбеддингов из цикла событий бота, используйте aembed_*."
+            )
+        future = asyncio.run_coroutine_threadsafe(self.aembed_documents(texts), loop)
+        return future.result()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+async def close_llm_client() -> None:
+    """
+    Закрывает соединения общего пула при остановке бота.
+    """
+    try:
+        await http_client.aclose()
+    except Exception as e:
+        logger.error(f"Ошибка закрытия пула соединений OpenAI: {e}")
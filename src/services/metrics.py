@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+from typing import Deque, Dict, Union
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+METRICS_LOG_INTERVAL: int = int(os.getenv("METRICS_LOG_INTERVAL", "300"))
+OBSERVATION_WINDOW: int = 1024
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+_observations: Dict[str, Deque[float]] = {}
+
+
+def increment(name: str, value: float = 1) -> None:
+    """
+    Увеличивает счётчик.
+
+    Args:
+        name (str): Имя метрики.
+        value (float): Величина приращения.
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def gauge(name: str, value: float) -> None:
+    """
+    Устанавливает текущее значение показателя (например, глубины очереди).
+
+    Args:
+        name (str): Имя метрики.
+        value (float): Текущее значение.
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value: float) -> None:
+    """
+    Записывает наблюдение (например, задержку в миллисекундах).
+
+    Хранятся последние `OBSERVATION_WINDOW` значений, по ним считаются перцентили.
+
+    Args:
+        name (str): Имя метрики.
+        value (float): Наблюдаемое значение.
+    """
+    with _lock:
+        window = _observations.get(name)
+        if window is None:
+            window = _observations[name] = deque(maxlen=OBSERVATION_WINDOW)
+        window.append(value)
+
+
+def _percentile(ordered: list, percent: float) -> float:
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def snapshot() -> Dict[str, Union[float, Dict[str, float]]]:
+    """
+    Возвращает текущие значения всех метрик.
+
+    Returns:
+        Dict[str, Union[float, Dict[str, float]]]: Счётчики и показатели по имени,
+        для наблюдений — количество, среднее, p50, p99 и максимум.
+    """
+    with _lock:
+        result: Dict[str, Union[float, Dict[str, float]]] = {
+            **_counters,
+            **_gauges,
+        }
+        for name, window in _observations.items():
+            if not window:
+                continue
+            ordered = sorted(window)
+            result[name] = {
+                "count": len(ordered),
+                "avg": round(sum(ordered) / len(ordered), 2),
+                "p50": round(_percentile(ordered, 50), 2),
+                "p99": round(_percentile(ordered, 99), 2),
+                "max": round(ordered[-1], 2),
+            }
+    return result
+
+
+async def log_metrics_periodically() -> None:
+    """
+    Периодически пишет снимок метрик в лог с интервалом `METRICS_LOG_INTERVAL` секунд.
+    """
+    while True:
+        await asyncio.sleep(METRICS_LOG_INTERVAL)
+        metrics = snapshot()
+        if metrics:
+            logger.info(f"Метрики: {metrics}")
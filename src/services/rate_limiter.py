@@ -0,0 +1,301 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+from typing import Dict, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+from src.services import metrics
+from src.services.count_token import count_request_tokens
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_RPM: int = int(os.getenv("RATE_LIMIT_RPM", "500"))
+RATE_LIMIT_TPM: int = int(os.getenv("RATE_LIMIT_TPM", "200000"))
+RATE_LIMIT_MAX_WAIT: float = float(os.getenv("RATE_LIMIT_MAX_WAIT", "30"))
+RATE_LIMIT_BACKOFF_BASE: float = float(os.getenv("RATE_LIMIT_BACKOFF_BASE", "0.5"))
+RATE_LIMIT_BACKOFF_MAX: float = float(os.getenv("RATE_LIMIT_BACKOFF_MAX", "8"))
+OPENAI_HOST: str = "openai.com"
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """
+    Разбирает длительность из заголовков `x-ratelimit-reset-*` («1s», «6m0s», «20ms»).
+
+    Args:
+        value (Optional[str]): Значение заголовка.
+
+    Returns:
+        Optional[float]: Длительность в секундах или None, если заголовка нет.
+    """
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """
+    Корзина токенов с равномерным пополнением: `limit` единиц в минуту.
+    """
+
+    def __init__(self, limit: float) -> None:
+        """
+        Args:
+            limit (float): Лимит единиц (запросов или токенов) в минуту.
+        """
+        self.capacity = limit
+        self.rate = limit / 60
+        self.level = limit
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """
+        Возвращает время ожидания, через которое в корзине будет `amount` единиц.
+
+        Запрос больше ёмкости корзины ждёт полную корзину, а не бесконечно.
+        """
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(missing, 0) / self.rate if self.rate else 0.0
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+    def set_limit(self, limit: float) -> None:
+        self._refill()
+        self.capacity = limit
+        self.rate = limit / 60
+        self.level = min(self.level, limit)
+
+    def set_remaining(self, remaining: float, reset: Optional[float]) -> None:
+        """
+        Согласует остаток с данными сервера: остаток не может быть больше
+        сообщённого в заголовках. Если указано время до полного
+        восстановления, пополнение ускоряется до него.
+        """
+        self._refill()
+        self.level = min(self.level, remaining)
+        if reset:
+            self.rate = max(self.capacity / 60, (self.capacity - remaining) / reset)
+
+    def pause(self, seconds: float) -> None:
+        """Опустошает корзину так, чтобы новые единицы появились не раньше чем через `seconds`."""
+        self._refill()
+        self.level = min(self.level, -seconds * self.rate)
+
+
+class ModelLimits:
+    """
+    Лимиты RPM и TPM одной модели OpenAI.
+
+    Начальные значения берутся из `RATE_LIMIT_RPM` и `RATE_LIMIT_TPM` и
+    уточняются по заголовкам `x-ratelimit-*` каждого ответа. Запросы
+    получают разрешение по очереди, поэтому крупный запрос не
+    вытесняется бесконечным потоком мелких.
+    """
+
+    def __init__(self, name: str, rpm: float = RATE_LIMIT_RPM, tpm: float = RATE_LIMIT_TPM) -> None:
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int, deadline: float, charge: bool = True) -> None:
+        """
+        Ждёт, пока лимиты позволят отправить запрос, но не дольше `deadline`:
+        после него запрос отправляется, и решение остаётся за сервером.
+
+        Args:
+            tokens (int): Оценка токенов запроса.
+            deadline (float): Крайний момент ожидания (`time.monotonic`).
+            charge (bool): Списать запрос и токены из лимитов. Повтор после
+                429 только ждёт: запрос уже был учтён при первой отправке.
+        """
+        async with self._lock:
+            waited = 0.0
+            while True:
+                wait = max(self.requests.delay(1), self.tokens.delay(tokens))
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+                waited += wait
+            if charge:
+                self.requests.take(1)
+                self.tokens.take(tokens)
+
+        if waited:
+            metrics.increment(f"rate_limiter.{self.name}.delayed")
+            metrics.observe("rate_limiter.wait_ms", waited * 1000)
+
+    def update(self, headers: httpx.Headers) -> None:
+        """
+        Уточняет лимиты по заголовкам ответа OpenAI.
+
+        Args:
+            headers (httpx.Headers): Заголовки ответа.
+        """
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            try:
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                if limit:
+                    bucket.set_limit(float(limit))
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if remaining:
+                    bucket.set_remaining(
+                        float(remaining),
+                        parse_reset(headers.get(f"x-ratelimit-reset-{kind}")),
+                    )
+            except ValueError as e:
+                logger.warning(f"Некорректный заголовок лимита {kind} для {self.name}: {e}")
+        metrics.gauge(f"rate_limiter.{self.name}.tokens_available", round(self.tokens.level))
+
+    def pause(self, seconds: float) -> None:
+        self.requests.pause(seconds)
+        self.tokens.pause(seconds)
+
+
+def retry_delay(headers: httpx.Headers, attempt: int) -> float:
+    """
+    Время до повтора после ответа 429.
+
+    Используется `retry-after-ms` или `retry-after` сервера с небольшим
+    случайным разбросом, иначе экспоненциальная задержка с полным
+    случайным разбросом (full jitter), чтобы параллельные запросы не
+    повторялись одновременно.
+
+    Args:
+        headers (httpx.Headers): Заголовки ответа 429.
+        attempt (int): Номер повтора, начиная с 0.
+
+    Returns:
+        float: Задержка в секундах.
+    """
+    try:
+        if headers.get("retry-after-ms"):
+            server_delay = float(headers["retry-after-ms"]) / 1000
+        elif headers.get("retry-after"):
+            server_delay = float(headers["retry-after"])
+        else:
+            server_delay = None
+    except ValueError:
+        server_delay = None
+
+    if server_delay is not None:
+        return server_delay * random.uniform(1.0, 1.25)
+    return random.uniform(0, min(RATE_LIMIT_BACKOFF_MAX, RATE_LIMIT_BACKOFF_BASE * 2 ** attempt))
+
+
+class RateLimiter:
+    """
+    Реестр лимитов по моделям OpenAI.
+    """
+
+    def __init__(self) -> None:
+        self._limits: Dict[str, ModelLimits] = {}
+
+    def limits_for(self, name: str) -> ModelLimits:
+        limits = self._limits.get(name)
+        if limits is None:
+            limits = self._limits[name] = ModelLimits(name)
+        return limits
+
+
+rate_limiter = RateLimiter()
+
+
+def describe_request(request: httpx.Request) -> Tuple[str, int]:
+    """
+    Определяет модель и оценку токенов запроса.
+
+    Для JSON-запросов модель и токены берутся из тела (`count_request_tokens`).
+    Для остальных (загрузка аудио в Whisper) лимит ведётся по пути запроса
+    и учитывается только RPM.
+
+    Args:
+        request (httpx.Request): Запрос к OpenAI API.
+
+    Returns:
+        Tuple[str, int]: Имя лимита и оценка токенов.
+    """
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            payload = json.loads(request.content)
+            return payload.get("model") or request.url.path, count_request_tokens(payload)
+        except (ValueError, httpx.RequestNotRead) as e:
+            logger.warning(f"Не удалось оценить запрос {request.url.path}: {e}")
+    return request.url.path, 0
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """
+    Транспорт httpx, через который проходят все запросы к OpenAI: чат,
+    эмбеддинги, Whisper, изображения и поиск в интернете.
+
+    Перед отправкой запрос ждёт свободного места в лимитах RPM/TPM своей
+    модели. Ответ 429 не возвращается сразу: запрос повторяется после
+    `retry_delay`, пока общее время ожидания укладывается в
+    `RATE_LIMIT_MAX_WAIT`; на это время приостанавливаются и остальные
+    запросы к той же модели. Повторы после 429 выполняет только этот
+    транспорт: итоговый ответ 429 помечается заголовком `x-should-retry:
+    false`, и клиент OpenAI не начинает новый цикл ожидания. Запросы к
+    другим хостам (загрузка файлов из Telegram) проходят без ограничений.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport) -> None:
+        """
+        Args:
+            transport (httpx.AsyncBaseTransport): Транспорт, выполняющий запросы.
+        """
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not request.url.host.endswith(OPENAI_HOST):
+            return await self._transport.handle_async_request(request)
+
+        name, tokens = describe_request(request)
+        limits = rate_limiter.limits_for(name)
+        deadline = time.monotonic() + RATE_LIMIT_MAX_WAIT
+        attempt = 0
+        while True:
+            await limits.acquire(tokens, deadline, charge=attempt == 0)
+            response = await self._transport.handle_async_request(request)
+            limits.update(response.headers)
+            if response.status_code != 429:
+                return response
+
+            delay = retry_delay(response.headers, attempt)
+            limits.pause(delay)
+            metrics.increment(f"rate_limiter.{name}.rate_limited")
+            if time.monotonic() + delay > deadline:
+                logger.error(f"Лимит запросов к {name} не восстановился за {RATE_LIMIT_MAX_WAIT} с")
+                response.headers["x-should-retry"] = "false"
+                return response
+
+            await response.aclose()
+            logger.warning(f"Ответ 429 от {name}, повтор {attempt + 1} через {delay:.2f} с")
+            metrics.increment("rate_limiter.retries")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+from dotenv import load_dotenv
+
+from src.services import metrics
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Один ответ на текстовый вопрос — это 10–15 обращений к модели (уточнение,
+# тематика, план, пункты плана с поиском, суммаризация), поэтому общий лимит
+# подбирается как RPM модели / обращений на ответ / ответов в минуту на слот.
+SCHEDULER_MAX_CONCURRENT: int = int(os.getenv("SCHEDULER_MAX_CONCURRENT", "8"))
+SCHEDULER_PER_USER: int = int(os.getenv("SCHEDULER_PER_USER", "1"))
+
+
+class RequestScheduler:
+    """
+    Ограничивает количество одновременно обрабатываемых запросов.
+
+    Одновременно выполняется не больше `max_concurrent` запросов в целом и
+    не больше `per_user` запросов одного пользователя. Остальные ждут в
+    очереди: запросы одного пользователя выполняются по порядку, а между
+    пользователями свободный слот выдаётся по кругу, поэтому пользователь,
+    отправивший много сообщений подряд, не задерживает остальных.
+
+    Планировщик работает в одном цикле событий и не требует блокировок.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = SCHEDULER_MAX_CONCURRENT,
+        per_user: int = SCHEDULER_PER_USER,
+    ) -> None:
+        """
+        Args:
+            max_concurrent (int): Максимум одновременно выполняемых запросов.
+            per_user (int): Максимум одновременно выполняемых запросов одного пользователя.
+        """
+        self.max_concurrent = max_concurrent
+        self.per_user = per_user
+        self._running = 0
+        self._running_by_user: Dict[int, int] = {}
+        # Порядок ключей словаря — очередь пользователей для выдачи слотов по кругу.
+        self._waiting: Dict[int, Deque[asyncio.Future]] = {}
+
+    @property
+    def queue_depth(self) -> int:
+        """Количество запросов, ожидающих слота."""
+        return sum(len(waiters) for waiters in self._waiting.values())
+
+    def _can_start(self, user_id: int) -> bool:
+        return (
+            self._running < self.max_concurrent
+            and self._running_by_user.get(user_id, 0) < self.per_user
+        )
+
+    def _start(self, user_id: int) -> None:
+        self._running += 1
+        self._running_by_user[user_id] = self._running_by_user.get(user_id, 0) + 1
+        metrics.gauge("scheduler.running", self._running)
+
+    def _release(self, user_id: int) -> None:
+        self._running -= 1
+        self._running_by_user[user_id] -= 1
+        if not self._running_by_user[user_id]:
+            del self._running_by_user[user_id]
+        metrics.gauge("scheduler.running", self._running)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._running < self.max_concurrent:
+            user_id = next(
+                (user_id for user_id in self._waiting if self._can_start(user_id)),
+                None,
+            )
+            if user_id is None:
+                break
+            waiters = self._waiting.pop(user_id)
+            waiter = waiters.popleft()
+            if waiters:
+                self._waiting[user_id] = waiters
+            if waiter.cancelled():
+                continue
+            self._start(user_id)
+            waiter.set_result(None)
+        metrics.gauge("scheduler.queue_depth", self.queue_depth)
+
+    def _forget(self, user_id: int, waiter: asyncio.Future) -> None:
+        waiters = self._waiting.get(user_id)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        if not waiters:
+            del self._waiting[user_id]
+        metrics.gauge("scheduler.queue_depth", self.queue_depth)
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        user_id: int,
+        on_queued: Optional[Callable[[int], Awaitable[None]]] = None,
+    ) -> AsyncIterator[bool]:
+        """
+        Занимает слот обработки на время блока `async with`.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+            on_queued (Optional[Callable[[int], Awaitable[None]]]): Вызывается
+                с позицией в очереди, если свободного слота нет.
+
+        Yields:
+            bool: True, если запрос ждал в очереди.
+        """
+        started = time.perf_counter()
+        queued = user_id in self._waiting or not self._can_start(user_id)
+        if queued:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiting.setdefault(user_id, deque()).append(waiter)
+            position = self.queue_depth
+            metrics.gauge("scheduler.queue_depth", position)
+            metrics.increment("scheduler.queued")
+            logger.info(f"Запрос пользователя {user_id} в очереди, позиция {position}")
+            try:
+                if on_queued is not None:
+                    try:
+                        await on_queued(position)
+                    except Exception as e:
+                        logger.error(f"Ошибка уведомления о позиции в очереди: {e}")
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release(user_id)
+                else:
+                    self._forget(user_id, waiter)
+                raise
+        else:
+            self._start(user_id)
+
+        metrics.observe("scheduler.wait_ms", (time.perf_counter() - started) * 1000)
+        try:
+            yield queued
+        finally:
+            self._release(user_id)
+
+
+request_scheduler = RequestScheduler()
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+from db.dbworker import refund_user_limit, reserve_user_limit
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+LEDGER_RESERVE_TOKENS: float = float(os.getenv("LEDGER_RESERVE_TOKENS", "200000"))
+LEDGER_COMMIT_ATTEMPTS: int = int(os.getenv("LEDGER_COMMIT_ATTEMPTS", "3"))
+LEDGER_COMMIT_RETRY_DELAY: float = float(os.getenv("LEDGER_COMMIT_RETRY_DELAY", "0.5"))
+
+
+class TokenLedger:
+    """
+    Учёт токенов, потраченных на обработку одного запроса пользователя.
+
+    Этапы обработки (уточнение контекста, проверка темы, генерация ответа и т.д.)
+    проверяют остаток через `exhausted` или `can_spend`. Фактический расход
+    каждого вызова модели записывается через `charge` из
+    `llm_client.record_usage` по полю `usage` ответа, без обращения к базе
+    данных.
+
+    В начале обработки `reserve` атомарно списывает из лимита оценку
+    расхода запроса, поэтому параллельные запросы пользователя не
+    расходуют одни и те же токены. `commit` одной атомарной записью
+    возвращает неиспользованную часть резерва или списывает расход сверх
+    него, не опуская лимит ниже нуля.
+    """
+
+    def __init__(self, user_id: int, balance: float) -> None:
+        """
+        Args:
+            user_id (int): Идентификатор пользователя.
+            balance (float): Остаток лимита на момент начала обработки запроса.
+        """
+        self.user_id = user_id
+        self.balance = balance
+        self.spent: float = 0
+        self.committed: float = 0
+        self.reserved: float = 0
+        self.stages: Dict[str, float] = {}
+
+    @property
+    def available(self) -> float:
+        """Остаток лимита с учётом уже записанных списаний запроса."""
+        return self.balance - self.spent
+
+    @property
+    def exhausted(self) -> bool:
+        """Лимит исчерпан: новые вызовы модели в рамках запроса не выполняются."""
+        return self.available <= 0
+
+    def can_spend(self, tokens: float) -> bool:
+        """
+        Проверяет, хватает ли остатка лимита на указанное количество токенов.
+
+        Args:
+            tokens (float): Требуемое количество токенов.
+
+        Returns:
+            bool: True, если остатка достаточно.
+        """
+        return self.available - tokens >= 0
+
+    def charge(self, tokens: float, stage: str) -> None:
+        """
+        Записывает расход токенов этапа обработки.
+
+        Args:
+            tokens (float): Потраченное количество токенов.
+            stage (str): Название этапа для логирования.
+        """
+        self.spent += tokens
+        self.stages[stage] = self.stages.get(stage, 0) + tokens
+        logger.info(
+            f"[{stage}] Пользователь {self.user_id}: списано {tokens} токенов, остаток {self.available}."
+        )
+
+    async def reserve(self, tokens: float = LEDGER_RESERVE_TOKENS) -> None:
+        """
+        Резервирует до `tokens` токенов лимита на время обработки запроса.
+
+        Резерв — оценка расхода запроса, а не предел: `exhausted` и
+        `can_spend` считаются по всему остатку пользователя (резерв плюс
+        остаток лимита после него). Расход сверх резерва списывается в
+        `commit`. При ошибке базы данных остаётся остаток, прочитанный до
+        начала обработки.
+
+        Args:
+            tokens (float): Желаемый размер резерва.
+        """
+        reserved = await reserve_user_limit(self.user_id, tokens)
+        if reserved is None:
+            logger.error(
+                f"Не удалось зарезервировать лимит пользователя {self.user_id}, используется прочитанный остаток."
+            )
+            return
+
+        amount, remaining = reserved
+        self.reserved += amount
+        self.balance = self.committed + self.reserved + remaining
+
+    async def _settle(self, excess: float) -> Optional[float]:
+        if excess > 0:
+            debited = await reserve_user_limit(self.user_id, excess)
+            if debited is None:
+                return None
+            if debited[0] < excess:
+                logger.warning(
+                    f"Расход пользователя {self.user_id} превысил остаток лимита на {excess - debited[0]} токенов."
+                )
+            return debited[1]
+        return await refund_user_limit(self.user_id, -excess)
+
+    async def commit(self) -> Optional[float]:
+        """
+        Фиксирует расход запроса одной атомарной записью.
+
+        Расход, ещё не зафиксированный, сравнивается с резервом:
+        неиспользованная часть резерва возвращается в лимит, расход сверх
+        резерва списывается (не больше остатка лимита). Неудачная запись
+        повторяется до `LEDGER_COMMIT_ATTEMPTS` раз. Повторный вызов учитывает
+        только расход, записанный после предыдущей фиксации.
+
+        Returns:
+            Optional[float]: Остаток лимита после фиксации или None, если фиксировать нечего или произошла ошибка.
+        """
+        pending = self.spent - self.committed
+        excess = pending - self.reserved
+        if not excess:
+            self.committed += pending
+            self.reserved = 0
+            return None
+
+        for attempt in range(LEDGER_COMMIT_ATTEMPTS):
+            new_balance = await self._settle(excess)
+            if new_balance is not None:
+                break
+            if attempt + 1 < LEDGER_COMMIT_ATTEMPTS:
+                await asyncio.sleep(LEDGER_COMMIT_RETRY_DELAY * 2 ** attempt)
+        else:
+            logger.error(
+                f"Не удалось зафиксировать расход {pending} токенов пользователя {self.user_id}: "
+                f"резерв {self.reserved}, {'не возвращено' if excess < 0 else 'не списано'} {abs(excess)} токенов."
+            )
+            return None
+
+        self.committed += pending
+        self.reserved = 0
+        self.balance = self.committed + new_balance
+        logger.info(
+            f"Пользователь {self.user_id}: зафиксирован расход {pending} токенов по этапам {self.stages}."
+        )
+        return new_balance